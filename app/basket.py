@@ -0,0 +1,115 @@
+import logging
+import os
+import warnings
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+# Transactions processed per step by the passes that stream over a basket
+# (the streaming engine, item-pair counts), bounding their working memory
+CHUNK_TRANSACTIONS = int(os.environ.get("CHUNK_TRANSACTIONS", "250000"))
+
+
+class Basket:
+    # One row per transaction, one column per item; True where the item was bought.
+    # Rows and columns are sorted the same way pivot_table/crosstab sorted them.
+    # Item and transaction ids are the column and row positions; the labels are
+    # only looked up (items[id]) when results are turned back into names.
+    # first_seen lists item ids in the order the items first appear in the data.
+    def __init__(self, matrix: sparse.csr_matrix, transactions: np.ndarray, items: np.ndarray, first_seen: Optional[np.ndarray] = None):
+        self.matrix = matrix
+        self.transactions = transactions
+        self.items = items
+        self.first_seen = first_seen if first_seen is not None else np.arange(len(items), dtype=np.int32)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def n_transactions(self) -> int:
+        return self.matrix.shape[0]
+
+    def footprint(self) -> Dict[str, Any]:
+        rows, cols = self.matrix.shape
+        sparse_bytes = int(self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes)
+        # What the old (basket > 0).astype(int) matrix would have cost
+        dense_bytes = int(rows) * int(cols) * np.dtype(np.int64).itemsize
+        return {
+            "shape": [int(rows), int(cols)],
+            "nnz": int(self.matrix.nnz),
+            "density": float(self.matrix.nnz / (rows * cols)) if rows and cols else 0.0,
+            "sparse_bytes": sparse_bytes,
+            "dense_int64_bytes": dense_bytes,
+            "reduction": float(dense_bytes / sparse_bytes) if sparse_bytes else 0.0,
+        }
+
+    def row_chunks(self, rows: int = CHUNK_TRANSACTIONS) -> Iterator[sparse.csr_matrix]:
+        # Consecutive slices of transactions; a memory-mapped matrix (txstore) only
+        # reads the slice being worked on
+        for start in range(0, self.n_transactions, max(1, rows)):
+            yield self.matrix[start:start + rows]
+
+    def decode(self, ids: Iterable[int]) -> List[Any]:
+        return [self.items[i] for i in ids]
+
+    def to_frame(self) -> pd.DataFrame:
+        # SparseDtype(bool) frame, which mlxtend's apriori consumes without densifying.
+        # The engines only use column positions, so the frame is labelled by id.
+        # pandas 2.2 labels the fill value 0 rather than False and warns about it.
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message=".*fill_value in SparseDtype.*", category=FutureWarning)
+            return pd.DataFrame.sparse.from_spmatrix(self.matrix)
+
+
+def item_value(value: Any) -> Any:
+    # Item names read from shared (memory-mapped) arrays are numpy scalars
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def text_keys(values: Sequence[Any]) -> np.ndarray:
+    # Names as a fixed-width text array, searchable with np.searchsorted
+    return np.array([str(value) for value in values], dtype=str) if len(values) else np.empty(0, dtype="<U1")
+
+
+def factorize(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    # Integer ids (int32, in sorted label order) and the labels, as
+    # pd.factorize(values, sort=True). A categorical column is encoded from its
+    # codes: only its (small) dictionary of labels is sorted, not the rows.
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        categories = values.cat.categories
+        # Categories with no rows left (e.g. after dropna) get no id
+        used = np.flatnonzero(np.bincount(codes[codes >= 0], minlength=len(categories)))
+        positions, labels = pd.factorize(categories[used], sort=True)
+        remap = np.full(len(categories), -1, dtype=np.int32)
+        remap[used] = positions
+        return np.where(codes >= 0, remap[codes], -1).astype(np.int32), np.asarray(labels, dtype=object)
+    codes, labels = pd.factorize(values, sort=True)
+    return codes.astype(np.int32), np.asarray(labels, dtype=object)
+
+
+def encode_basket(df: pd.DataFrame, transaction_column: str, item_column: str) -> Basket:
+    tx_codes, transactions = factorize(df[transaction_column])
+    item_codes, items = factorize(df[item_column])
+    n_tx, n_items = len(transactions), len(items)
+
+    # A bill that lists the same item twice is still a single (bill, item) cell
+    cells = np.unique(tx_codes.astype(np.int64) * n_items + item_codes)
+    rows = cells // n_items
+    cols = (cells % n_items).astype(np.int32)
+    indptr = np.zeros(n_tx + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_tx), out=indptr[1:])
+    matrix = sparse.csr_matrix((np.ones(len(cols), dtype=bool), cols, indptr), shape=(n_tx, n_items))
+
+    basket = Basket(matrix, transactions, items, first_seen=pd.unique(item_codes))
+    stats = basket.footprint()
+    logger.info(
+        f"Basket memory: {stats['sparse_bytes']:,} bytes sparse vs {stats['dense_int64_bytes']:,} bytes dense "
+        f"({stats['reduction']:.1f}x smaller, density {stats['density']:.4%})"
+    )
+    return basket
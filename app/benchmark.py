@@ -0,0 +1,195 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import mlxtend
+import numpy as np
+import pandas as pd
+
+import ingest
+from basket import encode_basket
+from engines import ENGINES, frequent_itemsets
+from mining import backfill_rules, decode_rules, generate_rules, generation_limit, load_transactions
+from similarity import SimilarityIndex
+from synthetic import BASKET_DISTRIBUTIONS, generate_rows, write_dataset
+
+logger = logging.getLogger(__name__)
+
+# Offline benchmark of each /mine-rules stage on synthetic sales data.
+#
+#   cd app
+#   python benchmark.py --rows 5000,50000,500000 --output bench.json
+#   python benchmark.py --rows 5000,50000,500000 --baseline bench.json
+#
+# The second form exits with status 1 when a stage got slower than the
+# baseline by more than --tolerance.
+STAGES = (
+    "read",               # workbook -> columnar cache (cold) -> transaction rows
+    "read_cached",        # the same from the warm cache
+    "encode",             # sparse basket
+    "frequent_itemsets",
+    "association_rules",  # single-antecedent rule table grouped by product
+    "backfill",           # co-occurrence top-up to 5 consequents per product
+    "similarity",         # top-N cosine/Jaccard neighbours per item
+    "decode",             # rule table -> rule dicts with item names, by lift
+)
+# Stages faster than this are too noisy to flag as regressions
+MIN_COMPARABLE_SECONDS = 0.05
+
+
+def _timed(seconds: Dict[str, float], stage: str, repeat: int, fn: Callable, *args, setup: Optional[Callable] = None, **kwargs) -> Any:
+    # Best of `repeat` runs; returns the result of the last one. setup() runs
+    # untimed before each run and its result is passed as the first argument.
+    best = None
+    for _ in range(max(1, repeat)):
+        prepared = (setup(),) if setup else ()
+        start = time.perf_counter()
+        result = fn(*prepared, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    seconds[stage] = round(best, 6)
+    return result
+
+
+def run_case(rows: int, args: argparse.Namespace, workdir: Path) -> Dict[str, Any]:
+    df = generate_rows(
+        rows, n_items=args.items, mean_basket_size=args.mean_basket_size,
+        basket_distribution=args.basket_distribution, zipf_exponent=args.zipf_exponent, seed=args.seed,
+    )
+    path = workdir / f"sales-{rows}.{args.format}"
+    start = time.perf_counter()
+    write_dataset(df, str(path))
+    write_seconds = time.perf_counter() - start
+
+    seconds: Dict[str, float] = {}
+    # Cold read goes through the ingest cache once; it cannot be repeated meaningfully
+    data = _timed(seconds, "read", 1, load_transactions, str(path), "Sheet1", "BILLNO", "ITEMNAME")
+    data = _timed(seconds, "read_cached", args.repeat, load_transactions, str(path), "Sheet1", "BILLNO", "ITEMNAME")
+    basket = _timed(seconds, "encode", args.repeat, encode_basket, data, "BILLNO", "ITEMNAME")
+    itemsets = _timed(
+        seconds, "frequent_itemsets", args.repeat, frequent_itemsets,
+        basket, args.min_support, algorithm=args.algorithm, max_len=args.max_len or None, workers=args.workers,
+    )
+    rules = _timed(
+        seconds, "association_rules", args.repeat, generate_rules,
+        basket, itemsets, args.min_confidence, top_k=generation_limit(args.top_k),
+    )
+    products = basket.first_seen
+    table = _timed(seconds, "backfill", args.repeat, backfill_rules, basket, rules, products, top_k=args.top_k)
+    _timed(seconds, "similarity", args.repeat, SimilarityIndex, basket)
+    # Rules are decoded as a response reads them; a JSON response reads them all
+    final_rules = _timed(seconds, "decode", args.repeat, lambda: decode_rules(table, basket, args.max_rules).to_list())
+
+    return {
+        "rows": int(len(df)),
+        "transactions": int(basket.n_transactions),
+        "items": int(basket.shape[1]),
+        "itemsets": int(len(itemsets)),
+        "association_rules": int(len(rules)),
+        "grouped_products": len(np.unique(rules.antecedent)),
+        "final_rules": len(final_rules),
+        "file_bytes": path.stat().st_size,
+        "write_seconds": round(write_seconds, 6),
+        "seconds": seconds,
+        "total_seconds": round(sum(seconds.values()), 6),
+    }
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "mlxtend": mlxtend.__version__,
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    # Stage timings more than `tolerance` slower than the baseline run of the same size
+    previous = {case["rows"]: case for case in baseline.get("results", [])}
+    regressions = []
+    for case in results:
+        before = previous.get(case["rows"])
+        if before is None:
+            continue
+        for stage, seconds in case["seconds"].items():
+            old = before["seconds"].get(stage)
+            if old is None or old < MIN_COMPARABLE_SECONDS:
+                continue
+            if seconds > old * (1.0 + tolerance):
+                regressions.append(f"{case['rows']} rows / {stage}: {old:.3f}s -> {seconds:.3f}s ({seconds / old:.2f}x)")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark each association rule mining stage on synthetic data")
+    parser.add_argument("--rows", default="5000,50000,500000", help="Comma-separated dataset sizes in bill lines")
+    parser.add_argument("--format", choices=("xlsx", "csv"), default="xlsx", help="File type read by the read stage")
+    parser.add_argument("--items", type=int, default=2000, help="Catalog size")
+    parser.add_argument("--mean-basket-size", type=float, default=4.0)
+    parser.add_argument("--basket-distribution", choices=BASKET_DISTRIBUTIONS, default="poisson")
+    parser.add_argument("--zipf-exponent", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-support", type=float, default=0.005)
+    parser.add_argument("--min-confidence", type=float, default=0.1)
+    parser.add_argument("--algorithm", choices=tuple(ENGINES), default="apriori")
+    parser.add_argument("--max-len", type=int, default=0, help="Maximum itemset size (0 = unbounded)")
+    parser.add_argument("--top-k", type=int, default=0, help="Rules kept per product (0 = all)")
+    parser.add_argument("--max-rules", type=int, default=0, help="Rules decoded, highest lift first (0 = all)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes for partitioned itemset mining (1 = serial); compare against 1 on a multi-core machine")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the fastest is reported")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs the baseline (0.25 = 25%%)")
+    parser.add_argument("--workdir", help="Keep generated files here (default: a temporary directory)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    sizes = [int(size) for size in args.rows.split(",") if size.strip()]
+    with tempfile.TemporaryDirectory(prefix="mining-bench-") as tmp:
+        workdir = Path(args.workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        # A private, emptied ingest cache so the cold read really is cold
+        ingest.CACHE_DIR = workdir / "ingest-cache"
+        shutil.rmtree(ingest.CACHE_DIR, ignore_errors=True)
+        results = []
+        for rows in sizes:
+            case = run_case(rows, args, workdir)
+            results.append(case)
+            stages = "  ".join(f"{stage}={case['seconds'][stage]:.3f}s" for stage in STAGES)
+            print(f"{case['rows']:>9} rows  {case['transactions']:>8} bills  {stages}", file=sys.stderr)
+
+    report = {
+        "environment": environment(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "workdir")},
+        "stages": list(STAGES),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            regressions = compare(results, json.load(fh), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
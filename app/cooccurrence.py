@@ -0,0 +1,106 @@
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from scipy import sparse
+
+from basket import Basket
+from rule_table import RuleTable
+
+logger = logging.getLogger(__name__)
+
+
+def count_pairs(basket: Basket) -> sparse.csr_matrix:
+    # X^T X summed over chunks of transactions, so only one chunk is converted
+    # to integers at a time
+    counts = None
+    for chunk in basket.row_chunks():
+        X = chunk.astype(np.int32)
+        part = (X.T @ X).tocsr()
+        counts = part if counts is None else counts + part
+    if counts is None:
+        counts = sparse.csr_matrix((basket.shape[1], basket.shape[1]), dtype=np.int32)
+    return counts
+
+
+class CoOccurrence:
+    # Pairwise statistics for every item pair, computed in one sparse product (X^T X).
+    # Row i of the pair arrays holds the pairs where item i is the antecedent.
+    # A caller that maintains X^T X itself (diagonal included) can pass it as counts.
+    # Items are basket column ids throughout.
+    def __init__(self, basket: Basket, counts: Optional[sparse.spmatrix] = None):
+        self.n_items = basket.shape[1]
+        self.n_transactions = basket.n_transactions
+
+        if counts is None:
+            counts = count_pairs(basket)
+        counts = counts.tocsr(copy=True)
+        self.item_counts = counts.diagonal()
+
+        counts.setdiag(0)
+        counts.eliminate_zeros()
+        counts.sort_indices()
+        self.counts = counts
+        logger.info(f"Co-occurrence matrix: {counts.shape[0]} items, {counts.nnz} co-occurring pairs")
+
+        antecedents = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        consequents = counts.indices
+        pair_counts = counts.data.astype(np.float64)
+        total = float(self.n_transactions)
+        antecedent_counts = self.item_counts[antecedents].astype(np.float64)
+        consequent_counts = self.item_counts[consequents].astype(np.float64)
+
+        # Same arithmetic as the per-product loop this replaces, for all pairs at once
+        self.support = pair_counts / total
+        self.confidence = pair_counts / antecedent_counts
+        expected = (antecedent_counts / total) * (consequent_counts / total)
+        self.lift = np.divide(self.support, expected, out=np.ones_like(self.support), where=expected > 0)
+
+        # Per-row ranking by lift (ties broken by co-occurrence count), computed once
+        order = np.lexsort((-pair_counts, -self.lift, antecedents))
+        self._ranked = order
+
+    def top_consequents(self, item: int, n: int, exclude: Iterable[int] = ()) -> List[int]:
+        # Positions in the pair arrays of the n best consequents of item
+        if n <= 0:
+            return []
+        start, end = self.counts.indptr[item], self.counts.indptr[item + 1]
+        excluded = set(exclude)
+        picked = []
+        for position in self._ranked[start:end]:
+            if int(self.counts.indices[position]) in excluded:
+                continue
+            picked.append(int(position))
+            if len(picked) == n:
+                break
+        return picked
+
+    def rules(self, positions: List[int]) -> RuleTable:
+        positions = np.asarray(positions, dtype=np.int64)
+        antecedents = np.searchsorted(self.counts.indptr, positions, side="right") - 1
+        consequents = [[item] for item in self.counts.indices[positions].tolist()]
+        return RuleTable(antecedents, consequents, self.support[positions], self.confidence[positions], self.lift[positions])
+
+
+def backfill_consequents(
+    table: RuleTable,
+    products: Iterable[int],
+    cooccurrence: CoOccurrence,
+    min_consequents: int = 5,
+) -> RuleTable:
+    # Top up every product (item id) whose rules have fewer than min_consequents
+    # recommended items with its highest-lift co-occurring items. Returns the
+    # added rules, in product order.
+    n_items = cooccurrence.n_items
+    needed = np.maximum(0, min_consequents - table.consequent_counts(n_items)[:n_items])
+    existing: Dict[int, set] = {}
+    for position in np.flatnonzero(needed[table.antecedent] > 0).tolist():
+        existing.setdefault(int(table.antecedent[position]), set()).update(table.consequents[position])
+
+    picked: List[int] = []
+    for product in products:
+        product = int(product)
+        if not 0 <= product < n_items or needed[product] == 0:
+            continue
+        picked.extend(cooccurrence.top_consequents(product, int(needed[product]), exclude=existing.get(product, ())))
+    return cooccurrence.rules(picked)
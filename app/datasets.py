@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Uploaded workbooks live here, one file per dataset name, next to a small registry file
+DATASET_DIR = Path(os.environ.get("DATASET_DIR", Path(__file__).resolve().parent / "datasets"))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(2 << 30)))
+# Body bytes gathered before one write (and hash update) on a worker thread
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Share prepared datasets between server processes: every sheet is mined from
+# its transaction store, and mined indexes and jobs are published to disk (see
+# shared.py). On by default when uvicorn runs several workers.
+SHARED_DATASETS = os.environ.get("SHARED_DATASETS", "1" if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1 else "0") == "1"
+
+# The workbook shipped with the app is always available under this name
+DEFAULT_DATASET = "default"
+UPLOAD_SUFFIXES = (".xlsx", ".xlsm", ".csv")
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+class DatasetRegistry:
+    # Named datasets, persisted as JSON so every server process sees the same set
+    def __init__(self, directory: Path = DATASET_DIR):
+        self.directory = directory
+        self.path = directory / "datasets.json"
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, datasets: Dict[str, Dict[str, Any]]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(datasets, fh, indent=2)
+        os.replace(tmp, self.path)
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self._load().get(name)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return sorted(self._load().values(), key=lambda entry: entry["name"])
+
+    def register(self, name: str, path: Path, filename: str, size: int, sha256: str) -> Dict[str, Any]:
+        with self._lock:
+            datasets = self._load()
+            previous = datasets.get(name)
+            entry = {
+                "name": name,
+                "path": str(path),
+                "filename": filename,
+                "size": size,
+                "sha256": sha256,
+                "uploaded_at": time.time(),
+            }
+            datasets[name] = entry
+            self._save(datasets)
+        # A re-upload with a different file type leaves the old file behind
+        if previous and previous["path"] != str(path):
+            Path(previous["path"]).unlink(missing_ok=True)
+        return entry
+
+
+def validate_name(name: str) -> None:
+    if name == DEFAULT_DATASET or not NAME_PATTERN.match(name):
+        raise UploadError(
+            f"Invalid dataset name '{name}': use up to 64 letters, digits, '.', '_' or '-', and not '{DEFAULT_DATASET}'"
+        )
+
+
+def _write_block(fh: BinaryIO, digest: Any, block: bytes) -> None:
+    digest.update(block)
+    fh.write(block)
+
+
+def _store(name: str, suffix: str, tmp_name: str, filename: str, size: int, sha256: str) -> Dict[str, Any]:
+    destination = DATASET_DIR / f"{name}{suffix}"
+    os.replace(tmp_name, destination)
+    return DATASETS.register(name, destination, filename, size, sha256)
+
+
+def check_upload(name: str, filename: str, content_length: Optional[int] = None) -> str:
+    # Everything that can be rejected before the body is read; returns the suffix
+    validate_name(name)
+    suffix = Path(filename or "").suffix.lower()
+    if suffix not in UPLOAD_SUFFIXES:
+        raise UploadError(f"Unsupported file type '{suffix}'. Upload one of: {', '.join(UPLOAD_SUFFIXES)}")
+    if content_length is not None and content_length > MAX_UPLOAD_BYTES:
+        raise UploadTooLarge(f"Upload of {content_length} bytes exceeds the {MAX_UPLOAD_BYTES} byte limit")
+    return suffix
+
+
+async def save_upload(name: str, filename: str, body: AsyncIterator[bytes], content_length: Optional[int] = None) -> Dict[str, Any]:
+    # Writes a request body (request.stream()) to disk as it arrives, hashing it
+    # on the way, so it is neither spooled first nor held in memory; the event
+    # loop only gathers UPLOAD_CHUNK_SIZE bytes and file writes run on worker
+    # threads. An upload announcing more than MAX_UPLOAD_BYTES is refused before
+    # its body is read, one that sends more is cut off. The file is swapped into
+    # place once complete.
+    suffix = check_upload(name, filename, content_length)
+    DATASET_DIR.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(prefix=".upload-", suffix=suffix, dir=DATASET_DIR)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            pending: List[bytes] = []
+            pending_bytes = 0
+            async for chunk in body:
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge(f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit")
+                pending.append(chunk)
+                pending_bytes += len(chunk)
+                if pending_bytes >= UPLOAD_CHUNK_SIZE:
+                    await run_in_threadpool(_write_block, fh, digest, b"".join(pending))
+                    pending, pending_bytes = [], 0
+            if pending:
+                await run_in_threadpool(_write_block, fh, digest, b"".join(pending))
+        if size == 0:
+            raise UploadError("Uploaded file is empty")
+        entry = await run_in_threadpool(_store, name, suffix, tmp_name, filename, size, digest.hexdigest())
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    logger.info(f"Stored upload '{filename}' as dataset '{name}' ({size} bytes)")
+    return entry
+
+
+DATASETS = DatasetRegistry()
@@ -0,0 +1,294 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from basket import Basket
+
+logger = logging.getLogger(__name__)
+
+# Every engine has the same signature:
+#     engine(basket, min_count, max_len) -> [(item_indices, count), ...]
+# where item_indices is a sorted tuple of basket column indices and max_len
+# is None for unbounded itemsets. frequent_itemsets() turns that into the
+# mlxtend-style DataFrame, so all engines produce identical output.
+Engine = Callable[[Basket, int, Optional[int]], List[Tuple[Tuple[int, ...], int]]]
+
+# Processes used by partitioned mining when a request does not choose (1 = serial).
+# Serial stays the default: the partitioned path is tested to give the same
+# itemsets, but any speedup from it is unmeasured. It has only been benchmarked
+# on a single-CPU machine, where workers=2 was slower than serial (0.21s against
+# 0.14s for 102k bills: the pool and second-pass overhead with nothing run in parallel).
+PARALLEL_WORKERS = int(os.environ.get("PARALLEL_MINING_WORKERS", "1"))
+MAX_PARALLEL_WORKERS = int(os.environ.get("MAX_PARALLEL_MINING_WORKERS", str(os.cpu_count() or 1)))
+# Smaller partitions cost more in process start-up than they save
+MIN_PARTITION_TRANSACTIONS = int(os.environ.get("MIN_PARTITION_TRANSACTIONS", "2000"))
+
+
+def min_support_count(min_support: float, n_transactions: int) -> int:
+    # Smallest transaction count whose support passes the same float
+    # comparison apriori makes (count / n >= min_support)
+    if not 0.0 < min_support <= 1.0:
+        raise ValueError(f"min_support must be in (0, 1], got {min_support}")
+    count = max(1, int(np.ceil(min_support * n_transactions)))
+    while count > 1 and (count - 1) / n_transactions >= min_support:
+        count -= 1
+    while count <= n_transactions and count / n_transactions < min_support:
+        count += 1
+    return count
+
+
+def _mlxtend_support(min_count: int, n_transactions: int) -> float:
+    # Half a transaction below min_count, so both apriori's float comparison
+    # and fpgrowth's ceil(min_support * n) land exactly on min_count
+    return (min_count - 0.5) / n_transactions
+
+
+def _from_mlxtend(result: pd.DataFrame, n_transactions: int, min_count: int):
+    found = []
+    for support, itemset in zip(result["support"].to_numpy(), result["itemsets"]):
+        count = int(round(support * n_transactions))
+        if count >= min_count:
+            found.append((tuple(sorted(int(i) for i in itemset)), count))
+    return found
+
+
+def mine_apriori(basket: Basket, min_count: int, max_len: Optional[int]):
+    # mlxtend (and the scikit-learn it pulls in) is only imported by the engines that use it
+    from mlxtend.frequent_patterns import apriori
+
+    result = apriori(
+        basket.to_frame(), min_support=_mlxtend_support(min_count, basket.n_transactions),
+        use_colnames=False, max_len=max_len
+    )
+    return _from_mlxtend(result, basket.n_transactions, min_count)
+
+
+def mine_fpgrowth(basket: Basket, min_count: int, max_len: Optional[int]):
+    from mlxtend.frequent_patterns import fpgrowth
+
+    result = fpgrowth(
+        basket.to_frame(), min_support=_mlxtend_support(min_count, basket.n_transactions),
+        use_colnames=False, max_len=max_len
+    )
+    return _from_mlxtend(result, basket.n_transactions, min_count)
+
+
+# Set bits of every byte value, for numpy < 2.0 (no np.bitwise_count)
+_BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def _popcount(bits: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).sum(axis=-1, dtype=np.int64)
+    return _BYTE_BITS[bits].sum(axis=-1, dtype=np.int64)
+
+
+def _column_bitsets(columns, n_rows: int) -> np.ndarray:
+    # One packed bitset of row ids per column of a CSC matrix
+    n_bytes = (n_rows + 7) // 8
+    bitsets = np.zeros((columns.shape[1], n_bytes), dtype=np.uint8)
+    # Bits within one byte are distinct, so adding them is the same as OR-ing them
+    owners = np.repeat(np.arange(columns.shape[1], dtype=np.int64), np.diff(columns.indptr))
+    rows = columns.indices.astype(np.int64)
+    np.add.at(bitsets.ravel(), owners * n_bytes + (rows >> 3), (128 >> (rows & 7)).astype(np.uint8))
+    return bitsets
+
+
+def count_itemsets(matrix, itemsets: List[Tuple[int, ...]], batch_size: int = 256) -> np.ndarray:
+    # Number of rows of a transaction x item matrix containing each itemset,
+    # using bitsets of only the columns the itemsets mention
+    counts = np.zeros(len(itemsets), dtype=np.int64)
+    if not itemsets or matrix.shape[0] == 0:
+        return counts
+    needed = np.unique(np.fromiter((i for itemset in itemsets for i in itemset), dtype=np.int64))
+    bitsets = _column_bitsets(matrix.tocsc()[:, needed], matrix.shape[0])
+    position = np.zeros(matrix.shape[1], dtype=np.int64)
+    position[needed] = np.arange(len(needed))
+
+    by_length: Dict[int, List[int]] = {}
+    for i, itemset in enumerate(itemsets):
+        by_length.setdefault(len(itemset), []).append(i)
+    for length, members in by_length.items():
+        columns = position[np.array([itemsets[i] for i in members], dtype=np.int64).reshape(len(members), length)]
+        for start in range(0, len(members), batch_size):
+            block = columns[start:start + batch_size]
+            joined = bitsets[block[:, 0]].copy()
+            for j in range(1, length):
+                joined &= bitsets[block[:, j]]
+            counts[members[start:start + batch_size]] = _popcount(joined)
+    return counts
+
+
+def mine_eclat(basket: Basket, min_count: int, max_len: Optional[int]):
+    # Vertical layout: one packed bitset of transaction ids per frequent item.
+    # Each prefix class is extended by AND-ing its bitsets in one batch.
+    n_tx = basket.n_transactions
+    counts = np.diff(basket.matrix.tocsc().indptr)
+    frequent = np.flatnonzero(counts >= min_count)
+    found = [((int(i),), int(counts[i])) for i in frequent]
+    if len(frequent) < 2 or max_len == 1:
+        return found
+
+    bitsets = _column_bitsets(basket.matrix.tocsc()[:, frequent], n_tx)
+
+    def extend(prefix: Tuple[int, ...], items: np.ndarray, bits: np.ndarray) -> None:
+        for position in range(len(items) - 1):
+            itemset = prefix + (int(items[position]),)
+            joined = bits[position + 1:] & bits[position]
+            joined_counts = _popcount(joined)
+            keep = joined_counts >= min_count
+            if not keep.any():
+                continue
+            next_items = items[position + 1:][keep]
+            for item, count in zip(next_items, joined_counts[keep]):
+                found.append((itemset + (int(item),), int(count)))
+            if max_len is None or len(itemset) + 1 < max_len:
+                extend(itemset, next_items, joined[keep])
+
+    extend((), frequent, bitsets)
+    return found
+
+
+def join_candidates(level: List[Tuple[int, ...]]) -> List[Tuple[int, ...]]:
+    # Apriori candidate generation: itemsets of size k + 1 from two frequent
+    # k-itemsets sharing their first k - 1 items, kept only when every other
+    # k-subset is frequent too
+    frequent = set(level)
+    by_prefix: Dict[Tuple[int, ...], List[int]] = {}
+    for itemset in level:
+        by_prefix.setdefault(itemset[:-1], []).append(itemset[-1])
+    candidates = []
+    for prefix, lasts in by_prefix.items():
+        lasts.sort()
+        for position, first in enumerate(lasts):
+            for second in lasts[position + 1:]:
+                candidate = prefix + (first, second)
+                if all(candidate[:j] + candidate[j + 1:] in frequent for j in range(len(prefix))):
+                    candidates.append(candidate)
+    return candidates
+
+
+def mine_streaming(basket: Basket, min_count: int, max_len: Optional[int]):
+    # Level-wise counting in passes over chunks of transactions (Basket.row_chunks),
+    # for baskets too large to hold as bitsets or a dense frame, e.g. the
+    # memory-mapped transaction store. Working memory is one chunk plus the counts:
+    # items by bincount, pairs of frequent items by a sparse X^T X per chunk,
+    # larger candidates with count_itemsets per chunk.
+    n_items = basket.shape[1]
+    counts = np.zeros(n_items, dtype=np.int64)
+    for chunk in basket.row_chunks():
+        counts += np.bincount(chunk.indices, minlength=n_items)
+    frequent = np.flatnonzero(counts >= min_count)
+    found = [((int(i),), int(counts[i])) for i in frequent]
+    if len(frequent) < 2 or max_len == 1:
+        return found
+
+    pairs = None
+    for chunk in basket.row_chunks():
+        X = chunk[:, frequent].astype(np.int32)
+        part = sparse.triu(X.T @ X, k=1, format="csr")
+        pairs = part if pairs is None else pairs + part
+    pairs = pairs.tocoo()
+    keep = pairs.data >= min_count
+    frequent_pairs = sorted(zip(frequent[pairs.row[keep]].tolist(), frequent[pairs.col[keep]].tolist(), pairs.data[keep].tolist()))
+    found.extend(((a, b), int(count)) for a, b, count in frequent_pairs)
+    level = [(a, b) for a, b, _ in frequent_pairs]
+
+    size = 2
+    while level and (max_len is None or size < max_len):
+        candidates = join_candidates(level)
+        if not candidates:
+            break
+        totals = np.zeros(len(candidates), dtype=np.int64)
+        for chunk in basket.row_chunks():
+            totals += count_itemsets(chunk, candidates)
+        level = [candidate for candidate, total in zip(candidates, totals) if total >= min_count]
+        found.extend((candidate, int(total)) for candidate, total in zip(candidates, totals) if total >= min_count)
+        size += 1
+    return found
+
+
+ENGINES: Dict[str, Engine] = {
+    "apriori": mine_apriori,
+    "fpgrowth": mine_fpgrowth,
+    "eclat": mine_eclat,
+    "streaming": mine_streaming,
+}
+
+
+def _mine_partition(matrix, algorithm: str, min_count: int, max_len: Optional[int]) -> List[Tuple[int, ...]]:
+    n_tx, n_items = matrix.shape
+    basket = Basket(matrix, np.arange(n_tx), np.arange(n_items))
+    return [itemset for itemset, _ in ENGINES[algorithm](basket, min_count, max_len)]
+
+
+def _count_partition(matrix, candidates: List[Tuple[int, ...]]) -> np.ndarray:
+    return count_itemsets(matrix, candidates)
+
+
+def partition_bounds(n_transactions: int, workers: int) -> List[Tuple[int, int]]:
+    # Contiguous, near-equal row ranges, at most `workers` of them
+    parts = max(1, min(workers, n_transactions // max(1, MIN_PARTITION_TRANSACTIONS)))
+    edges = np.linspace(0, n_transactions, parts + 1).astype(np.int64)
+    return [(int(start), int(end)) for start, end in zip(edges[:-1], edges[1:])]
+
+
+def mine_partitioned(basket: Basket, min_count: int, max_len: Optional[int], algorithm: str, workers: int):
+    # SON two-pass mining over row partitions of the basket, one process each:
+    #   1. every partition is mined with the engine at a proportionally lower
+    #      threshold, floor(min_count * rows / total); an itemset below that in
+    #      every partition is below min_count overall, so the union of the local
+    #      results contains every globally frequent itemset;
+    #   2. every partition counts all candidates exactly and the counts are summed.
+    # The result is the same as the serial engine's.
+    n_tx = basket.n_transactions
+    bounds = partition_bounds(n_tx, workers)
+    if len(bounds) < 2:
+        return ENGINES[algorithm](basket, min_count, max_len)
+    matrix = basket.matrix.tocsr()
+    slices = [matrix[start:end] for start, end in bounds]
+    local_counts = [max(1, (min_count * (end - start)) // n_tx) for start, end in bounds]
+
+    with ProcessPoolExecutor(max_workers=len(slices)) as pool:
+        local = pool.map(_mine_partition, slices, [algorithm] * len(slices), local_counts, [max_len] * len(slices))
+        candidates = sorted(set().union(*local), key=lambda itemset: (len(itemset), itemset))
+        logger.info(f"Partitioned mining: {len(candidates)} candidate itemsets from {len(slices)} partitions")
+        counts = sum(pool.map(_count_partition, slices, [candidates] * len(slices)))
+    return [(itemset, int(count)) for itemset, count in zip(candidates, counts) if count >= min_count]
+
+
+def frequent_itemsets(
+    basket: Basket, min_support: float, algorithm: str = "apriori", max_len: Optional[int] = None, workers: int = 1
+) -> pd.DataFrame:
+    # workers > 1 mines row partitions of the basket in parallel (mine_partitioned)
+    if algorithm not in ENGINES:
+        raise ValueError(f"Unknown algorithm '{algorithm}'. Choose one of: {', '.join(ENGINES)}")
+    if max_len is not None and max_len < 1:
+        raise ValueError(f"max_len must be at least 1, got {max_len}")
+
+    n_tx = basket.n_transactions
+    if n_tx == 0:
+        return pd.DataFrame({"support": pd.Series(dtype=float), "itemsets": pd.Series(dtype=object)})
+    min_count = min_support_count(min_support, n_tx)
+    workers = min(workers, MAX_PARALLEL_WORKERS)
+    if workers > 1:
+        found = mine_partitioned(basket, min_count, max_len, algorithm, workers)
+    else:
+        found = ENGINES[algorithm](basket, min_count, max_len)
+
+    return itemsets_frame(found, n_tx)
+
+
+def itemsets_frame(found: List[Tuple[Tuple[int, ...], int]], n_transactions: int) -> pd.DataFrame:
+    # Canonical order (by size, then by column position) so every engine returns the same frame.
+    # Itemsets hold item ids (basket column positions); basket.decode gives the names.
+    found = sorted(found, key=lambda entry: (len(entry[0]), entry[0]))
+    return pd.DataFrame({
+        "support": np.array([count / n_transactions for _, count in found], dtype=float),
+        "itemsets": [frozenset(itemset) for itemset, _ in found],
+    })
@@ -0,0 +1,286 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import ingest
+from basket import Basket
+from engines import count_itemsets, min_support_count, mine_eclat
+from result_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+INCREMENTAL_STATES = int(os.environ.get("INCREMENTAL_STATES", "4"))
+
+Itemset = Tuple[int, ...]
+
+
+def _candidates(previous: List[Itemset]) -> List[Itemset]:
+    # Apriori join: extend (k-1)-itemsets sharing their first k-2 items, keeping
+    # only candidates whose every (k-1)-subset is frequent
+    frequent = set(previous)
+    found = []
+    for i, left in enumerate(previous):
+        for right in previous[i + 1:]:
+            if left[:-1] != right[:-1]:
+                break
+            candidate = left + (right[-1],)
+            if all(candidate[:j] + candidate[j + 1:] in frequent for j in range(len(candidate) - 2)):
+                found.append(candidate)
+    return found
+
+
+class IncrementalMiner:
+    # Mining state for one dataset at a fixed min_support/max_len that can absorb
+    # new transaction rows without mining the history again (FUP-style):
+    #   - item and pair counts are kept for all items (X^T X) and updated additively;
+    #   - counts of previously frequent itemsets are adjusted by what the delta adds;
+    #   - an itemset that was not frequent can only become frequent if the delta
+    #     adds at least (new min count - old min count + 1) occurrences, so only
+    #     those candidates are counted against the stored transactions.
+    # Bills in a delta that already exist are merged (their new items added).
+    def __init__(
+        self,
+        basket: Basket,
+        products: List[Any],
+        transaction_column: str,
+        item_column: str,
+        min_support: float,
+        max_len: Optional[int] = None,
+        pair_counts: Optional[sparse.spmatrix] = None,
+    ):
+        # pair_counts is the basket's X^T X when it is known already (diagonal included)
+        self.transaction_column = transaction_column
+        self.item_column = item_column
+        self.min_support = min_support
+        self.max_len = max_len
+        self.lock = threading.Lock()
+        self.batches = 0
+        # Batches of the dataset's DeltaLog this state includes
+        self.logged = 0
+
+        self.items: List[Any] = list(basket.items)
+        self.item_index = {item: i for i, item in enumerate(self.items)}
+        # First-seen order of the products, as df[item_column].unique() would list them
+        self.products: List[Any] = list(products)
+        self.transaction_ids: List[Any] = list(basket.transactions)
+        self.transaction_index = {tx: row for row, tx in enumerate(self.transaction_ids)}
+        # A basket memory-mapped from a transaction store is read-only, and the
+        # history is updated in place
+        self.history = basket.matrix.tocsr(copy=not basket.matrix.data.flags.writeable)
+        if pair_counts is None:
+            X = self.history.astype(np.int64)
+            pair_counts = X.T @ X
+        self.pair_counts = pair_counts.tocsr().astype(np.int64)
+
+        self.min_count = min_support_count(min_support, self.n_transactions) if self.n_transactions else 1
+        self.itemsets: Dict[Itemset, int] = dict(mine_eclat(basket, self.min_count, max_len)) if self.n_transactions else {}
+        logger.info(f"Incremental state: {self.n_transactions} transactions, {len(self.itemsets)} frequent itemsets")
+
+    @property
+    def n_transactions(self) -> int:
+        return self.history.shape[0]
+
+    def basket(self) -> Basket:
+        return Basket(self.history, np.asarray(self.transaction_ids, dtype=object), np.asarray(self.items, dtype=object))
+
+    def _add_items(self, new_items: List[Any]) -> None:
+        # Re-sort the vocabulary so column positions match a full encode_basket
+        positions, ordered = pd.factorize(pd.Series(self.items + new_items, dtype=object), sort=True)
+        remap = positions.astype(np.int64)
+        old_positions = remap[:len(self.items)]
+        n_items = len(ordered)
+
+        history = self.history
+        indices = old_positions[history.indices]
+        self.history = sparse.csr_matrix((history.data, indices, history.indptr), shape=(history.shape[0], n_items))
+        self.history.has_sorted_indices = False
+        self.history.sort_indices()
+
+        pairs = self.pair_counts.tocoo()
+        self.pair_counts = sparse.csr_matrix(
+            (pairs.data, (old_positions[pairs.row], old_positions[pairs.col])), shape=(n_items, n_items)
+        )
+        self.itemsets = {tuple(sorted(int(old_positions[i]) for i in key)): count for key, count in self.itemsets.items()}
+        self.items = list(ordered)
+        self.item_index = {item: i for i, item in enumerate(self.items)}
+
+    def apply(self, df: pd.DataFrame) -> Dict[str, Any]:
+        df = df[[self.transaction_column, self.item_column]].dropna()
+        stats = {"rows": int(len(df)), "new_transactions": 0, "updated_transactions": 0, "new_items": 0,
+                 "history_counted": 0, "added_itemsets": 0, "dropped_itemsets": 0}
+        if df.empty:
+            return stats
+
+        seen = set(self.products)
+        for product in df[self.item_column].unique():
+            if product not in seen:
+                seen.add(product)
+                self.products.append(product)
+        new_items = [item for item in pd.unique(df[self.item_column]) if item not in self.item_index]
+        if new_items:
+            self._add_items(new_items)
+        stats["new_items"] = len(new_items)
+
+        # Rows of the delta: existing bills keep their row, new bills are appended
+        n_old = self.n_transactions
+        tx_codes, tx_values = pd.factorize(df[self.transaction_column])
+        rows_of = np.empty(len(tx_values), dtype=np.int64)
+        for code, tx in enumerate(tx_values):
+            row = self.transaction_index.get(tx)
+            if row is None:
+                row = self.transaction_index[tx] = len(self.transaction_ids)
+                self.transaction_ids.append(tx)
+            rows_of[code] = row
+        n_new = len(self.transaction_ids)
+        stats["new_transactions"] = n_new - n_old
+
+        n_items = len(self.items)
+        cells = np.unique(rows_of[tx_codes] * n_items + df[self.item_column].map(self.item_index).to_numpy(np.int64))
+        delta = sparse.csr_matrix(
+            (np.ones(len(cells), dtype=np.int8), (cells // n_items, cells % n_items)), shape=(n_new, n_items)
+        )
+        history = sparse.vstack([self.history, sparse.csr_matrix((n_new - n_old, n_items), dtype=bool)]).tocsr()
+        # Only (bill, item) cells the history does not have yet change any count
+        delta = (delta - delta.multiply(history)).tocsr()
+        delta.eliminate_zeros()
+        touched = np.unique(delta.nonzero()[0])
+        stats["updated_transactions"] = int(np.count_nonzero(touched < n_old))
+
+        before = history[touched].astype(np.int64)
+        self.history = (history + delta.astype(bool)).tocsr().astype(bool)
+        after = self.history[touched].astype(np.int64)
+        self.pair_counts = (self.pair_counts + after.T @ after - before.T @ before).tocsr()
+        self.pair_counts.eliminate_zeros()
+
+        old_itemsets, old_min_count = self.itemsets, self.min_count
+        self.min_count = min_support_count(self.min_support, self.n_transactions)
+        self.itemsets = self._update(old_itemsets, old_min_count, before, after, stats)
+        stats["added_itemsets"] = len(self.itemsets.keys() - old_itemsets.keys())
+        stats["dropped_itemsets"] = len(old_itemsets.keys() - self.itemsets.keys())
+        self.batches += 1
+        logger.info(f"Applied delta batch {self.batches}: {stats}")
+        return stats
+
+    def _update(self, old: Dict[Itemset, int], old_min_count: int, before, after, stats: Dict[str, Any]) -> Dict[Itemset, int]:
+        min_count = self.min_count
+        item_counts = self.pair_counts.diagonal()
+        frequent_items = np.flatnonzero(item_counts >= min_count)
+        updated = {(int(i),): int(item_counts[i]) for i in frequent_items}
+        if self.max_len == 1 or len(frequent_items) < 2:
+            return updated
+
+        # Pairs are exact from the co-occurrence counts
+        pairs = sparse.triu(self.pair_counts, k=1).tocoo()
+        keep = pairs.data >= min_count
+        found = {(int(a), int(b)): int(count) for a, b, count in zip(pairs.row[keep], pairs.col[keep], pairs.data[keep])}
+        updated.update(found)
+        level = sorted(found)
+
+        # Larger itemsets: old count + what the delta added, or a targeted count of
+        # the stored transactions for candidates that may have just crossed the threshold
+        threshold = max(1, min_count - old_min_count + 1)
+        length = 2
+        while level and (self.max_len is None or length < self.max_len):
+            length += 1
+            candidates = _candidates(level)
+            if not candidates:
+                break
+            gains = count_itemsets(after, candidates) - count_itemsets(before, candidates)
+            counts = np.array([old.get(candidate, -1) for candidate in candidates], dtype=np.int64)
+            known = counts >= 0
+            counts[known] += gains[known]
+            unknown = np.flatnonzero(~known & (gains >= threshold))
+            if len(unknown):
+                counts[unknown] = count_itemsets(self.history, [candidates[i] for i in unknown])
+                stats["history_counted"] += len(unknown)
+            level = [candidate for candidate, count in zip(candidates, counts) if count >= min_count]
+            updated.update({candidate: int(count) for candidate, count in zip(candidates, counts) if count >= min_count})
+        return updated
+
+    def itemsets_frame(self) -> pd.DataFrame:
+        # Same layout and order as engines.frequent_itemsets
+        n_tx = self.n_transactions
+        found = sorted(self.itemsets.items(), key=lambda entry: (len(entry[0]), entry[0]))
+        return pd.DataFrame({
+            "support": np.array([count / n_tx for _, count in found], dtype=float),
+            "itemsets": [frozenset(itemset) for itemset, _ in found],
+        })
+
+    def verify(self) -> bool:
+        # Full recompute over the stored transactions, for checking the incremental counts
+        expected = dict(mine_eclat(self.basket(), self.min_count, self.max_len))
+        if expected != self.itemsets:
+            logger.error(
+                f"Incremental itemsets differ from a full recompute: {len(expected.keys() - self.itemsets.keys())} missing, "
+                f"{len(self.itemsets.keys() - expected.keys())} extra"
+            )
+            return False
+        return True
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "transactions": self.n_transactions,
+            "items": len(self.items),
+            "itemsets": len(self.itemsets),
+            "min_count": self.min_count,
+            "batches": self.batches,
+            "logged_batches": self.logged,
+        }
+
+
+def delta_digest(df: pd.DataFrame) -> str:
+    # Content hash of a batch of delta rows; identical uploads in flight share one job
+    hashed = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha256(hashed.tobytes() + repr(list(df.columns)).encode("utf-8")).hexdigest()
+
+
+class DeltaLog:
+    # The delta batches applied to a dataset (workbook content, sheet and
+    # columns), kept on disk in the order they were accepted, so that a state
+    # rebuilt after an eviction or a restart, the state of another server
+    # process, and a full /mine-rules run all include the same deltas.
+    # Batch n is the file <n>.pkl; a process claims the next number by linking
+    # its finished file into place, which fails if another process got there first.
+    def __init__(self, dataset_key: Hashable):
+        digest = hashlib.sha256(repr(dataset_key).encode("utf-8")).hexdigest()[:24]
+        self.directory = ingest.CACHE_DIR / "deltas" / digest
+
+    def _path(self, batch: int) -> Path:
+        return self.directory / f"{batch:08d}.pkl"
+
+    def count(self) -> int:
+        try:
+            return sum(1 for name in os.listdir(self.directory) if name.endswith(".pkl"))
+        except FileNotFoundError:
+            return 0
+
+    def read(self, start: int = 0, stop: Optional[int] = None) -> List[pd.DataFrame]:
+        stop = self.count() if stop is None else stop
+        return [pd.read_pickle(self._path(batch)) for batch in range(start, stop)]
+
+    def append(self, df: pd.DataFrame, batch: int) -> bool:
+        # Stores df as batch number `batch`; False when that batch exists already
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".batch-", suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        try:
+            df.reset_index(drop=True).to_pickle(tmp)
+            os.link(tmp, self._path(batch))
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            Path(tmp).unlink(missing_ok=True)
+
+
+# Live incremental states keyed by (dataset key, min_support, max_len). A state
+# can be dropped at any time: it is rebuilt from the sheet and its DeltaLog.
+INCREMENTAL = LRUCache(INCREMENTAL_STATES)
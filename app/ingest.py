@@ -0,0 +1,632 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Parsed sheets are stored here as one .npy file per column, so the workbook
+# only goes through openpyxl once per content version.
+CACHE_DIR = Path(os.environ.get("INGEST_CACHE_DIR", Path(__file__).resolve().parent / ".ingest_cache"))
+CACHE_VERSION = 2
+
+HASH_CHUNK_SIZE = 1 << 20
+# Rows parsed per chunk while streaming a sheet; bounds ingest memory for any file size
+INGEST_CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", "50000"))
+# Rows copied at a time when staging files are rewritten or finalised
+COPY_CHUNK_ROWS = 1 << 20
+
+# A CSV file is one table, exposed under the usual first-sheet name
+CSV_SHEET_NAME = "Sheet1"
+CSV_SUFFIXES = (".csv",)
+
+# Excel text can never contain NUL, so it is a safe separator for string categories
+TEXT_SEPARATOR = "\x00"
+
+# Cell text read_excel treats as missing by default
+NA_STRINGS = frozenset([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+])
+
+# path -> (size, mtime_ns, sha256) so unchanged workbooks are not re-hashed on every request
+_fingerprints: Dict[str, tuple] = {}
+_build_lock = threading.Lock()
+# sha256 -> workbook manifest (sheet names and header scan), so metadata requests
+# for a known workbook touch neither the file nor the cache directory
+_manifests: Dict[str, Dict[str, Any]] = {}
+
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remember_fingerprint(path: str, sha256: str) -> None:
+    # For callers that hashed the file while writing it, so it is not read twice
+    resolved = str(Path(path).resolve())
+    stat = os.stat(resolved)
+    _fingerprints[resolved] = (stat.st_size, stat.st_mtime_ns, sha256)
+
+
+def workbook_fingerprint(path: str) -> Dict[str, Any]:
+    resolved = str(Path(path).resolve())
+    stat = os.stat(resolved)
+    cached = _fingerprints.get(resolved)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        sha256 = cached[2]
+    else:
+        sha256 = _hash_file(resolved)
+        _fingerprints[resolved] = (stat.st_size, stat.st_mtime_ns, sha256)
+    return {"path": resolved, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+
+
+def is_csv(path: str) -> bool:
+    return Path(path).suffix.lower() in CSV_SUFFIXES
+
+
+def _workbook_dir(fingerprint: Dict[str, Any]) -> Path:
+    return CACHE_DIR / f"v{CACHE_VERSION}" / fingerprint["sha256"][:24]
+
+
+def _sheet_dir(fingerprint: Dict[str, Any], sheet_name: str) -> Path:
+    slug = hashlib.sha1(str(sheet_name).encode("utf-8")).hexdigest()[:16]
+    return _workbook_dir(fingerprint) / f"sheet-{slug}"
+
+
+def _write_json(path: Path, payload: Dict[str, Any]) -> None:
+    # A temporary file of its own, so processes writing the same file at once
+    # (an upload's ingest job and a request's header scan) never share one
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.stem}-", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, default=str)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _read_json(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_categories(path: Path, values: List[Any]) -> str:
+    if all(isinstance(v, str) for v in values):
+        path.with_suffix(".txt").write_text(TEXT_SEPARATOR.join(values), encoding="utf-8")
+        return "text"
+    # Mixed object columns (e.g. numeric bill numbers next to text ones) keep their Python types
+    with open(path.with_suffix(".json"), "w", encoding="utf-8") as fh:
+        json.dump([v.item() if isinstance(v, np.generic) else v for v in values], fh, default=str)
+    return "json"
+
+
+def _read_categories(path: Path, encoding: str, count: int) -> List[Any]:
+    if count == 0:
+        return []
+    if encoding == "text":
+        return path.with_suffix(".txt").read_text(encoding="utf-8").split(TEXT_SEPARATOR)
+    with open(path.with_suffix(".json"), encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+# Storage types of a column while it is being streamed. "category" is
+# dictionary encoded: int32 codes plus the distinct values once.
+_STORAGE = {
+    "bool": np.dtype(bool),
+    "int": np.dtype(np.int64),
+    "float": np.dtype(np.float64),
+    "datetime": np.dtype(np.int64),
+    "category": np.dtype(np.int32),
+}
+_NAT = np.iinfo(np.int64).min
+
+
+def _chunk_kind(series: pd.Series) -> str:
+    dtype = series.dtype
+    if pd.api.types.is_datetime64_any_dtype(dtype) and getattr(dtype, "tz", None) is None:
+        return "datetime"
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bool"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "int"
+    if pd.api.types.is_float_dtype(dtype):
+        return "float"
+    return "category"
+
+
+def _widen(current: str, incoming: str) -> str:
+    # The type pandas would give a column holding values of both kinds
+    if current == incoming:
+        return current
+    if {current, incoming} == {"int", "float"}:
+        return "float"
+    return "category"
+
+
+def _with_nulls(kind: str) -> str:
+    # Integer and boolean columns with gaps are read as float
+    return {"int": "float", "bool": "float"}.get(kind, kind)
+
+
+class _ColumnWriter:
+    # Appends one column to a staging .raw file chunk by chunk. The storage type
+    # follows the values seen so far and is widened (rewriting what was written)
+    # when a later chunk needs it, so the result matches reading the whole sheet.
+    def __init__(self, stem: Path):
+        self.stem = stem
+        self.raw_path = stem.with_suffix(".raw")
+        self.kind: Optional[str] = None
+        self.rows = 0
+        self.pending_nulls = 0
+        self.lookup: Dict[Any, int] = {}
+        self.categories: List[Any] = []
+
+    def _codes(self, values: pd.Series) -> np.ndarray:
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        mapping = np.empty(len(uniques) + 1, dtype=np.int32)
+        for i, value in enumerate(list(uniques)):
+            if isinstance(value, np.generic):
+                value = value.item()
+            code = self.lookup.get(value)
+            if code is None:
+                code = self.lookup[value] = len(self.categories)
+                self.categories.append(value)
+            mapping[i] = code
+        mapping[-1] = -1
+        return mapping[codes]
+
+    def _encode(self, series: pd.Series) -> np.ndarray:
+        if self.kind == "datetime":
+            return series.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        if self.kind == "category":
+            return self._codes(series.astype(object))
+        return series.to_numpy(dtype=_STORAGE[self.kind])
+
+    def _nulls(self, count: int) -> np.ndarray:
+        fill = {"datetime": _NAT, "category": -1, "float": np.nan}[self.kind]
+        return np.full(count, fill, dtype=_STORAGE[self.kind])
+
+    def _write(self, values: np.ndarray) -> None:
+        with open(self.raw_path, "ab") as fh:
+            fh.write(np.ascontiguousarray(values, dtype=_STORAGE[self.kind]).tobytes())
+        self.rows += len(values)
+
+    def _stored(self) -> np.ndarray:
+        if self.rows == 0:
+            return np.empty(0, dtype=_STORAGE[self.kind])
+        return np.memmap(self.raw_path, dtype=_STORAGE[self.kind], mode="r", shape=(self.rows,))
+
+    def _promote(self, kind: str) -> None:
+        old_kind = self.kind
+        previous = self.raw_path.with_suffix(".old")
+        if self.rows:
+            os.replace(self.raw_path, previous)
+        stored, rows = (np.memmap(previous, dtype=_STORAGE[old_kind], mode="r", shape=(self.rows,)) if self.rows else None), self.rows
+        self.kind, self.rows = kind, 0
+        for start in range(0, rows, COPY_CHUNK_ROWS):
+            block = np.asarray(stored[start:start + COPY_CHUNK_ROWS])
+            if old_kind == "datetime":
+                values = pd.Series(block.view("datetime64[ns]"))
+            else:
+                values = pd.Series(block)
+            self._write(self._encode(values))
+        del stored
+        previous.unlink(missing_ok=True)
+
+    def _flush_nulls(self) -> None:
+        if self.pending_nulls:
+            count, self.pending_nulls = self.pending_nulls, 0
+            self._write(self._nulls(count))
+
+    def append(self, series: pd.Series) -> None:
+        missing = series.isna()
+        if bool(missing.all()):
+            # Values still unknown: remember the gap until the column's type is known
+            self.pending_nulls += len(series)
+            return
+        kind = _chunk_kind(series)
+        target = kind if self.kind is None else _widen(self.kind, kind)
+        if self.pending_nulls or bool(missing.any()):
+            target = _with_nulls(target)
+        if self.kind is None:
+            self.kind = target
+        elif target != self.kind:
+            self._promote(target)
+        self._flush_nulls()
+        self._write(self._encode(series))
+
+    def finish(self, rows: int) -> Dict[str, Any]:
+        if self.kind is None:
+            # A header with no values below it reads as an all-NaN float column
+            self.kind = "float"
+        elif self.pending_nulls:
+            target = _with_nulls(self.kind)
+            if target != self.kind:
+                self._promote(target)
+        self.pending_nulls = rows - self.rows
+        self._flush_nulls()
+
+        # Copy the staging file into a .npy in slices so memory stays bounded
+        stored = self._stored()
+        dtype = _STORAGE[self.kind]
+        target = np.lib.format.open_memmap(self.stem.with_suffix(".npy"), mode="w+", dtype=dtype, shape=(self.rows,))
+        for start in range(0, self.rows, COPY_CHUNK_ROWS):
+            target[start:start + COPY_CHUNK_ROWS] = stored[start:start + COPY_CHUNK_ROWS]
+        target.flush()
+        del stored, target
+        self.raw_path.unlink(missing_ok=True)
+
+        if self.kind == "category":
+            encoding = _write_categories(self.stem.parent / f"{self.stem.name}.cat", self.categories)
+            return {"kind": "category", "categories": encoding, "n_categories": len(self.categories)}
+        if self.kind == "datetime":
+            return {"kind": "datetime"}
+        return {"kind": "numeric"}
+
+
+def _header_names(header: List[Any]) -> List[Any]:
+    # The names read_excel gives: blanks become "Unnamed: i", repeats get ".1", ".2", ...
+    names: List[Any] = []
+    counts: Dict[Any, int] = {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None else value
+        if name in counts:
+            while True:
+                counts[name] += 1
+                candidate = f"{name}.{counts[name]}"
+                if candidate not in counts:
+                    break
+            counts[candidate] = 0
+            name = candidate
+        else:
+            counts[name] = 0
+        names.append(name)
+    return names
+
+
+def _convert_cell(value: Any) -> Any:
+    # As read_excel does: whole floats are ints and NA-like text is missing
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value in NA_STRINGS:
+        return None
+    return value
+
+
+def _convert_row(row: tuple) -> List[Any]:
+    values = [_convert_cell(value) for value in row]
+    while values and values[-1] is None:
+        values.pop()
+    return values
+
+
+def _typed_chunk(rows: List[List[Any]]) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(rows)
+    for column in df.columns:
+        if df[column].dtype == object:
+            # Numbers stored as text are parsed, like read_excel's type inference
+            try:
+                df[column] = pd.to_numeric(df[column])
+            except (ValueError, TypeError):
+                pass
+    return df
+
+
+def _iter_xlsx(path: str, sheet_name: str, chunk_rows: int) -> Tuple[List[Any], Optional[int], Iterator[pd.DataFrame]]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    if sheet_name not in workbook.sheetnames:
+        workbook.close()
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    sheet = workbook[sheet_name]
+    rows = sheet.iter_rows(values_only=True)
+    # Like read_excel, the first row is the header even when it is blank
+    header = _convert_row(next(rows, ()))
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        # Blank rows inside the data are kept as missing values; trailing ones are dropped
+        batch: List[List[Any]] = []
+        blank = 0
+        try:
+            for row in rows:
+                values = _convert_row(row)
+                if not values:
+                    blank += 1
+                    continue
+                batch.extend([[None]] * blank)
+                blank = 0
+                batch.append(values)
+                if len(batch) >= chunk_rows:
+                    yield _typed_chunk(batch)
+                    batch = []
+            if batch:
+                yield _typed_chunk(batch)
+        finally:
+            workbook.close()
+
+    return header, sheet.max_row, chunks()
+
+
+def _iter_csv(path: str, chunk_rows: int) -> Tuple[List[Any], Optional[int], Iterator[pd.DataFrame]]:
+    reader = pd.read_csv(path, chunksize=chunk_rows)
+    try:
+        first = next(reader)
+    except StopIteration:
+        return [], 0, iter(())
+    names = list(first.columns)
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        with reader:
+            for chunk in itertools.chain([first], reader):
+                yield chunk.set_axis(range(len(names)), axis=1)
+
+    return names, None, chunks()
+
+
+def _build_sheet(path: str, sheet_name: str, destination: Path, progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    # Streams the sheet into column files INGEST_CHUNK_ROWS rows at a time, so
+    # memory use does not grow with the size of the file
+    logger.info(f"Ingesting sheet '{sheet_name}' from {path}")
+    if is_csv(path):
+        header, expected_rows, chunks = _iter_csv(path, INGEST_CHUNK_ROWS)
+    else:
+        header, expected_rows, chunks = _iter_xlsx(path, sheet_name, INGEST_CHUNK_ROWS)
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".building-", dir=destination.parent))
+    try:
+        writers = [_ColumnWriter(staging / f"col{index}") for index in range(len(header))]
+        rows = 0
+        for chunk in chunks:
+            # Rows wider than the header add unnamed columns, empty above this chunk
+            while len(writers) < chunk.shape[1]:
+                writer = _ColumnWriter(staging / f"col{len(writers)}")
+                writer.pending_nulls = rows
+                writers.append(writer)
+            for index, writer in enumerate(writers):
+                if index < chunk.shape[1]:
+                    writer.append(chunk[index])
+                else:
+                    writer.pending_nulls += len(chunk)
+            rows += len(chunk)
+            if progress:
+                progress(rows, expected_rows)
+        names = _header_names(header + [None] * (len(writers) - len(header)))
+        columns = []
+        for name, writer in zip(names, writers):
+            column = writer.finish(rows)
+            column["name"] = name
+            columns.append(column)
+        meta = {"sheet_name": sheet_name, "rows": rows, "columns": columns}
+        _write_json(staging / "sheet.json", meta)
+        # Publish atomically so concurrent readers never see a half-written sheet.
+        # If another process published the same sheet first, keep theirs.
+        try:
+            os.replace(staging, destination)
+        except OSError:
+            if not (destination / "sheet.json").exists():
+                raise
+            shutil.rmtree(staging, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    logger.info(f"Cached sheet '{sheet_name}' ({rows} rows, {len(columns)} columns) at {destination}")
+    return meta
+
+
+def _prune_stale(fingerprint: Dict[str, Any]) -> None:
+    # Drop caches of earlier versions of the same workbook once it has changed
+    current = _workbook_dir(fingerprint)
+    for manifest_path in current.parent.glob("*/workbook.json"):
+        if manifest_path.parent == current:
+            continue
+        manifest = _read_json(manifest_path)
+        if manifest and manifest.get("fingerprint", {}).get("path") == fingerprint["path"]:
+            logger.info(f"Removing stale workbook cache {manifest_path.parent}")
+            shutil.rmtree(manifest_path.parent, ignore_errors=True)
+
+
+def _count_lines(path: str) -> int:
+    lines = 0
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b""):
+            lines += chunk.count(b"\n")
+    return lines
+
+
+def _scan_headers(path: str) -> Dict[str, Any]:
+    # Sheet names, header row and approximate row count of every sheet, without
+    # parsing any data rows. Row counts come from the sheet dimension (or the
+    # line count of a CSV), so they can include trailing blank or quoted lines.
+    if is_csv(path):
+        try:
+            names = list(pd.read_csv(path, nrows=0).columns)
+        except pd.errors.EmptyDataError:
+            names = []
+        return {
+            "sheet_names": [CSV_SHEET_NAME],
+            "sheets": {CSV_SHEET_NAME: {"columns": names, "rows": max(0, _count_lines(path) - 1)}},
+        }
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheets = {}
+        for sheet in workbook.worksheets:
+            header = _convert_row(next(sheet.iter_rows(max_row=1, values_only=True), ()))
+            rows = sheet.max_row
+            sheets[sheet.title] = {"columns": _header_names(header), "rows": max(0, rows - 1) if rows else None}
+        return {"sheet_names": list(workbook.sheetnames), "sheets": sheets}
+    finally:
+        workbook.close()
+
+
+def _workbook_manifest(path: str) -> Dict[str, Any]:
+    fingerprint = workbook_fingerprint(path)
+    manifest = _manifests.get(fingerprint["sha256"])
+    if manifest is not None:
+        return {**manifest, "fingerprint": fingerprint}
+    manifest_path = _workbook_dir(fingerprint) / "workbook.json"
+    manifest = _read_json(manifest_path)
+    # Manifests written before header scans were cached have no "sheets"
+    if manifest is None or "sheets" not in manifest:
+        with _build_lock:
+            manifest = _read_json(manifest_path)
+            if manifest is None or "sheets" not in manifest:
+                start = time.perf_counter()
+                manifest = {"version": CACHE_VERSION, "fingerprint": fingerprint, **_scan_headers(path)}
+                manifest_path.parent.mkdir(parents=True, exist_ok=True)
+                _write_json(manifest_path, manifest)
+                _prune_stale(fingerprint)
+                logger.info(f"Scanned headers of {len(manifest['sheet_names'])} sheets in {path} ({time.perf_counter() - start:.3f}s)")
+    _manifests[fingerprint["sha256"]] = manifest
+    return {**manifest, "fingerprint": fingerprint}
+
+
+def sheet_names(path: str) -> List[str]:
+    return _workbook_manifest(path)["sheet_names"]
+
+
+def sheet_header(path: str, sheet_name: str) -> Dict[str, Any]:
+    # Column names and row count of a sheet for metadata requests: exact once the
+    # sheet is in the column cache, otherwise from the header scan, which never
+    # triggers an ingest
+    manifest = _workbook_manifest(path)
+    if sheet_name not in manifest["sheet_names"]:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    meta = _read_json(_sheet_dir(manifest["fingerprint"], sheet_name) / "sheet.json")
+    if meta is not None:
+        return {"columns": [column["name"] for column in meta["columns"]], "rows": meta["rows"], "exact": True}
+    scanned = manifest["sheets"][sheet_name]
+    return {"columns": scanned["columns"], "rows": scanned["rows"], "exact": False}
+
+
+def sheet_meta(path: str, sheet_name: str, progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    manifest = _workbook_manifest(path)
+    if sheet_name not in manifest["sheet_names"]:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    sheet_dir = _sheet_dir(manifest["fingerprint"], sheet_name)
+    meta = _read_json(sheet_dir / "sheet.json")
+    if meta is None:
+        with _build_lock:
+            meta = _read_json(sheet_dir / "sheet.json")
+            if meta is None:
+                meta = _build_sheet(path, sheet_name, sheet_dir, progress=progress)
+    meta["directory"] = str(sheet_dir)
+    meta["fingerprint"] = manifest["fingerprint"]
+    return meta
+
+
+def _ingest_progress(
+    progress: Optional[Callable[[str, float], None]], sheet_name: str, position: int = 0, count: int = 1
+) -> ProgressCallback:
+    # Rows parsed so far as a job stage and the share of the count sheets done
+    def report(rows: int, expected: Optional[int]) -> None:
+        if progress:
+            fraction = min(1.0, rows / expected) if expected else 0.5
+            progress(f"ingesting '{sheet_name}' ({rows} rows)", (position + fraction) / count)
+
+    return report
+
+
+def ingest_sheet(path: str, sheet_name: str, progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+    # One sheet into the column cache (nothing to do when it is there already)
+    return sheet_meta(path, sheet_name, progress=_ingest_progress(progress, sheet_name))
+
+
+def ingest_workbook(path: str, progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+    # Converts every sheet of a workbook (or the table of a CSV) into the column cache
+    names = sheet_names(path)
+    sheets = {}
+    for position, name in enumerate(names):
+        meta = sheet_meta(path, name, progress=_ingest_progress(progress, name, position, len(names)))
+        sheets[name] = {"rows": meta["rows"], "columns": [column["name"] for column in meta["columns"]]}
+    return {"sheet_names": names, "sheets": sheets, "sha256": workbook_fingerprint(path)["sha256"]}
+
+
+def column_names(path: str, sheet_name: str) -> List[Any]:
+    return [column["name"] for column in sheet_meta(path, sheet_name)["columns"]]
+
+
+def _read_column(directory: Path, index: int, column: Dict[str, Any], categorical: bool = False) -> Any:
+    values = np.load(directory / f"col{index}.npy")
+    if column["kind"] == "datetime":
+        return values.view("datetime64[ns]")
+    if column["kind"] == "category":
+        categories = _read_categories(directory / f"col{index}.cat", column["categories"], column["n_categories"])
+        if categorical:
+            # The stored codes as they are (-1 is missing); no per-row Python objects
+            return pd.Categorical.from_codes(values, pd.Index(categories, dtype=object), validate=False)
+        # The trailing NaN makes the -1 "missing" code map back to NaN
+        lookup = np.empty(len(categories) + 1, dtype=object)
+        lookup[:-1] = categories
+        lookup[-1] = np.nan
+        return lookup[values]
+    return values
+
+
+def open_column(meta: Dict[str, Any], name: Any) -> Tuple[np.ndarray, Dict[str, Any], Optional[List[Any]]]:
+    # One cached column memory-mapped (rows are only read from disk as they are
+    # touched), its description and, for dictionary-encoded columns, the categories
+    index = [column["name"] for column in meta["columns"]].index(name)
+    column = meta["columns"][index]
+    directory = Path(meta["directory"])
+    values = np.load(directory / f"col{index}.npy", mmap_mode="r")
+    categories = None
+    if column["kind"] == "category":
+        categories = _read_categories(directory / f"col{index}.cat", column["categories"], column["n_categories"])
+    return values, column, categories
+
+
+def load_sheet(path: str, sheet_name: str, columns: Optional[List[Any]] = None, categorical: bool = False) -> pd.DataFrame:
+    # categorical=True returns text columns as pandas Categoricals over the cached
+    # dictionary codes instead of object arrays of strings
+    meta = sheet_meta(path, sheet_name)
+    directory = Path(meta["directory"])
+    wanted = [c for c in meta["columns"] if columns is None or c["name"] in columns]
+    if columns is not None:
+        missing = [c for c in columns if c not in [w["name"] for w in wanted]]
+        if missing:
+            raise KeyError(f"Columns not found in sheet '{sheet_name}': {missing}")
+    index_of = {column["name"]: i for i, column in enumerate(meta["columns"])}
+    data = {}
+    for column in wanted:
+        data[column["name"]] = _read_column(directory, index_of[column["name"]], column, categorical=categorical)
+    df = pd.DataFrame(data)
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+def read_rows(fileobj: Any, filename: str, columns: List[Any]) -> pd.DataFrame:
+    # A small batch of rows posted with a request (e.g. new bills for incremental
+    # mining), read directly rather than through the column cache
+    if is_csv(filename):
+        df = pd.read_csv(fileobj)
+    else:
+        df = pd.read_excel(fileobj, sheet_name=0)
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise ValueError(f"Columns not found in '{filename}': {missing}")
+    return df[list(columns)]
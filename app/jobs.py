@@ -0,0 +1,368 @@
+import asyncio
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from metrics import profile_call
+
+logger = logging.getLogger(__name__)
+
+MINING_WORKERS = int(os.environ.get("MINING_WORKERS", str(os.cpu_count() or 1)))
+MAX_PENDING_JOBS = int(os.environ.get("MAX_PENDING_JOBS", str(4 * MINING_WORKERS)))
+JOB_HISTORY = int(os.environ.get("JOB_HISTORY", "200"))
+# Parts of a job's result that JobStore does not keep: the recommendation index
+# (published on its own, see shared.py) and the itemsets, which only the
+# process that ran the job caches
+UNSHARED_RESULT_KEYS = ("index", "itemsets")
+
+# Only set inside worker processes
+_progress_queue = None
+# The job running on the current thread (job_id) and, for in-process jobs, the
+# callable its progress goes to (report)
+_current = threading.local()
+
+
+def _init_worker(progress_queue) -> None:
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def report_progress(stage: str, progress: float) -> None:
+    # Called from the mining code running in a job; a no-op outside one
+    job_id = getattr(_current, "job_id", None)
+    if job_id is None:
+        return
+    if _current.report is not None:
+        _current.report(job_id, stage, progress)
+    elif _progress_queue is not None:
+        _progress_queue.put((job_id, stage, progress))
+
+
+def _execute(
+    job_id: str, fn: Callable, args: tuple, kwargs: Dict[str, Any], profile: bool = False,
+    report: Optional[Callable[[str, str, float], None]] = None,
+) -> Any:
+    _current.job_id, _current.report = job_id, report
+    try:
+        report_progress("started", 0.0)
+        if profile:
+            return profile_call(job_id, fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+    finally:
+        _current.job_id = _current.report = None
+
+
+def _preload(modules: Tuple[str, ...]) -> int:
+    # Imports modules in a worker ahead of its first job; returns the worker pid
+    for module in modules:
+        importlib.import_module(module)
+    return os.getpid()
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id: str, key: Hashable):
+        self.id = job_id
+        self.key = key
+        self.status = "queued"
+        self.stage = "queued"
+        self.progress = 0.0
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.future: Optional[Future] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def state(self) -> Dict[str, Any]:
+        # What JobStore keeps of the job besides its result
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "Job":
+        job = cls(state["job_id"], None)
+        for name in ("status", "stage", "progress", "submitted_at", "started_at", "finished_at", "error"):
+            setattr(job, name, state[name])
+        return job
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "queued_seconds": round((self.started_at or end) - self.submitted_at, 3),
+            "run_seconds": round(end - self.started_at, 3) if self.started_at else None,
+            "error": self.error,
+        }
+
+
+class JobStore:
+    # Job states and results as files in one directory, so that every server
+    # process can answer for a job that any of them runs: <id>.json holds the
+    # job's state, <id>.pkl its result once it is done. Each file is replaced
+    # in one rename, so readers see a whole state or none.
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def _write(self, path: Path, data: bytes) -> None:
+        fd, tmp = tempfile.mkstemp(prefix=f".{path.stem}-", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def save(self, state: Dict[str, Any], result: Any = None) -> None:
+        # The result is written before the state that says the job is done
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if result is not None:
+            if isinstance(result, dict):
+                result = {key: value for key, value in result.items() if key not in UNSHARED_RESULT_KEYS}
+            self._write(self.directory / f"{state['job_id']}.pkl", pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        self._write(self.directory / f"{state['job_id']}.json", json.dumps(state).encode("utf-8"))
+
+    def load(self, job_id: str) -> Optional[Job]:
+        # The job as last saved, None when no process has saved it (or it was forgotten)
+        if not job_id.isalnum():
+            return None
+        try:
+            job = Job.from_state(json.loads((self.directory / f"{job_id}.json").read_bytes()))
+            if job.status == "done":
+                job.result = pickle.loads((self.directory / f"{job_id}.pkl").read_bytes())
+        except (FileNotFoundError, ValueError):
+            return None
+        return job
+
+    def remove(self, job_id: str) -> None:
+        for suffix in (".json", ".pkl"):
+            (self.directory / f"{job_id}{suffix}").unlink(missing_ok=True)
+
+
+class JobManager:
+    # Runs CPU-bound work in a bounded process pool. Identical in-flight jobs
+    # (same key) share one execution, and at most max_pending jobs may be
+    # queued or running at once. Work on state that lives in this process
+    # (in_process=True, e.g. the incremental mining states) runs on a thread pool
+    # of the same size instead, under the same limit and deduplication.
+    # The limit, the deduplication and the job history are this process's own;
+    # with a JobStore (share()) other processes can look its jobs up too.
+    def __init__(self, workers: int = MINING_WORKERS, max_pending: int = MAX_PENDING_JOBS, history: int = JOB_HISTORY):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.history = history
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._progress_queue = None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._inflight: Dict[Hashable, Job] = {}
+        self._lock = threading.Lock()
+        self.deduplicated = 0
+        self.store: Optional[JobStore] = None
+
+    def share(self, store: JobStore) -> None:
+        # Saves every job's state (and result) to store from now on, and looks
+        # up jobs this process does not know there
+        self.store = store
+
+    def _save(self, state: Dict[str, Any], result: Any = None) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.save(state, result)
+        except Exception as e:
+            logger.warning(f"Could not save job {state['job_id']} to {self.store.directory}: {str(e)}")
+
+    def _forget(self, job_ids: List[str]) -> None:
+        if self.store is not None:
+            for job_id in job_ids:
+                self.store.remove(job_id)
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._progress_queue = multiprocessing.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(self._progress_queue,)
+            )
+            threading.Thread(target=self._drain_progress, args=(self._progress_queue,), daemon=True).start()
+            logger.info(f"Started mining process pool with {self.workers} workers")
+        return self._executor
+
+    def _drain_progress(self, progress_queue) -> None:
+        while True:
+            try:
+                message = progress_queue.get()
+            except (EOFError, OSError, ValueError):
+                return
+            if message is None:
+                return
+            self._record_progress(*message)
+
+    def _record_progress(self, job_id: str, stage: str, progress: float) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return
+            if job.status == "queued":
+                job.status = "running"
+                job.started_at = time.time()
+            # Shared once per stage rather than for every progress report
+            changed = job.stage != stage
+            job.stage = stage
+            job.progress = max(job.progress, progress)
+            state = job.state()
+        if changed:
+            self._save(state)
+
+    def submit(
+        self, key: Hashable, fn: Callable, *args, on_done: Optional[Callable[[Any], None]] = None, profile: bool = False,
+        in_process: bool = False, **kwargs
+    ) -> Tuple[Job, bool]:
+        # Returns the job and whether it was an already running duplicate.
+        # With profile=True the run is captured with cProfile under the job id.
+        # With in_process=True fn runs on a thread of this process (nothing is pickled).
+        with self._lock:
+            existing = self._inflight.get(key)
+            if existing is not None:
+                self.deduplicated += 1
+                return existing, True
+            if len(self._inflight) >= self.max_pending:
+                raise JobQueueFull(f"{len(self._inflight)} mining jobs are already pending; try again shortly")
+            job = Job(uuid.uuid4().hex, key)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            forgotten = self._trim_history()
+            state = job.state()
+            if in_process:
+                if self._threads is None:
+                    self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+                job.future = self._threads.submit(_execute, job.id, fn, args, kwargs, profile, self._record_progress)
+            else:
+                job.future = self._ensure_executor().submit(_execute, job.id, fn, args, kwargs, profile)
+        self._forget(forgotten)
+        self._save(state)
+        job.future.add_done_callback(lambda future: self._finish(job, future, on_done))
+        return job, False
+
+    def completed(self, key: Hashable, result: Any) -> Job:
+        # Records a job whose result was already available (e.g. from a cache)
+        with self._lock:
+            job = Job(uuid.uuid4().hex, key)
+            job.started_at = job.finished_at = job.submitted_at
+            job.result = result
+            job.status, job.stage, job.progress = "done", "done", 1.0
+            self._jobs[job.id] = job
+            forgotten = self._trim_history()
+        self._forget(forgotten)
+        self._save(job.state(), result)
+        return job
+
+    def _finish(self, job: Job, future: Future, on_done: Optional[Callable[[Any], None]]) -> None:
+        error = future.exception()
+        with self._lock:
+            job.finished_at = time.time()
+            job.started_at = job.started_at or job.finished_at
+            if error is None:
+                job.result = future.result()
+                job.status, job.stage, job.progress = "done", "done", 1.0
+            else:
+                job.error = f"{type(error).__name__}: {error}"
+                job.status, job.stage = "failed", "failed"
+                logger.error(f"Job {job.id} failed: {job.error}")
+                logger.error("".join(traceback.format_exception(error)))
+            state = job.state()
+        self._save(state, job.result)
+        if error is None and on_done is not None:
+            try:
+                on_done(job.result)
+            except Exception:
+                logger.error(f"Post-processing for job {job.id} failed: {traceback.format_exc()}")
+        # Only now, with the caches filled by on_done, may an identical request
+        # start a new run instead of joining this one
+        with self._lock:
+            self._inflight.pop(job.key, None)
+
+    def _trim_history(self) -> List[str]:
+        # Forget the oldest finished jobs beyond the history limit; returns their ids
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        forgotten = finished[:max(0, len(finished) - self.history)]
+        for job_id in forgotten:
+            del self._jobs[job_id]
+        return forgotten
+
+    def get(self, job_id: str) -> Optional[Job]:
+        # A job of another process (from the store) has no future to wait on
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.load(job_id)
+        return job
+
+    async def wait(self, job: Job) -> Any:
+        if job.future is None:
+            return job.result
+        return await asyncio.wrap_future(job.future)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": len(self._inflight),
+                "deduplicated": self.deduplicated,
+                "jobs": statuses,
+            }
+
+    def warm_up(self, modules: Tuple[str, ...] = ()) -> None:
+        # Starts every worker process (importing `modules` in each), so the first
+        # mining job does not pay for process start-up and imports. Blocks until done.
+        executor = self._ensure_executor()
+        futures = [executor.submit(_preload, modules) for _ in range(self.workers)]
+        pids = {future.result() for future in futures}
+        logger.info(f"Warmed up {len(pids)} mining workers")
+
+    def shutdown(self) -> None:
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._progress_queue.put(None)
+            self._executor = None
+
+
+JOBS = JobManager()
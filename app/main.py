@@ -1,29 +1,75 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Form, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Form, Request, Depends
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
-import numpy as np
-from mlxtend.frequent_patterns import apriori, association_rules
-from mlxtend.preprocessing import TransactionEncoder
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 import os
-import io
-import json
+import asyncio
+import importlib
+import time
 import traceback
 import logging
 from typing import List, Optional, Dict, Any
 import uvicorn
-import matplotlib.pyplot as plt
 from fastapi.responses import StreamingResponse
 from pathlib import Path
+# pandas and scipy are not loaded here: the ingest and mining modules are
+# imported by the handlers that use them, so the server starts without them
+from datasets import DATASETS, DEFAULT_DATASET, SHARED_DATASETS, UploadError, UploadTooLarge, save_upload
+from sampling import SAMPLE_FRACTION, SAMPLE_SEED
+from result_cache import RESULT_CACHE, ITEMSET_CACHE, SEGMENT_CACHE
+from jobs import JOBS, JobQueueFull, report_progress
+from rule_query import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, dumps, paginate, ndjson_lines, select_rules
+from metrics import METRICS, PROFILING_ENABLED, profile_report, server_timing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Optional background warm-up once the server is accepting requests: deferred
+# imports, the header scan of every known dataset and the mining process pool
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "0") == "1"
+WARMUP_MODULES = ("mining", "mlxtend.frequent_patterns", "openpyxl")
+
+# Largest support x confidence grid one /mine-rules/sweep request may ask for
+MAX_SWEEP_CELLS = int(os.environ.get("MAX_SWEEP_CELLS", "100"))
+
+def warm_up():
+    from ingest import sheet_header, sheet_names
+
+    start = time.perf_counter()
+    for module in WARMUP_MODULES:
+        importlib.import_module(module)
+    paths = [EXCEL_FILE] + [entry["path"] for entry in DATASETS.list()]
+    for path in paths:
+        try:
+            for name in sheet_names(path):
+                sheet_header(path, name)
+        except Exception as e:
+            logger.warning(f"Warm-up could not scan {path}: {str(e)}")
+    # Workers forked after the imports above inherit them
+    JOBS.warm_up(WARMUP_MODULES)
+    logger.info(f"Warm-up finished in {time.perf_counter() - start:.2f}s")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if SHARED_DATASETS:
+        # Jobs are saved where every server process can look them up, so a
+        # job can be polled through any of them
+        from shared import share_jobs
+        await run_in_threadpool(share_jobs)
+    warming = asyncio.create_task(run_in_threadpool(warm_up)) if WARMUP_ON_STARTUP else None
+    yield
+    if warming is not None and not warming.done():
+        warming.cancel()
+    # Stop the mining process pool with the server
+    JOBS.shutdown()
+
 app = FastAPI(title="Association Rules Mining API", 
-              description="API for mining association rules from sales data")
+              description="API for mining association rules from sales data",
+              lifespan=lifespan)
 
 # Add CORS middleware to handle cross-origin requests
 app.add_middleware(
@@ -34,6 +80,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template so /jobs/{job_id} is one series, not one per job
+    route = request.scope.get("route")
+    METRICS.request_seconds.observe(
+        time.perf_counter() - start, request.method, getattr(route, "path", "unmatched"), str(response.status_code)
+    )
+    return response
+
+def incremental_states():
+    # Imported on first use like the rest of the mining code
+    from incremental import INCREMENTAL
+    return INCREMENTAL
+
+METRICS.register_collector("mining_cache_hits", "Lookups answered by each cache", "cache", lambda: {
+    "results": RESULT_CACHE.hits, "itemsets": ITEMSET_CACHE.stats()["hits"], "incremental": incremental_states().hits,
+})
+METRICS.register_collector("mining_cache_misses", "Lookups each cache could not answer", "cache", lambda: {
+    "results": RESULT_CACHE.misses, "itemsets": ITEMSET_CACHE.stats()["misses"], "incremental": incremental_states().misses,
+})
+METRICS.register_collector("mining_cache_bytes", "Approximate memory held by each cache", "cache", lambda: {
+    "results": RESULT_CACHE.bytes, "itemsets": ITEMSET_CACHE.stats()["bytes"], "segments": SEGMENT_CACHE.stats()["bytes"],
+})
+METRICS.register_collector("mining_jobs", "Mining jobs by status", "status", lambda: {
+    "pending": JOBS.stats()["pending"], **JOBS.stats()["jobs"],
+})
+
 # More robust file path handling
 BASE_DIR = Path(__file__).resolve().parent
 EXCEL_FILE = str(BASE_DIR / "National_Sales_ItemWise Report 2024-25 (1).xlsx")
@@ -94,6 +169,38 @@ async def index():
                     <label>Max Number of Rules:</label>
                     <input type="number" name="max_rules" id="max_rules" value="20" min="1" required>
                 </div>
+                <div class="form-group">
+                    <label>Max Rules per Product (0 = unlimited):</label>
+                    <input type="number" name="top_k" id="top_k" value="0" min="0" required>
+                </div>
+                <div class="form-group">
+                    <label>Algorithm:</label>
+                    <select name="algorithm" id="algorithm">
+                        <option value="apriori" selected>Apriori</option>
+                        <option value="fpgrowth">FP-Growth</option>
+                        <option value="eclat">ECLAT</option>
+                        <option value="streaming">Streaming (chunked)</option>
+                    </select>
+                </div>
+                <div class="form-group">
+                    <label>Max Itemset Size (0 = unlimited):</label>
+                    <input type="number" name="max_len" id="max_len" value="0" min="0" required>
+                </div>
+                <div class="form-group">
+                    <label>Parallel Workers (0 = server default):</label>
+                    <input type="number" name="workers" id="workers" value="0" min="0" required>
+                </div>
+                <div class="form-group">
+                    <label><input type="checkbox" name="approximate" id="approximate" value="true"> Approximate (mine a sample of bills)</label>
+                </div>
+                <div class="form-group">
+                    <label>Sample Fraction (0.0 - 1.0):</label>
+                    <input type="number" name="sample_fraction" id="sample_fraction" step="0.01" min="0.01" max="1.0" value="0.1" required>
+                </div>
+                <div class="form-group">
+                    <label>Dataset:</label>
+                    <input type="text" name="dataset" id="dataset" value="default" required>
+                </div>
                 <div class="form-group">
                     <label>Sheet Name:</label>
                     <input type="text" name="sheet_name" id="sheet_name" value="Sheet1" required>
@@ -368,204 +475,690 @@ async def index():
     """
     return html_content
 
+def dataset_path(dataset: str) -> str:
+    # The bundled workbook is the "default" dataset; others come from /datasets uploads
+    if dataset == DEFAULT_DATASET:
+        return EXCEL_FILE
+    entry = DATASETS.get(dataset)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Dataset '{dataset}' not found")
+    return entry["path"]
+
+@app.put("/datasets/{name}", status_code=202)
+async def upload_dataset(
+    name: str,
+    request: Request,
+    filename: str = Query(..., description="Name of the uploaded file; its extension (.xlsx, .xlsm or .csv) picks the parser")
+):
+    # The request body is the file itself (e.g. curl -T sales.xlsx), written to
+    # disk as it arrives; parsing into the columnar cache runs as a background job
+    from ingest import ingest_workbook, remember_fingerprint
+
+    length = request.headers.get("content-length")
+    try:
+        entry = await save_upload(name, filename, request.stream(), content_length=int(length) if length and length.isdigit() else None)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    remember_fingerprint(entry["path"], entry["sha256"])
+    try:
+        job, _ = JOBS.submit(("ingest", entry["sha256"]), ingest_workbook, entry["path"], progress=report_progress)
+    except JobQueueFull as e:
+        # The dataset is registered; it will be parsed by the first request that needs it
+        logger.warning(f"Ingest of dataset '{name}' deferred: {e}")
+        return {"dataset": entry, "job": None}
+    return {"dataset": entry, "job": job.to_dict()}
+
+@app.get("/datasets")
+async def list_datasets():
+    default = {"name": DEFAULT_DATASET, "path": EXCEL_FILE}
+    return {"datasets": [default] + DATASETS.list()}
+
 @app.get("/sheet-names")
-async def get_sheet_names():
+async def get_sheet_names(dataset: str = Query(DEFAULT_DATASET, description="Dataset name")):
+    from ingest import sheet_names
+
+    path = dataset_path(dataset)
     try:
-        xl = pd.ExcelFile(EXCEL_FILE)
-        return {"sheet_names": xl.sheet_names}
+        return {"sheet_names": await run_in_threadpool(sheet_names, path)}
     except Exception as e:
         logger.error(f"Error reading Excel file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error reading Excel file: {str(e)}")
 
 @app.get("/column-names")
-async def get_column_names(sheet_name: str = Query(...)):
+async def get_column_names(sheet_name: str = Query(...), dataset: str = Query(DEFAULT_DATASET, description="Dataset name")):
+    # Answered from the cached header scan; this never parses the sheet's rows
+    from ingest import sheet_header
+
+    path = dataset_path(dataset)
     try:
-        df = pd.read_excel(EXCEL_FILE, sheet_name=sheet_name, nrows=1)
-        return {"column_names": df.columns.tolist()}
+        header = await run_in_threadpool(sheet_header, path, sheet_name)
+        return {"column_names": header["columns"], "rows": header["rows"], "rows_exact": header["exact"]}
     except Exception as e:
         logger.error(f"Error reading columns: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error reading columns: {str(e)}")
 
-@app.post("/mine-rules")
-async def mine_rules(
+def mining_form(
     min_support: float = Form(0.005, description="Minimum support threshold"),
     min_confidence: float = Form(0.1, description="Minimum confidence threshold"),
-    max_rules: int = Form(20, description="Maximum number of rules to return"),
+    max_rules: int = Form(20, description="Maximum number of rules to return; every rule is still mined (see top_k)"),
+    top_k: int = Form(0, description="Maximum number of rules kept per product, highest lift first (0 = all); also bounds the rules generated"),
     sheet_name: str = Form(..., description="Excel sheet name"),
     item_column: str = Form("ITEMNAME", description="Column containing item names"),
-    transaction_column: str = Form("BILLNO", description="Column containing transaction IDs")
+    transaction_column: str = Form("BILLNO", description="Column containing transaction IDs"),
+    algorithm: str = Form("apriori", description="Frequent itemset engine: apriori, fpgrowth, eclat or streaming"),
+    max_len: int = Form(0, description="Maximum itemset size (0 = unbounded)"),
+    workers: int = Form(0, description="Processes for partitioned itemset mining (0 = server default, 1 = serial)"),
+    approximate: bool = Form(False, description="Mine a random sample of the bills; rules carry support/confidence/lift intervals"),
+    sample_fraction: float = Form(SAMPLE_FRACTION, description="Share of the bills sampled in approximate mode"),
+    verify_sample: bool = Form(False, description="Approximate mode: check the sample's itemsets in one pass over all bills (exact rules)"),
+    dataset: str = Form(DEFAULT_DATASET, description="Dataset to mine (see /datasets)")
+) -> Dict[str, Any]:
+    return {
+        "min_support": min_support,
+        "min_confidence": min_confidence,
+        "max_rules": max_rules,
+        "top_k": top_k,
+        "sheet_name": sheet_name,
+        "item_column": item_column,
+        "transaction_column": transaction_column,
+        "algorithm": algorithm,
+        "max_len": max_len,
+        "workers": workers,
+        "approximate": approximate,
+        "sample_fraction": sample_fraction,
+        "verify_sample": verify_sample,
+        "dataset": dataset,
+    }
+
+async def ingested_sheet_meta(path: str, sheet_name: str) -> Dict[str, Any]:
+    # Sheet metadata from the ingest cache. A sheet that is not cached yet is
+    # parsed by a job in the mining process pool, like mining itself, so a
+    # first-time openpyxl parse never ties up the web server's threads.
+    from ingest import ingest_sheet, sheet_header, sheet_meta, workbook_fingerprint
+
+    header = await run_in_threadpool(sheet_header, path, sheet_name)
+    if not header["exact"]:
+        sha256 = (await run_in_threadpool(workbook_fingerprint, path))["sha256"]
+        try:
+            job, deduplicated = JOBS.submit(("ingest", sha256, sheet_name), ingest_sheet, path, sheet_name, progress=report_progress)
+        except JobQueueFull as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        logger.info(f"{'Joining' if deduplicated else 'Started'} ingest job {job.id} for sheet '{sheet_name}'")
+        await JOBS.wait(job)
+    return await run_in_threadpool(sheet_meta, path, sheet_name)
+
+async def prepare_mining(params: Dict[str, Any], exact_item_column: bool = False) -> Dict[str, Any]:
+    # Validates a mining request and resolves its columns and cache keys.
+    # exact_item_column keeps the requested item column even when ITEMNAME exists.
+    from engines import ENGINES, PARALLEL_WORKERS
+    from incremental import DeltaLog
+
+    min_support, min_confidence = params["min_support"], params["min_confidence"]
+    sheet_name, algorithm, max_len = params["sheet_name"], params["algorithm"], params["max_len"]
+    item_column, transaction_column = params["item_column"], params["transaction_column"]
+    logger.info(f"Processing rules with params: support={min_support}, confidence={min_confidence}, sheet={sheet_name}, algorithm={algorithm}, max_len={max_len}")
+    
+    if algorithm not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown algorithm '{algorithm}'. Choose one of: {', '.join(ENGINES)}")
+    if max_len < 0:
+        raise HTTPException(status_code=400, detail="max_len must be 0 (unbounded) or a positive integer")
+    if params["workers"] < 0:
+        raise HTTPException(status_code=400, detail="workers must be 0 (server default) or a positive integer")
+    if params["top_k"] < 0:
+        raise HTTPException(status_code=400, detail="top_k must be 0 (all rules) or a positive integer")
+    if params["approximate"] and not 0.0 < params["sample_fraction"] <= 1.0:
+        raise HTTPException(status_code=400, detail="sample_fraction must be in (0, 1]")
+    
+    # Sheet metadata comes from the ingest cache; the workbook is only parsed when it changes
+    path = dataset_path(params["dataset"])
+    meta = await ingested_sheet_meta(path, sheet_name)
+    columns = [column["name"] for column in meta["columns"]]
+    
+    # Log data shape
+    logger.info(f"Data shape: ({meta['rows']}, {len(columns)})")
+    
+    # Always use ITEMNAME column if available, otherwise use provided item_column
+    if "ITEMNAME" in columns and not exact_item_column:
+        item_column = "ITEMNAME"
+        logger.info("Using ITEMNAME column for product identification")
+    else:
+        logger.info(f"ITEMNAME column not found, using provided column: {item_column}")
+        
+    # Ensure required columns exist
+    if item_column not in columns:
+        raise HTTPException(status_code=400, detail=f"Item column '{item_column}' not found")
+    if transaction_column not in columns:
+        raise HTTPException(status_code=400, detail=f"Transaction column '{transaction_column}' not found")
+    if item_column == transaction_column:
+        raise HTTPException(status_code=400, detail="The item and transaction columns must differ")
+    
+    # The engine is not part of the result key because every engine yields the same itemsets.
+    # Delta rows accepted by /mine-rules/incremental are mined with the sheet, so
+    # the dataset key also names how many delta batches there are.
+    source_key = (meta["fingerprint"]["sha256"], sheet_name, transaction_column, item_column)
+    deltas = await run_in_threadpool(DeltaLog(source_key).count)
+    dataset_key = source_key + ((("deltas", deltas),) if deltas else ())
+    result_key = dataset_key + (min_support, min_confidence, params["max_rules"], max_len or None, params["top_k"])
+    sampling = {}
+    if params["approximate"]:
+        # Sampled runs are reproducible (fixed seed), so they are cached like any other
+        sampling = {"sample_fraction": params["sample_fraction"], "verify": params["verify_sample"], "seed": SAMPLE_SEED}
+        result_key += (("approximate", params["sample_fraction"], params["verify_sample"], SAMPLE_SEED),)
+    return {
+        "source_key": source_key,
+        "dataset_key": dataset_key,
+        "result_key": result_key,
+        "approximate": bool(sampling),
+        "kwargs": {
+            "path": path,
+            "sheet_name": sheet_name,
+            "transaction_column": transaction_column,
+            "item_column": item_column,
+            "min_support": min_support,
+            "min_confidence": min_confidence,
+            "max_rules": params["max_rules"],
+            "top_k": params["top_k"],
+            "algorithm": algorithm,
+            "max_len": max_len or None,
+            # Not part of the result key: partitioned mining finds the same itemsets
+            "workers": params["workers"] or PARALLEL_WORKERS,
+            "deltas": (source_key, deltas) if deltas else None,
+            **sampling,
+        },
+    }
+
+def submit_mining(prepared: Dict[str, Any], profile: bool = False):
+    # Queues a mining run in the process pool (or joins an identical one in flight)
+    # and fills the caches when it completes. Profiled runs are never shared.
+    from mining import mine_sample, mine_sheet
+    from shared import RECOMMENDATIONS
+
+    kwargs = prepared["kwargs"]
+    dataset_key, result_key = prepared["dataset_key"], prepared["result_key"]
+    
+    if prepared["approximate"]:
+        # Sampled runs mine their own itemsets and build no recommendation index
+        mine, extra = mine_sample, {}
+    else:
+        # Itemsets mined earlier at a lower (or equal) support are filtered instead of re-mined.
+        # A run capped by max_rules only generates the rules it returns; the full
+        # recommendation index is then built by a job of its own.
+        mine, extra = mine_sheet, {
+            "itemsets": ITEMSET_CACHE.lookup(dataset_key, kwargs["min_support"], kwargs["max_len"]),
+            "index": not kwargs["max_rules"],
+        }
+    
+    def store(result):
+        if result["itemsets"] is not None:
+            ITEMSET_CACHE.store(dataset_key, kwargs["min_support"], kwargs["max_len"], result["itemsets"])
+        RESULT_CACHE.put(result_key, result["rules"])
+        # Every completed full run refreshes the in-memory recommendation index for its sheet
+        if result["index"] is not None:
+            RECOMMENDATIONS.publish((dataset_key[0], kwargs["sheet_name"]), result["index"])
+        elif not prepared["approximate"]:
+            submit_index(prepared)
+        METRICS.observe_stages(result["timings"])
+    
+    key = result_key + (("profile", time.time()),) if profile else result_key
+    try:
+        return JOBS.submit(
+            key, mine, progress=report_progress, on_done=store, profile=profile, **extra, **kwargs
+        )
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+def submit_index(prepared: Dict[str, Any]):
+    # Queues the build of a sheet's full recommendation index, for a mining run
+    # that was capped by max_rules and so generated only the rules it returned
+    from mining import mine_index
+    from shared import RECOMMENDATIONS
+
+    kwargs = prepared["kwargs"]
+    dataset_key = prepared["dataset_key"]
+    key = ("index",) + dataset_key + (kwargs["min_support"], kwargs["min_confidence"], kwargs["max_len"], kwargs["top_k"])
+    
+    def publish(result):
+        RECOMMENDATIONS.publish((dataset_key[0], kwargs["sheet_name"]), result["index"])
+        METRICS.observe_stages(result["timings"])
+    
+    try:
+        JOBS.submit(
+            key, mine_index, progress=report_progress, on_done=publish,
+            itemsets=ITEMSET_CACHE.lookup(dataset_key, kwargs["min_support"], kwargs["max_len"]), **kwargs
+        )
+    except JobQueueFull:
+        logger.warning(f"Job queue is full; the recommendation index of {kwargs['sheet_name']} is not rebuilt")
+
+async def mined_rules(prepared: Dict[str, Any], profile: bool = False):
+    # Returns the rules, the stage timings of the run that produced them and its
+    # job (None for a cache hit). Identical requests are answered from the result cache.
+    if not profile:
+        start = time.perf_counter()
+        rules_list = RESULT_CACHE.get(prepared["result_key"])
+        if rules_list is not None:
+            logger.info(f"Result cache hit, returning {len(rules_list)} rules")
+            return rules_list, [{"stage": "cache", "seconds": time.perf_counter() - start, "desc": "hit"}], None
+    
+    # The CPU-bound work runs in the mining process pool so the event loop stays free
+    job, deduplicated = submit_mining(prepared, profile=profile)
+    if deduplicated:
+        logger.info(f"Joining identical in-flight job {job.id}")
+    result = await JOBS.wait(job)
+    return result["rules"], list(result["timings"]), job
+
+def profiling_requested(request: Request) -> bool:
+    # A single request can ask for a cProfile capture with "X-Profile: 1"
+    if request.headers.get("X-Profile", "").lower() not in ("1", "true"):
+        return False
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled; start the server with ENABLE_PROFILING=1")
+    return True
+
+def timed_json(content: Any, stages: List[Dict[str, Any]]) -> Response:
+    # Serializes explicitly (with the fast encoder) so the serialize stage is measured too
+    start = time.perf_counter()
+    response = Response(content=dumps(content), media_type="application/json")
+    serialize = {"stage": "serialize", "seconds": time.perf_counter() - start, "bytes": len(response.body)}
+    METRICS.observe_stages([serialize])
+    response.headers["Server-Timing"] = server_timing(stages + [serialize])
+    return response
+
+@app.post("/mine-rules")
+async def mine_rules(request: Request, params: Dict[str, Any] = Depends(mining_form)):
+    profile = profiling_requested(request)
+    try:
+        prepared = await prepare_mining(params)
+        rules_list, stages, job = await mined_rules(prepared, profile=profile)
+        response = timed_json(rules_list, stages)
+        if profile:
+            response.headers["X-Profile-Id"] = job.id
+        return response
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Error processing rules: {str(e)}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=error_msg)
+
+@app.post("/mine-rules/incremental")
+async def mine_rules_incremental(
+    params: Dict[str, Any] = Depends(mining_form),
+    file: UploadFile = File(..., description="New transaction rows (.xlsx or .csv) with the transaction and item columns"),
+    verify: bool = Form(False, description="Also recompute the itemsets in full and report whether they match")
 ):
+    # Folds a batch of new bills into the counts kept from the previous run for the
+    # same dataset, support and max_len, instead of mining the whole year again
+    from incremental import delta_digest
+    from ingest import read_rows
+    from mining import mine_incremental
+    from shared import RECOMMENDATIONS
+
     try:
-        logger.info(f"Processing rules with params: support={min_support}, confidence={min_confidence}, sheet={sheet_name}")
+        if params["approximate"]:
+            raise HTTPException(status_code=400, detail="Approximate mining is not available for incremental updates")
+        prepared = await prepare_mining(params)
+        kwargs = prepared["kwargs"]
+        columns = [kwargs["transaction_column"], kwargs["item_column"]]
+        try:
+            delta = await run_in_threadpool(read_rows, file.file, file.filename or "", columns)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Could not read delta rows: {str(e)}")
+        # Keyed by the sheet without its deltas: the state takes in the delta log itself
+        state_key = (prepared["source_key"], kwargs["min_support"], kwargs["max_len"])
         
-        # Read the Excel file
-        df = pd.read_excel(EXCEL_FILE, sheet_name=sheet_name)
+        def store(result):
+            RECOMMENDATIONS.publish((prepared["dataset_key"][0], kwargs["sheet_name"]), result["index"])
+            METRICS.observe_stages(result["timings"])
         
-        # Log data shape
-        logger.info(f"Data shape: {df.shape}")
-        
-        # Always use ITEMNAME column if available, otherwise use provided item_column
-        if "ITEMNAME" in df.columns:
-            item_column = "ITEMNAME"
-            logger.info("Using ITEMNAME column for product identification")
-        else:
-            logger.info(f"ITEMNAME column not found, using provided column: {item_column}")
-            
-        # Ensure required columns exist
-        if item_column not in df.columns:
-            raise HTTPException(status_code=400, detail=f"Item column '{item_column}' not found")
-        if transaction_column not in df.columns:
-            raise HTTPException(status_code=400, detail=f"Transaction column '{transaction_column}' not found")
-            
-        # Print unique values in the item column (first 10) for verification
-        unique_items = df[item_column].unique()
-        logger.info(f"Sample of unique items from {item_column}: {', '.join(str(x) for x in unique_items[:10])}")
-        
-        # Filter only needed columns for efficiency
-        df = df[[transaction_column, item_column]].dropna()
+        # The states live in this process, so the job runs on the manager's thread
+        # pool rather than in a worker process, still under its queue limit.
+        # An identical delta already in flight is joined rather than applied twice.
+        key = ("incremental",) + state_key + (delta_digest(delta), kwargs["min_confidence"], kwargs["max_rules"], verify, kwargs["top_k"])
+        try:
+            job, _ = JOBS.submit(
+                key, mine_incremental, state_key, delta,
+                path=kwargs["path"], sheet_name=kwargs["sheet_name"],
+                transaction_column=kwargs["transaction_column"], item_column=kwargs["item_column"],
+                min_support=kwargs["min_support"], min_confidence=kwargs["min_confidence"],
+                max_rules=kwargs["max_rules"], max_len=kwargs["max_len"], verify=verify, top_k=kwargs["top_k"],
+                progress=report_progress, on_done=store, in_process=True,
+            )
+        except JobQueueFull as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        result = await JOBS.wait(job)
+        return timed_json({"rules": result["rules"], "stats": result["stats"], "state": result["state"]}, list(result["timings"]))
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Error processing rules: {str(e)}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=error_msg)
+
+def parse_list(text: str, name: str, cast=str) -> List[Any]:
+    # Comma-separated form values, duplicates dropped, order kept
+    values = []
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        try:
+            value = cast(part.strip())
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid value '{part.strip()}' in {name}")
+        if value not in values:
+            values.append(value)
+    return values
+
+@app.post("/mine-rules/sweep")
+async def mine_rules_sweep(
+    params: Dict[str, Any] = Depends(mining_form),
+    supports: str = Form("", description="Comma-separated min_support values (default: min_support)"),
+    confidences: str = Form("", description="Comma-separated min_confidence values (default: min_confidence)"),
+    sheet_names: str = Form("", description="Comma-separated sheets to sweep (default: sheet_name)"),
+    item_columns: str = Form("", description="Comma-separated item columns to sweep (default: item_column)")
+):
+    # The whole support x confidence grid for each sheet / item column from a single
+    # mining pass at the grid's lowest support, with per-cell rule counts and rules
+    from mining import mine_sweep
+
+    support_grid = parse_list(supports, "supports", float) or [params["min_support"]]
+    confidence_grid = parse_list(confidences, "confidences", float) or [params["min_confidence"]]
+    if params["approximate"]:
+        raise HTTPException(status_code=400, detail="Approximate mining is not available for sweeps")
+    if len(support_grid) * len(confidence_grid) > MAX_SWEEP_CELLS:
+        raise HTTPException(status_code=400, detail=f"The grid has more than {MAX_SWEEP_CELLS} cells")
+    if not all(0.0 < value <= 1.0 for value in support_grid + confidence_grid):
+        raise HTTPException(status_code=400, detail="Support and confidence values must be in (0, 1]")
+    sheets = parse_list(sheet_names, "sheet_names") or [params["sheet_name"]]
+    columns = parse_list(item_columns, "item_columns")
+    
+    try:
+        submitted = []
+        for sheet_name in sheets:
+            for item_column in columns or [params["item_column"]]:
+                target = {**params, "sheet_name": sheet_name, "item_column": item_column, "min_support": min(support_grid)}
+                prepared = await prepare_mining(target, exact_item_column=bool(columns))
+                kwargs = {key: value for key, value in prepared["kwargs"].items() if key not in ("min_support", "min_confidence")}
+                dataset_key = prepared["dataset_key"]
+                
+                def store(result, dataset_key=dataset_key, kwargs=kwargs):
+                    if result["itemsets"] is not None:
+                        ITEMSET_CACHE.store(dataset_key, result["mined_support"], kwargs["max_len"], result["itemsets"])
+                    # Every cell answers a later /mine-rules request with the same parameters
+                    for cell in result["cells"]:
+                        RESULT_CACHE.put(
+                            dataset_key + (cell["min_support"], cell["min_confidence"], kwargs["max_rules"], kwargs["max_len"], kwargs["top_k"]),
+                            cell["rules"],
+                        )
+                    METRICS.observe_stages(result["timings"])
+                
+                key = ("sweep",) + dataset_key + (tuple(sorted(support_grid)), tuple(sorted(confidence_grid)), kwargs["max_rules"], kwargs["max_len"], kwargs["top_k"])
+                itemsets = ITEMSET_CACHE.lookup(dataset_key, min(support_grid), kwargs["max_len"])
+                try:
+                    job, _ = JOBS.submit(
+                        key, mine_sweep, supports=support_grid, confidences=confidence_grid, itemsets=itemsets,
+                        progress=report_progress, on_done=store, **kwargs
+                    )
+                except JobQueueFull as e:
+                    raise HTTPException(status_code=429, detail=str(e))
+                submitted.append((sheet_name, kwargs["item_column"], job))
         
-        # Create the basket format - use optimized method for larger datasets
-        if df.shape[0] > 10000:
-            # For larger datasets: group first, then one-hot encode
-            logger.info("Using optimized method for large dataset")
-            basket = df.groupby([transaction_column, item_column]).size().reset_index(name='count')
-            basket_wide = basket.pivot_table(index=transaction_column, columns=item_column, values='count', fill_value=0)
-            basket_encoded = (basket_wide > 0).astype(int)
-        else:
-            # For smaller datasets: use cross-tab approach
-            logger.info("Using standard method for dataset")
-            basket_encoded = pd.crosstab(df[transaction_column], df[item_column])
-            basket_encoded = (basket_encoded > 0).astype(int)
+        targets, stages = [], []
+        for (sheet_name, item_column, job), result in zip(submitted, await asyncio.gather(*(JOBS.wait(job) for _, _, job in submitted))):
+            targets.append({
+                "sheet_name": sheet_name,
+                "item_column": item_column,
+                "mined_support": result["mined_support"],
+                "cells": result["cells"],
+            })
+            stages.extend(result["timings"])
+        return timed_json({"supports": sorted(support_grid), "confidences": sorted(confidence_grid), "targets": targets}, stages)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Error processing rules: {str(e)}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=error_msg)
+
+@app.post("/mine-rules/segments")
+async def mine_rules_segments(
+    params: Dict[str, Any] = Depends(mining_form),
+    segment_by: str = Form(..., description="Column to split bills on, e.g. REGION or BRANCH; date columns split by month"),
+    segment_period: str = Form("", description="Split a date (or date text) column by D, W, M, Q or Y")
+):
+    # Rules per region/branch/month. Each segment is cached by its own content, so
+    # after a workbook edit only the segments whose bills changed are mined again.
+    from ingest import sheet_meta
+    from mining import mine_segments
+    from segments import SEGMENT_PERIODS
+
+    try:
+        if params["approximate"]:
+            raise HTTPException(status_code=400, detail="Approximate mining is not available for segments")
+        prepared = await prepare_mining(params)
+        # Delta rows carry no segment column, so segments are mined from the sheet alone
+        kwargs = {key: value for key, value in prepared["kwargs"].items() if key != "deltas"}
+        meta = await run_in_threadpool(sheet_meta, kwargs["path"], kwargs["sheet_name"])
+        if segment_by not in [column["name"] for column in meta["columns"]]:
+            raise HTTPException(status_code=400, detail=f"Segment column '{segment_by}' not found")
+        if segment_by in (kwargs["transaction_column"], kwargs["item_column"]):
+            raise HTTPException(status_code=400, detail="The segment column must differ from the item and transaction columns")
+        if segment_period and segment_period not in SEGMENT_PERIODS:
+            raise HTTPException(status_code=400, detail=f"segment_period must be one of: {', '.join(SEGMENT_PERIODS)}")
         
-        logger.info(f"Basket shape: {basket_encoded.shape}")
+        # Segment results do not depend on the workbook, only on the segment's bills
+        segment_params = (
+            kwargs["transaction_column"], kwargs["item_column"], segment_by, segment_period, kwargs["min_support"],
+            kwargs["min_confidence"], kwargs["max_rules"], kwargs["max_len"], kwargs["top_k"],
+        )
+        known = SEGMENT_CACHE.known(segment_params)
         
-        # Apply Apriori algorithm
-        frequent_itemsets = apriori(basket_encoded, min_support=min_support, use_colnames=True)
-        logger.info(f"Found {len(frequent_itemsets)} frequent itemsets")
+        def store(result):
+            for entry in result["segments"]:
+                if entry["result"] is not None:
+                    SEGMENT_CACHE.put(segment_params, entry["digest"], entry["result"])
+            METRICS.observe_stages(result["timings"])
         
-        # Generate association rules
-        rules_list = []
-        if len(frequent_itemsets) > 0:
-            rules = association_rules(frequent_itemsets, metric="confidence", min_threshold=min_confidence)
-            logger.info(f"Generated {len(rules)} association rules")
-            
-            # Process rules and ensure at least 5 consequents per product
-            product_to_rules = {}
-            
-            # First pass: organize rules by product
-            for _, rule in rules.iterrows():
-                antecedents = list(rule['antecedents'])
-                consequents = list(rule['consequents'])
-                
-                # Log a sample of the generated rules for debugging
-                if _ < 5:  # Log first 5 rules
-                    logger.info(f"Rule {_}: {antecedents} -> {consequents}")
-                
-                # Ensure we're only working with single-item antecedents for clear recommendations
-                if len(antecedents) == 1:
-                    product = antecedents[0]
-                    
-                    if product not in product_to_rules:
-                        product_to_rules[product] = []
-                        
-                    product_to_rules[product].append({
-                        "antecedents": antecedents,
-                        "consequents": consequents,
-                        "support": float(rule['support']),
-                        "confidence": float(rule['confidence']),
-                        "lift": float(rule['lift'])
-                    })
-            
-            logger.info(f"Rules organized for {len(product_to_rules)} unique products")
-            
-            # Second pass: ensure minimum of 5 consequents per product
-            all_products = df[item_column].unique()
-            
-            for product in all_products:
-                if product not in product_to_rules or sum(len(rule["consequents"]) for rule in product_to_rules[product]) < 5:
-                    # We need more consequents for this product
-                    logger.info(f"Finding more consequents for product: {product}")
-                    
-                    # Get transactions containing this product
-                    transactions_with_product = set(df[df[item_column] == product][transaction_column])
-                    
-                    if transactions_with_product:
-                        # Find items that co-occur with this product
-                        co_occurring = df[
-                            df[transaction_column].isin(transactions_with_product) & 
-                            (df[item_column] != product)
-                        ]
-                        
-                        if not co_occurring.empty:
-                            # Count co-occurrences
-                            co_occurring_counts = co_occurring[item_column].value_counts()
-                            
-                            # Calculate metrics
-                            total_txns = df[transaction_column].nunique()
-                            product_txns = len(transactions_with_product)
-                            
-                            # Create new rules for top co-occurring items
-                            new_rules = []
-                            for co_item, count in co_occurring_counts.items():
-                                # Skip if already in our rules
-                                if product in product_to_rules and any(
-                                    co_item in rule["consequents"] for rule in product_to_rules[product]
-                                ):
-                                    continue
-                                
-                                # Calculate metrics
-                                support = count / total_txns
-                                confidence = count / product_txns
-                                
-                                # Calculate lift
-                                co_item_txns = df[df[item_column] == co_item][transaction_column].nunique()
-                                expected = (product_txns / total_txns) * (co_item_txns / total_txns)
-                                lift = (support / expected) if expected > 0 else 1.0
-                                
-                                new_rules.append({
-                                    "antecedents": [product],
-                                    "consequents": [co_item],
-                                    "support": float(support),
-                                    "confidence": float(confidence),
-                                    "lift": float(lift)
-                                })
-                            
-                            # Sort by lift and take top rules
-                            new_rules.sort(key=lambda x: x["lift"], reverse=True)
-                            
-                            # Add to product rules
-                            if product not in product_to_rules:
-                                product_to_rules[product] = []
-                            
-                            # Calculate how many more rules we need
-                            current_consequents = sum(len(rule["consequents"]) for rule in product_to_rules[product])
-                            needed = max(0, 5 - current_consequents)
-                            
-                            # Add as many new rules as needed
-                            product_to_rules[product].extend(new_rules[:needed])
-            
-            # Combine all rules
-            for product_rules in product_to_rules.values():
-                rules_list.extend(product_rules)
-                
-            # Log a sample of the final rules for debugging
-            for i, rule in enumerate(rules_list[:5]):
-                logger.info(f"Final rule {i}: {rule['antecedents']} -> {rule['consequents']}")
-            
-            # Sort by lift and limit to max_rules
-            rules_list.sort(key=lambda x: x["lift"], reverse=True)
-            if max_rules > 0 and len(rules_list) > max_rules:
-                rules_list = rules_list[:max_rules]
-                
-            logger.info(f"Returning {len(rules_list)} rules")
+        try:
+            job, _ = JOBS.submit(
+                ("segments",) + prepared["result_key"] + (segment_by, segment_period), mine_segments,
+                segment_by=segment_by, segment_period=segment_period or None, known=tuple(known), progress=report_progress, on_done=store, **kwargs
+            )
+        except JobQueueFull as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        result = await JOBS.wait(job)
         
-        return rules_list
+        segments = []
+        for entry in result["segments"]:
+            cached = entry["result"] is None
+            segments.append({"segment": entry["segment"], "cached": cached, **(known[entry["digest"]] if cached else entry["result"])})
+        return timed_json({
+            "segment_by": segment_by,
+            "segments": segments,
+            "mined": sum(not segment["cached"] for segment in segments),
+        }, result["timings"])
     
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = f"Error processing rules: {str(e)}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=error_msg)
+
+@app.post("/rules")
+async def query_rules(
+    params: Dict[str, Any] = Depends(mining_form),
+    antecedent: Optional[str] = Query(None, description="Only rules with this product among the antecedents"),
+    consequent: Optional[str] = Query(None, description="Only rules with this product among the consequents"),
+    min_lift: Optional[float] = Query(None, description="Only rules with at least this lift"),
+    min_rule_confidence: Optional[float] = Query(None, description="Only rules with at least this confidence"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=0, description=f"Page size (max {MAX_PAGE_SIZE}; 0 = all, NDJSON only)"),
+    format: str = Query("json", description="json (one page) or ndjson (one rule per line, streamed once mining has finished)")
+):
+    # Filtered, cursor-paginated view over the rules of a mining request (max_rules=0 for all of them).
+    # The result cache holds the rule columns; filters run on the columns and a
+    # page (or the NDJSON stream, a page at a time) gets item names as it is
+    # sent. Rules are ranked by lift over the whole result, so the first line
+    # still waits for the mining run when the result is not cached.
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    if format == "json" and not 0 < limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE} for JSON pages")
+    try:
+        prepared = await prepare_mining(params)
+        rules_list, stages, _ = await mined_rules(prepared)
+        filters = {
+            "antecedent": antecedent,
+            "consequent": consequent,
+            "min_lift": min_lift,
+            "min_confidence": min_rule_confidence,
+        }
+        try:
+            positions, total, next_cursor = paginate(rules_list, prepared["result_key"], filters, cursor=cursor, limit=limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = f"Error processing rules: {str(e)}"
         logger.error(error_msg)
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=error_msg)
+    
+    if format == "ndjson":
+        headers = {"X-Total-Count": str(total), "Server-Timing": server_timing(stages)}
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        return StreamingResponse(ndjson_lines(rules_list, positions), media_type="application/x-ndjson", headers=headers)
+    return timed_json({"rules": select_rules(rules_list, positions), "total": total, "next_cursor": next_cursor}, stages)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(params: Dict[str, Any] = Depends(mining_form)):
+    prepared = await prepare_mining(params)
+    cached = RESULT_CACHE.get(prepared["result_key"])
+    if cached is not None:
+        job, deduplicated = JOBS.completed(prepared["result_key"], {"rules": cached}), False
+    else:
+        job, deduplicated = submit_mining(prepared)
+    return {**job.to_dict(), "deduplicated": deduplicated}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Error processing rules: {job.error}")
+    if not job.finished:
+        return JSONResponse(status_code=202, content=job.to_dict())
+    # Mining jobs return their rules; ingest jobs a summary of the parsed sheets
+    if "rules" in job.result:
+        return Response(content=dumps(job.result["rules"]), media_type="application/json")
+    if "segments" in job.result:
+        return Response(content=dumps({"segments": job.result["segments"]}), media_type="application/json")
+    if "cells" in job.result:
+        return Response(content=dumps({"mined_support": job.result["mined_support"], "cells": job.result["cells"]}), media_type="application/json")
+    return job.result
+
+@app.get("/recommendations/{product}")
+async def get_recommendations(
+    product: str,
+    k: int = Query(5, ge=0, description="Number of recommendations per product (0 = all)"),
+    sort: str = Query("lift", description="Sort metric: lift, confidence or support"),
+    similarity: str = Query("cosine", description="Item similarity of the similar items: cosine or jaccard"),
+    prefix: bool = Query(False, description="Treat product as a case-insensitive name prefix"),
+    limit: int = Query(20, ge=1, description="Maximum number of products matched in prefix mode"),
+    sheet_name: Optional[str] = Query(None, description="Sheet whose index to use (default: most recently mined)"),
+    dataset: str = Query(DEFAULT_DATASET, description="Dataset the sheet belongs to")
+):
+    from ingest import workbook_fingerprint
+    from recommend import SORT_METRICS
+    from shared import RECOMMENDATIONS
+    from similarity import SIMILARITY_METRICS
+
+    if sort not in SORT_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort metric '{sort}'. Choose one of: {', '.join(SORT_METRICS)}")
+    if similarity not in SIMILARITY_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown similarity '{similarity}'. Choose one of: {', '.join(SIMILARITY_METRICS)}")
+    if sheet_name is None:
+        index = RECOMMENDATIONS.latest()
+    else:
+        fingerprint = await run_in_threadpool(workbook_fingerprint, dataset_path(dataset))
+        index = RECOMMENDATIONS.get((fingerprint["sha256"], sheet_name))
+    if index is None:
+        raise HTTPException(status_code=404, detail="No recommendation index yet; run /mine-rules for this sheet first")
+    
+    if prefix:
+        matches = index.search(product, limit=limit)
+        return {
+            "prefix": product,
+            "matches": [
+                {
+                    "product": name,
+                    "recommendations": index.recommend(name, k=k, sort=sort),
+                    "similar": index.similar(name, k=k, metric=similarity),
+                }
+                for name in matches
+            ],
+            "index": index.describe(),
+        }
+    # Long-tail products without rules are still answered from the similarity index
+    if product not in index and not index.has_similar(product):
+        raise HTTPException(status_code=404, detail={
+            "message": f"No recommendations for product '{product}'",
+            "suggestions": index.search(product[:3], limit=10) if product else [],
+        })
+    return {
+        "product": product,
+        "recommendations": index.recommend(product, k=k, sort=sort),
+        "similar": index.similar(product, k=k, metric=similarity),
+        "index": index.describe(),
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(METRICS.expose(), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, sort: str = Query("cumulative", description="pstats sort key"), limit: int = Query(50, ge=1)):
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled; start the server with ENABLE_PROFILING=1")
+    if not profile_id.isalnum():
+        raise HTTPException(status_code=400, detail="Invalid profile id")
+    try:
+        report = await run_in_threadpool(profile_report, profile_id, sort, limit)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown sort key '{sort}'")
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Profile '{profile_id}' not found")
+    return PlainTextResponse(report)
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    return {
+        "results": RESULT_CACHE.stats(),
+        "itemsets": ITEMSET_CACHE.stats(),
+        "segments": SEGMENT_CACHE.stats(),
+        "incremental": incremental_states().stats(),
+        "jobs": JOBS.stats(),
+    }
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
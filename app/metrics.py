@@ -0,0 +1,207 @@
+import bisect
+import cProfile
+import io
+import logging
+import os
+import pstats
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# cProfile captures are only taken when this is enabled; they are written here
+PROFILING_ENABLED = os.environ.get("ENABLE_PROFILING", "0") == "1"
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", Path(tempfile.gettempdir()) / "mining-profiles"))
+
+# Seconds; spans a cached request (sub-millisecond) to a full-year apriori run
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_CLEAR_REFS = Path("/proc/self/clear_refs")
+_STATUS = Path("/proc/self/status")
+
+
+def _reset_peak_rss() -> bool:
+    # Linux lets a process reset its own peak RSS (VmHWM), which makes the peak per stage
+    try:
+        _CLEAR_REFS.write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss() -> Optional[int]:
+    try:
+        for line in _STATUS.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+
+        # Lifetime peak only (kilobytes on Linux) when VmHWM cannot be reset
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return None
+
+
+class StageRecorder:
+    # Wall time, peak RSS and counts of each stage of one mining run. Stages run
+    # one at a time inside a worker process, so the peak RSS belongs to the stage.
+    def __init__(self):
+        self.stages: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, Any]]:
+        entry: Dict[str, Any] = {"stage": name}
+        _reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["seconds"] = time.perf_counter() - start
+            entry["peak_rss_bytes"] = _peak_rss()
+            self.stages.append(entry)
+            counts = ", ".join(f"{key}={value}" for key, value in entry.items() if key not in ("stage", "seconds", "peak_rss_bytes"))
+            peak = f"{entry['peak_rss_bytes'] / 2 ** 20:.1f} MiB" if entry["peak_rss_bytes"] else "n/a"
+            logger.info(f"Stage {name}: {entry['seconds']:.3f}s, peak RSS {peak}" + (f", {counts}" if counts else ""))
+
+
+def server_timing(stages: List[Dict[str, Any]]) -> str:
+    # Server-Timing header value, durations in milliseconds
+    parts = []
+    for entry in stages:
+        part = f"{entry['stage']};dur={entry['seconds'] * 1000:.1f}"
+        if entry.get("desc"):
+            part += f';desc="{entry["desc"]}"'
+        parts.append(part)
+    return ", ".join(parts)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    # Last observed value per label set
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.request_seconds = Histogram(
+            "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+        )
+        self.stage_seconds = Histogram("mining_stage_duration_seconds", "Wall time of each mining stage", ("stage",))
+        self.stage_peak_rss = Gauge("mining_stage_peak_rss_bytes", "Peak resident memory during the last run of each stage", ("stage",))
+        self.stage_counts = Gauge("mining_stage_count", "Rows, itemsets or rules produced by the last run of each stage", ("stage", "kind"))
+        # Callables returning {label value: value} for gauges read at scrape time (cache and job stats)
+        self._collectors: List[Tuple[str, str, str, Callable[[], Dict[str, float]]]] = []
+
+    def observe_stages(self, stages: List[Dict[str, Any]]) -> None:
+        for entry in stages:
+            self.stage_seconds.observe(entry["seconds"], entry["stage"])
+            if entry.get("peak_rss_bytes"):
+                self.stage_peak_rss.set(entry["peak_rss_bytes"], entry["stage"])
+            for key, value in entry.items():
+                if key not in ("stage", "seconds", "peak_rss_bytes", "desc") and isinstance(value, (int, float)):
+                    self.stage_counts.set(value, entry["stage"], key)
+
+    def register_collector(self, name: str, documentation: str, label: str, collect: Callable[[], Dict[str, float]]) -> None:
+        self._collectors.append((name, documentation, label, collect))
+
+    def expose(self) -> str:
+        lines: List[str] = []
+        for metric in (self.request_seconds, self.stage_seconds, self.stage_peak_rss, self.stage_counts):
+            lines.extend(metric.expose())
+        for name, documentation, label, collect in self._collectors:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in sorted(collect().items()):
+                lines.append(f"{name}{_labels((label,), (key,))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def profile_path(profile_id: str) -> Path:
+    return PROFILE_DIR / f"{profile_id}.prof"
+
+
+def profile_call(profile_id: str, fn: Callable, *args, **kwargs) -> Any:
+    # Runs fn under cProfile and keeps the stats on disk for /profiles/{id}
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        profiler.dump_stats(str(profile_path(profile_id)))
+        logger.info(f"Saved profile {profile_path(profile_id)}")
+
+
+def profile_report(profile_id: str, sort: str = "cumulative", limit: int = 50) -> Optional[str]:
+    path = profile_path(profile_id)
+    if not path.exists():
+        return None
+    out = io.StringIO()
+    stats = pstats.Stats(str(path), stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+METRICS = Metrics()
@@ -0,0 +1,683 @@
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from basket import Basket, encode_basket
+from cooccurrence import CoOccurrence, backfill_consequents
+from engines import MAX_PARALLEL_WORKERS, frequent_itemsets, itemsets_frame, min_support_count
+from incremental import INCREMENTAL, DeltaLog, IncrementalMiner
+from ingest import load_sheet
+from metrics import StageRecorder
+from recommend import RecommendationIndex
+from rule_table import RuleRows, RuleTable, single_antecedent_rules, top_single_antecedent_rules
+from sampling import (
+    CONFIDENCE_LEVEL, SAMPLE_FRACTION, SAMPLE_SEED, add_intervals, count_in_chunks, lowered_support, negative_border, sample_basket,
+)
+from segments import segment_digest, split_basket
+from similarity import SimilarityIndex
+from txstore import SHARED_DATASETS, open_pair_counts, open_store, store_supported, use_transaction_store
+
+logger = logging.getLogger(__name__)
+
+MIN_CONSEQUENTS = 5
+
+# One lock per incremental state key: concurrent first requests for a key build
+# its state once, without holding up incremental requests for other datasets
+_incremental_locks: Dict[tuple, threading.Lock] = {}
+_incremental_locks_guard = threading.Lock()
+
+
+def load_transactions(
+    path: str,
+    sheet_name: str,
+    transaction_column: str,
+    item_column: str,
+    deltas: Optional[Tuple[tuple, int]] = None,
+    columns: Sequence[str] = (),
+) -> pd.DataFrame:
+    # Only the two needed columns (and any extra columns) are loaded from the
+    # columnar cache, text columns as categoricals over the cached dictionary
+    # codes. deltas is (dataset key, batch count): the first batches of the
+    # dataset's DeltaLog, appended after the sheet's rows.
+    df = load_sheet(path, sheet_name, columns=[transaction_column, item_column, *columns], categorical=True)
+
+    # Print unique values in the item column (first 10) for verification
+    unique_items = df[item_column].unique()
+    logger.info(f"Sample of unique items from {item_column}: {', '.join(str(x) for x in unique_items[:10])}")
+
+    # Rows without a bill or an item cannot take part in a basket
+    df = df.dropna(subset=[transaction_column, item_column])
+    if deltas:
+        dataset_key, count = deltas
+        batches = DeltaLog(dataset_key).read(0, count)
+        df = pd.concat([df] + [batch[[transaction_column, item_column]].dropna() for batch in batches], ignore_index=True)
+    return df
+
+
+def generate_rules(basket: Basket, itemsets: pd.DataFrame, min_confidence: float, top_k: int = 0) -> RuleTable:
+    # Only the single-item antecedent rules (clear recommendations) are generated,
+    # grouped by product; with top_k, only each product's top_k by lift.
+    # Rules hold item ids until decode_rules attaches the names.
+    table = single_antecedent_rules(itemsets, basket.shape[1], min_confidence, top_k=top_k)
+    logger.info(f"Generated {len(table)} association rules")
+    # Log a sample of the generated rules for debugging
+    for i in range(min(5, len(table))):
+        logger.info(f"Rule {i}: [{table.antecedent[i]}] -> {table.consequents[i]}")
+    logger.info(f"Rules organized for {len(np.unique(table.antecedent))} unique products")
+    return table
+
+
+def generation_limit(top_k: int, max_rules: int = 0) -> int:
+    # Rules per product to generate for a final top_k, or without one for the
+    # final top max_rules, which can hold at most max_rules rules of any product.
+    # A product with fewer than MIN_CONSEQUENTS rules is never cut, and one cut
+    # to MIN_CONSEQUENTS rules still has enough consequents, so the back-fill
+    # sees the same products short of consequents as it would with every rule.
+    limit = top_k if top_k > 0 else max_rules
+    return max(limit, MIN_CONSEQUENTS) if limit > 0 else 0
+
+
+def top_rules(basket: Basket, itemsets: pd.DataFrame, min_confidence: float, max_rules: int, top_k: int = 0) -> Tuple[RuleTable, np.ndarray]:
+    # Only the rules that can make the max_rules highest-lift rules (see
+    # top_single_antecedent_rules), and per item id whether the product is
+    # short of consequents, so that only those products need a back-fill
+    table, short = top_single_antecedent_rules(
+        itemsets, basket.shape[1], min_confidence, max_rules,
+        top_k=top_k, limit=generation_limit(top_k, max_rules), min_consequents=MIN_CONSEQUENTS,
+    )
+    logger.info(f"Generated {len(table)} association rules that can make the top {max_rules}")
+    return table, short
+
+
+def backfill_rules(
+    basket: Basket,
+    table: RuleTable,
+    products: Any,
+    cooccurrence: Optional[CoOccurrence] = None,
+    top_k: int = 0,
+) -> RuleTable:
+    # Second pass: ensure minimum of 5 consequents per product, using
+    # item-pair statistics computed for all pairs in one sparse pass
+    if cooccurrence is None:
+        cooccurrence = CoOccurrence(basket)
+    added = backfill_consequents(table, products, cooccurrence, min_consequents=MIN_CONSEQUENTS)
+    logger.info(f"Added {len(added)} co-occurrence rules for products with fewer than {MIN_CONSEQUENTS} consequents")
+    # Each product's added rules follow its mined ones; products that only have
+    # added rules come after all the others. top_k then keeps each product's best
+    # rules, mined or added.
+    return table.concat(added).grouped().limit_per_antecedent(top_k)
+
+
+def decode_rules(table: RuleTable, basket: Basket, max_rules: int = 0) -> RuleRows:
+    # The max_rules highest-lift rules (0 = all), best first. Item names are
+    # attached as the rules are read (see RuleRows), not here.
+    # The table holds every rule, or only the candidates for the top max_rules
+    # when it was built with max_rules (build_rules, mine_sheet with index=False).
+    rules_list = RuleRows(table, basket.items, table.top(max_rules))
+    # Log a sample of the final rules for debugging
+    for i, rule in enumerate(rules_list[:5]):
+        logger.info(f"Final rule {i}: {rule['antecedents']} -> {rule['consequents']}")
+    return rules_list
+
+
+def build_rules(
+    basket: Basket,
+    itemsets: pd.DataFrame,
+    min_confidence: float,
+    products: Any,
+    progress: Optional[Callable[[str, float], None]] = None,
+    cooccurrence: Optional[CoOccurrence] = None,
+    top_k: int = 0,
+    max_rules: int = 0,
+) -> RuleTable:
+    # products are item ids. With max_rules the table only holds what
+    # decode_rules(table, basket, max_rules) returns (and the rules of products
+    # short of consequents), which is the same as from the table of every rule.
+    if len(itemsets) == 0:
+        return RuleTable.empty()
+    if max_rules > 0:
+        table, short = top_rules(basket, itemsets, min_confidence, max_rules, top_k=top_k)
+        products = [product for product in products if short[product]]
+    else:
+        table = generate_rules(basket, itemsets, min_confidence, top_k=generation_limit(top_k))
+    if progress:
+        progress("backfill", 0.8)
+    return backfill_rules(basket, table, products, cooccurrence=cooccurrence, top_k=top_k)
+
+
+def _load_basket(
+    timings: StageRecorder,
+    path: str,
+    sheet_name: str,
+    transaction_column: str,
+    item_column: str,
+    algorithm: str,
+    workers: int,
+    progress: Optional[Callable[[str, float], None]] = None,
+    deltas: Optional[Tuple[tuple, int]] = None,
+) -> Tuple[Basket, str, int, bool]:
+    # The sheet's basket (plus any delta batches), with the engine and workers
+    # to mine it with and whether the basket is the sheet's on-disk transaction
+    # store. The stores hold the sheet's rows only, so deltas are encoded in memory.
+    if progress:
+        progress("loading", 0.05)
+    if not deltas and use_transaction_store(path, sheet_name, transaction_column, item_column):
+        # Too large to hold in memory: the basket is memory-mapped from the
+        # on-disk store and mined in chunks by the streaming engine
+        with timings.stage("read") as stage:
+            basket = open_store(path, sheet_name, transaction_column, item_column)
+            stage["desc"] = "transaction store"
+            stage["transactions"], stage["items"] = basket.shape
+        if algorithm != "streaming" or workers > 1:
+            logger.info(f"Mining the transaction store with the streaming engine instead of {algorithm} ({workers} workers)")
+        return basket, "streaming", 1, True
+    if not deltas and SHARED_DATASETS and store_supported(path, sheet_name, transaction_column, item_column):
+        # Encoded once for every server process; the processes share its pages
+        with timings.stage("read") as stage:
+            basket = open_store(path, sheet_name, transaction_column, item_column)
+            stage["desc"] = "shared transaction store"
+            stage["transactions"], stage["items"] = basket.shape
+        return basket, algorithm, workers, True
+
+    _, basket = _read_basket(timings, path, sheet_name, transaction_column, item_column, progress, deltas)
+    return basket, algorithm, workers, False
+
+
+def _read_basket(
+    timings: StageRecorder,
+    path: str,
+    sheet_name: str,
+    transaction_column: str,
+    item_column: str,
+    progress: Optional[Callable[[str, float], None]] = None,
+    deltas: Optional[Tuple[tuple, int]] = None,
+    columns: Sequence[str] = (),
+) -> Tuple[pd.DataFrame, Basket]:
+    # The rows (with any extra columns) and their basket encoded in memory, for
+    # _load_basket and for callers that need columns the stores do not hold
+    with timings.stage("read") as stage:
+        df = load_transactions(path, sheet_name, transaction_column, item_column, deltas, columns)
+        stage["rows"] = len(df)
+        if deltas:
+            stage["desc"] = f"{deltas[1]} delta batches"
+
+    # Create the basket format as a sparse boolean transaction x item matrix
+    if progress:
+        progress("encoding", 0.15)
+    with timings.stage("encode") as stage:
+        basket = encode_basket(df, transaction_column, item_column)
+        stage["transactions"], stage["items"] = basket.shape
+    return df, basket
+
+
+def mine_sheet(
+    path: str,
+    sheet_name: str,
+    transaction_column: str,
+    item_column: str,
+    min_support: float,
+    min_confidence: float,
+    max_rules: int,
+    algorithm: str = "apriori",
+    max_len: Optional[int] = None,
+    itemsets: Optional[pd.DataFrame] = None,
+    progress: Optional[Callable[[str, float], None]] = None,
+    workers: int = 1,
+    top_k: int = 0,
+    deltas: Optional[Tuple[tuple, int]] = None,
+    index: bool = True,
+) -> Dict[str, Any]:
+    # top_k (0 = all) bounds the rules kept per product, which also bounds the
+    # rules generated, back-filled and indexed. Returns the top max_rules rules,
+    # the per-product recommendation index built from every kept rule (not only
+    # the max_rules returned), the per-stage timings, and, when they had to be
+    # mined, the frequent itemsets ("itemsets" is None when the caller supplied
+    # reusable ones). The index needs every rule, so max_rules only bounds the
+    # work with index=False: then only the rules that can make the top max_rules
+    # are generated, only products short of consequents are back-filled, and
+    # "index" is None (mine_index builds it on its own).
+    timings = StageRecorder()
+    basket, algorithm, workers, stored = _load_basket(
+        timings, path, sheet_name, transaction_column, item_column, algorithm, workers, progress, deltas
+    )
+    logger.info(f"Basket shape: {basket.shape}")
+
+    mined = None
+    if progress:
+        progress("frequent_itemsets", 0.25)
+    with timings.stage("frequent_itemsets") as stage:
+        if itemsets is None:
+            # Mine frequent itemsets with the selected engine; all engines return the same itemsets
+            itemsets = mined = frequent_itemsets(basket, min_support, algorithm=algorithm, max_len=max_len, workers=workers)
+            logger.info(f"Found {len(itemsets)} frequent itemsets using {algorithm}")
+            if workers > 1:
+                stage["desc"] = f"{workers} workers"
+        else:
+            stage["desc"] = "reused"
+            logger.info(f"Reusing {len(itemsets)} cached frequent itemsets")
+        stage["itemsets"] = len(itemsets)
+
+    if progress:
+        progress("rules", 0.6)
+    bounded = not index and max_rules > 0
+    products = basket.first_seen
+    with timings.stage("rules") as stage:
+        # Without any frequent itemset there are no rules to back-fill either
+        if not len(itemsets):
+            table = None
+        elif bounded:
+            table, short = top_rules(basket, itemsets, min_confidence, max_rules, top_k=top_k)
+            products = [product for product in products if short[product]]
+            stage["desc"] = f"top {max_rules}"
+        else:
+            table = generate_rules(basket, itemsets, min_confidence, top_k=generation_limit(top_k))
+        stage["rules"] = len(table) if table is not None else 0
+    if progress:
+        progress("backfill", 0.8)
+    cooccurrence = None
+    with timings.stage("backfill") as stage:
+        if table is not None and (len(products) or not bounded):
+            # A store keeps its item pair counts, so they are only counted once
+            counts = open_pair_counts(path, sheet_name, transaction_column, item_column, basket) if stored else None
+            cooccurrence = CoOccurrence(basket, counts=counts)
+            table = backfill_rules(basket, table, products, cooccurrence=cooccurrence, top_k=top_k)
+        elif table is None:
+            table = RuleTable.empty()
+        stage["rules"] = len(table)
+
+    if bounded:
+        with timings.stage("decode") as stage:
+            rules_list = decode_rules(table, basket, max_rules)
+            stage["rules"] = len(rules_list)
+        logger.info(f"Returning {len(rules_list)} rules")
+        return {"rules": rules_list, "itemsets": mined, "index": None, "timings": timings.stages}
+
+    if progress:
+        progress("similarity", 0.85)
+    with timings.stage("similarity") as stage:
+        # Reuses the back-fill's pair counts when there are any, or the store's
+        if cooccurrence is None and stored:
+            cooccurrence = CoOccurrence(basket, counts=open_pair_counts(path, sheet_name, transaction_column, item_column, basket))
+        similarity = SimilarityIndex(basket, cooccurrence=cooccurrence)
+        stage["items"] = len(similarity)
+
+    if progress:
+        progress("indexing", 0.9)
+    with timings.stage("index") as stage:
+        index = RecommendationIndex(table, basket.items, source={
+            "sheet_name": sheet_name, "item_column": item_column, "transaction_column": transaction_column,
+            "min_support": min_support, "min_confidence": min_confidence, "max_len": max_len, "top_k": top_k,
+        }, similarity=similarity)
+        stage["products"] = len(index)
+    with timings.stage("decode") as stage:
+        rules_list = decode_rules(table, basket, max_rules)
+        stage["rules"] = len(rules_list)
+    logger.info(f"Returning {len(rules_list)} rules")
+    return {"rules": rules_list, "itemsets": mined, "index": index, "timings": timings.stages}
+
+
+def mine_index(*args, **kwargs) -> Dict[str, Any]:
+    # The recommendation index of a mine_sheet run, without its rules ("rules"
+    # is None), for a run that was made with index=False
+    result = mine_sheet(*args, **{**kwargs, "index": True})
+    result["rules"] = None
+    return result
+
+
+def mine_sample(
+    path: str,
+    sheet_name: str,
+    transaction_column: str,
+    item_column: str,
+    min_support: float,
+    min_confidence: float,
+    max_rules: int,
+    algorithm: str = "apriori",
+    max_len: Optional[int] = None,
+    progress: Optional[Callable[[str, float], None]] = None,
+    workers: int = 1,
+    top_k: int = 0,
+    sample_fraction: float = SAMPLE_FRACTION,
+    verify: bool = False,
+    seed: int = SAMPLE_SEED,
+    deltas: Optional[Tuple[tuple, int]] = None,
+) -> Dict[str, Any]:
+    # Approximate mining from a random sample of sample_fraction of the bills.
+    # Without verify, the rules are the sample's, each with intervals
+    # (support_ci, confidence_ci, lift_ci) for its metrics over the whole sheet.
+    # With verify (Toivonen), the sample is mined at a lowered support and those
+    # itemsets plus their negative border are counted exactly in one pass over
+    # every bill; if no border itemset turns out frequent, nothing frequent was
+    # missed and the rules are exact, otherwise the sheet is mined in full. No
+    # recommendation index is built ("index" is None).
+    timings = StageRecorder()
+    basket, algorithm, workers, _ = _load_basket(
+        timings, path, sheet_name, transaction_column, item_column, algorithm, workers, progress, deltas
+    )
+    with timings.stage("sample") as stage:
+        sample = sample_basket(basket, sample_fraction, seed)
+        stage["transactions"] = sample.n_transactions
+    sample_support = lowered_support(min_support, sample.n_transactions) if verify else min_support
+
+    if progress:
+        progress("frequent_itemsets", 0.25)
+    with timings.stage("frequent_itemsets") as stage:
+        itemsets = frequent_itemsets(sample, sample_support, algorithm=algorithm, max_len=max_len, workers=workers)
+        stage["desc"] = f"sample at support {sample_support:.6g}"
+        stage["itemsets"] = len(itemsets)
+    logger.info(f"Found {len(itemsets)} frequent itemsets in a sample of {sample.n_transactions} of {basket.n_transactions} bills")
+
+    exact = False
+    if verify:
+        if progress:
+            progress("verify", 0.45)
+        with timings.stage("verify") as stage:
+            candidates = [tuple(sorted(itemset)) for itemset in itemsets["itemsets"]]
+            border = negative_border(candidates, basket.shape[1], max_len)
+            counts = count_in_chunks(basket, candidates + border)
+            min_count = min_support_count(min_support, basket.n_transactions)
+            missed = int((counts[len(candidates):] >= min_count).sum())
+            stage["candidates"], stage["border"], stage["missed"] = len(candidates), len(border), missed
+            if missed:
+                # The sample hid frequent itemsets: fall back to mining every bill
+                logger.info(f"{missed} negative border itemsets are frequent; mining all {basket.n_transactions} bills")
+                stage["desc"] = "full mining"
+                itemsets = frequent_itemsets(basket, min_support, algorithm=algorithm, max_len=max_len, workers=workers)
+            else:
+                found = [(candidate, int(count)) for candidate, count in zip(candidates, counts) if count >= min_count]
+                itemsets = itemsets_frame(found, basket.n_transactions)
+            stage["itemsets"] = len(itemsets)
+        exact = True
+
+    rules_basket = basket if exact else sample
+    if progress:
+        progress("rules", 0.6)
+    with timings.stage("rules") as stage:
+        table = build_rules(rules_basket, itemsets, min_confidence, basket.first_seen, top_k=top_k, max_rules=max_rules)
+        stage["rules"] = len(table)
+    with timings.stage("decode") as stage:
+        rules_list = decode_rules(table, rules_basket, max_rules).to_list()
+        # Exact rules get zero-width intervals
+        add_intervals(rules_list, rules_basket.n_transactions, 1.0 if exact else sample.n_transactions / basket.n_transactions)
+        stage["rules"] = len(rules_list)
+    logger.info(f"Returning {len(rules_list)} {'verified' if exact else 'approximate'} rules")
+    return {
+        "rules": rules_list,
+        "itemsets": None,
+        "index": None,
+        "sample": {"transactions": sample.n_transactions, "of": basket.n_transactions, "verified": exact, "confidence_level": CONFIDENCE_LEVEL},
+        "timings": timings.stages,
+    }
+
+
+def mine_sweep(
+    path: str,
+    sheet_name: str,
+    transaction_column: str,
+    item_column: str,
+    supports: List[float],
+    confidences: List[float],
+    max_rules: int,
+    algorithm: str = "apriori",
+    max_len: Optional[int] = None,
+    itemsets: Optional[pd.DataFrame] = None,
+    progress: Optional[Callable[[str, float], None]] = None,
+    workers: int = 1,
+    top_k: int = 0,
+    deltas: Optional[Tuple[tuple, int]] = None,
+) -> Dict[str, Any]:
+    # Every (support, confidence) cell of a grid from one read, one encode and
+    # one itemset pass at the lowest support: the itemsets of a higher support
+    # are a filter of those, and the item-pair statistics for the back-fill do
+    # not depend on either threshold. Each cell's rules are the ones mine_sheet
+    # returns for the same parameters.
+    timings = StageRecorder()
+    basket, algorithm, workers, stored = _load_basket(
+        timings, path, sheet_name, transaction_column, item_column, algorithm, workers, progress, deltas
+    )
+
+    lowest = min(supports)
+    mined = None
+    if progress:
+        progress("frequent_itemsets", 0.25)
+    with timings.stage("frequent_itemsets") as stage:
+        if itemsets is None:
+            itemsets = mined = frequent_itemsets(basket, lowest, algorithm=algorithm, max_len=max_len, workers=workers)
+        else:
+            stage["desc"] = "reused"
+        stage["itemsets"] = len(itemsets)
+    logger.info(f"Sweep over {len(supports)}x{len(confidences)} cells from {len(itemsets)} itemsets at support {lowest}")
+
+    cells = []
+    with timings.stage("rules") as stage:
+        counts = open_pair_counts(path, sheet_name, transaction_column, item_column, basket) if stored else None
+        cooccurrence = CoOccurrence(basket, counts=counts)
+        for i, min_support in enumerate(sorted(supports)):
+            if progress:
+                progress("rules", 0.6 + 0.35 * i / len(supports))
+            cell_itemsets = itemsets[itemsets["support"].to_numpy() >= min_support].reset_index(drop=True)
+            for min_confidence in sorted(confidences):
+                table = build_rules(
+                    basket, cell_itemsets, min_confidence, basket.first_seen, cooccurrence=cooccurrence, top_k=top_k
+                )
+                cells.append({
+                    "min_support": min_support,
+                    "min_confidence": min_confidence,
+                    "itemsets": len(cell_itemsets),
+                    "rule_count": len(table),
+                    "products": len(np.unique(table.antecedent)),
+                    "rules": decode_rules(table, basket, max_rules),
+                })
+        stage["cells"] = len(cells)
+    return {"cells": cells, "mined_support": lowest, "itemsets": mined, "timings": timings.stages}
+
+
+def mine_segment(
+    basket: Basket,
+    min_support: float,
+    min_confidence: float,
+    max_rules: int,
+    algorithm: str = "apriori",
+    max_len: Optional[int] = None,
+    top_k: int = 0,
+) -> Dict[str, Any]:
+    # One segment's basket mined as mine_sheet mines a sheet, without the index
+    itemsets = frequent_itemsets(basket, min_support, algorithm=algorithm, max_len=max_len)
+    table = build_rules(basket, itemsets, min_confidence, basket.first_seen, top_k=top_k)
+    return {
+        "transactions": basket.n_transactions,
+        "items": basket.shape[1],
+        "itemsets": len(itemsets),
+        "rule_count": len(table),
+        "products": len(np.unique(table.antecedent)),
+        "rules": decode_rules(table, basket, max_rules),
+    }
+
+
+def mine_segments(
+    path: str,
+    sheet_name: str,
+    transaction_column: str,
+    item_column: str,
+    segment_by: str,
+    min_support: float,
+    min_confidence: float,
+    max_rules: int,
+    algorithm: str = "apriori",
+    max_len: Optional[int] = None,
+    progress: Optional[Callable[[str, float], None]] = None,
+    workers: int = 1,
+    top_k: int = 0,
+    known: Iterable[str] = (),
+    segment_period: Optional[str] = None,
+) -> Dict[str, Any]:
+    # Rules per value of segment_by (per segment_period, by default month, for dates). The sheet is
+    # read and encoded once; each segment is a slice of that basket, mined in its
+    # own process when workers > 1. Segments whose digest is in known (already
+    # mined with these parameters) are not mined again; their "result" is None.
+    # The segment column is not in the transaction stores, so the rows are
+    # always read and encoded in memory
+    timings = StageRecorder()
+    if progress:
+        progress("loading", 0.05)
+    df, basket = _read_basket(timings, path, sheet_name, transaction_column, item_column, progress, columns=[segment_by])
+    with timings.stage("split") as stage:
+        segments = [(segment, sub, segment_digest(sub)) for segment, sub in split_basket(df, basket, transaction_column, item_column, segment_by, segment_period)]
+        stage["segments"] = len(segments)
+
+    known = set(known)
+    todo = [sub for _, sub, digest in segments if digest not in known]
+    if progress:
+        progress("frequent_itemsets", 0.25)
+    with timings.stage("mine") as stage:
+        mine = partial(
+            mine_segment, min_support=min_support, min_confidence=min_confidence, max_rules=max_rules,
+            algorithm=algorithm, max_len=max_len, top_k=top_k,
+        )
+        workers = max(1, min(workers, MAX_PARALLEL_WORKERS, len(todo)))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                mined = list(pool.map(mine, todo))
+            stage["desc"] = f"{workers} workers"
+        else:
+            mined = [mine(sub) for sub in todo]
+        stage["segments"] = len(todo)
+    logger.info(f"Mined {len(todo)} of {len(segments)} {segment_by} segments, {len(segments) - len(todo)} unchanged")
+
+    results = iter(mined)
+    return {
+        "segments": [
+            {"segment": segment, "digest": digest, "result": None if digest in known else next(results)}
+            for segment, _, digest in segments
+        ],
+        "timings": timings.stages,
+    }
+
+
+def incremental_state(
+    path: str,
+    sheet_name: str,
+    transaction_column: str,
+    item_column: str,
+    min_support: float,
+    max_len: Optional[int] = None,
+    deltas: Optional[Tuple[tuple, int]] = None,
+) -> IncrementalMiner:
+    # The starting point for incremental mining: the sheet, with the delta
+    # batches logged so far, mined once in full. A sheet read from its
+    # transaction store starts from the store's item pair counts.
+    basket, _, _, stored = _load_basket(StageRecorder(), path, sheet_name, transaction_column, item_column, "eclat", 1, deltas=deltas)
+    counts = open_pair_counts(path, sheet_name, transaction_column, item_column, basket) if stored else None
+    state = IncrementalMiner(
+        basket, basket.decode(basket.first_seen), transaction_column, item_column, min_support, max_len, pair_counts=counts
+    )
+    state.logged = deltas[1] if deltas else 0
+    return state
+
+
+def mine_delta(
+    state: IncrementalMiner,
+    delta: pd.DataFrame,
+    sheet_name: str,
+    min_confidence: float,
+    max_rules: int,
+    verify: bool = False,
+    top_k: int = 0,
+    progress: Optional[Callable[[str, float], None]] = None,
+) -> Dict[str, Any]:
+    # Folds new transaction rows into the state and rebuilds the rules from the
+    # updated itemset and pair counts; the history is not mined again
+    timings = StageRecorder()
+    if progress:
+        progress("delta", 0.3)
+    with timings.stage("delta") as stage:
+        stats = state.apply(delta)
+        basket = state.basket()
+        itemsets = state.itemsets_frame()
+        stage["rows"], stage["itemsets"] = len(delta), len(itemsets)
+    logger.info(f"Incremental update: {len(itemsets)} frequent itemsets over {basket.n_transactions} transactions")
+    if progress:
+        progress("rules", 0.6)
+    with timings.stage("rules") as stage:
+        cooccurrence = CoOccurrence(basket, counts=state.pair_counts)
+        products = [state.item_index[product] for product in state.products]
+        table = build_rules(basket, itemsets, min_confidence, products, progress=progress, cooccurrence=cooccurrence, top_k=top_k)
+        stage["rules"] = len(table)
+    if progress:
+        progress("indexing", 0.9)
+    with timings.stage("index") as stage:
+        index = RecommendationIndex(table, basket.items, source={
+            "sheet_name": sheet_name, "item_column": state.item_column, "transaction_column": state.transaction_column,
+            "min_support": state.min_support, "min_confidence": min_confidence, "max_len": state.max_len, "top_k": top_k,
+            "incremental_batches": state.batches,
+        }, similarity=SimilarityIndex(basket, cooccurrence=cooccurrence))
+        stage["products"] = len(index)
+    if verify:
+        with timings.stage("verify"):
+            stats["verified"] = state.verify()
+    with timings.stage("decode") as stage:
+        rules_list = decode_rules(table, basket, max_rules)
+        stage["rules"] = len(rules_list)
+    return {"rules": rules_list, "index": index, "stats": stats, "state": state.describe(), "timings": timings.stages}
+
+
+def mine_incremental(
+    state_key: tuple,
+    delta: pd.DataFrame,
+    path: str,
+    sheet_name: str,
+    transaction_column: str,
+    item_column: str,
+    min_support: float,
+    min_confidence: float,
+    max_rules: int,
+    max_len: Optional[int] = None,
+    verify: bool = False,
+    top_k: int = 0,
+    progress: Optional[Callable[[str, float], None]] = None,
+) -> Dict[str, Any]:
+    # Applies a delta to the live state for these parameters, creating it from the sheet on first use.
+    # state_key is (dataset key, min_support, max_len); the delta is first
+    # written to the dataset's DeltaLog, so it outlives the state: a state
+    # rebuilt after an eviction or a restart, the states of other server
+    # processes and /mine-rules all include it. The states live in this process,
+    # so this runs as an in-process job (JobManager.submit(in_process=True)).
+    dataset_key = state_key[0]
+    log = DeltaLog(dataset_key)
+    with _incremental_locks_guard:
+        lock = _incremental_locks.setdefault(state_key, threading.Lock())
+    with lock:
+        state = INCREMENTAL.get(state_key)
+        if state is None:
+            if progress:
+                progress("loading", 0.05)
+            logged = log.count()
+            state = incremental_state(
+                path, sheet_name, transaction_column, item_column, min_support, max_len, (dataset_key, logged) if logged else None
+            )
+            INCREMENTAL.put(state_key, state)
+    with state.lock:
+        try:
+            # Batches logged by other processes since this state was built are
+            # applied first, so that every process applies them in the same order
+            replayed = 0
+            while True:
+                for batch in log.read(state.logged):
+                    state.apply(batch)
+                    state.logged += 1
+                    replayed += 1
+                if log.append(delta, state.logged):
+                    break
+            state.logged += 1
+            result = mine_delta(state, delta, sheet_name, min_confidence, max_rules, verify=verify, top_k=top_k, progress=progress)
+        except Exception:
+            # A state that failed part way through a batch is rebuilt from the log next time
+            INCREMENTAL.discard(state_key)
+            raise
+    result["stats"]["replayed_batches"] = replayed
+    return result
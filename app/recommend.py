@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+from basket import item_value, text_keys
+from rule_table import RuleTable
+from similarity import SimilarityIndex
+
+SORT_METRICS = ("lift", "confidence", "support")
+MAX_INDEXES = 8
+
+
+class RecommendationIndex:
+    # Single-antecedent rules grouped by product, pre-sorted once per metric so a
+    # lookup is a binary search plus a slice. Built in the mining worker from the
+    # final rule table, including the co-occurrence backfill: every rule, or each
+    # product's top_k highest-lift rules when the request set top_k.
+    # Consequents stay item ids; only the recommendations returned are given
+    # names. The item similarity index, when given, is served alongside the rules.
+    # All state is numpy arrays (arrays()), so an index can be written once and
+    # attached by other processes from memory-mapped files (from_arrays).
+    def __init__(
+        self,
+        table: RuleTable,
+        items: Sequence[Any],
+        source: Optional[Dict[str, Any]] = None,
+        similarity: Optional[SimilarityIndex] = None,
+    ):
+        product_ids = np.unique(table.antecedent)
+        # Product names arrive as URL path strings, so products are looked up by text
+        names = text_keys([items[i] for i in product_ids])
+        by_name = np.argsort(names, kind="stable")
+        product_ids, names = product_ids[by_name], names[by_name]
+
+        position_of = np.zeros(len(items), dtype=np.int64)
+        position_of[product_ids] = np.arange(len(product_ids))
+        owner = position_of[table.antecedent]
+        offsets = np.zeros(len(product_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owner, minlength=len(product_ids)), out=offsets[1:])
+        lengths = np.fromiter(map(len, table.consequents), dtype=np.int64, count=len(table))
+        consequent_offsets = np.zeros(len(table) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=consequent_offsets[1:])
+        consequent_ids = np.fromiter((item for rule in table.consequents for item in rule), dtype=np.int32, count=int(lengths.sum()))
+
+        # Case-insensitive prefix search over product names
+        lowered = np.char.lower(names) if len(names) else names
+        search_order = np.argsort(lowered, kind="stable").astype(np.int32)
+
+        arrays = {
+            "product_ids": product_ids.astype(np.int32),
+            "product_keys": names,
+            "offsets": offsets,
+            "consequent_ids": consequent_ids,
+            "consequent_offsets": consequent_offsets,
+            "search_keys": lowered[search_order],
+            "search_positions": search_order,
+        }
+        for metric in SORT_METRICS:
+            values = getattr(table, metric)
+            arrays[metric] = values
+            # Rule positions grouped by product, best first within each group
+            arrays[f"order_{metric}"] = np.lexsort((-values, owner)).astype(np.int32)
+        self._attach(items, arrays, {"source": dict(source or {}), "built_at": time.time()}, similarity)
+
+    @classmethod
+    def from_arrays(
+        cls, items: Sequence[Any], arrays: Dict[str, np.ndarray], meta: Dict[str, Any], similarity: Optional[SimilarityIndex] = None
+    ) -> "RecommendationIndex":
+        index = cls.__new__(cls)
+        index._attach(items, arrays, meta, similarity)
+        return index
+
+    def _attach(self, items: Sequence[Any], arrays: Dict[str, np.ndarray], meta: Dict[str, Any], similarity: Optional[SimilarityIndex]) -> None:
+        self.items = items
+        self._arrays = arrays
+        self.source = meta["source"]
+        self.built_at = meta["built_at"]
+        self.similarity = similarity
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return self._arrays
+
+    def meta(self) -> Dict[str, Any]:
+        return {"source": self.source, "built_at": self.built_at}
+
+    def __len__(self) -> int:
+        return len(self._arrays["product_ids"])
+
+    def _lookup(self, product: Any) -> Optional[int]:
+        keys = self._arrays["product_keys"]
+        key = str(product)
+        position = int(np.searchsorted(keys, key))
+        if position < len(keys) and keys[position] == key:
+            return position
+        return None
+
+    def _product(self, position: int) -> Any:
+        return item_value(self.items[self._arrays["product_ids"][position]])
+
+    @property
+    def products(self) -> List[Any]:
+        # Product names in name order
+        return [self._product(position) for position in range(len(self))]
+
+    def __contains__(self, product: Any) -> bool:
+        return self._lookup(product) is not None
+
+    def recommend(self, product: Any, k: int = 5, sort: str = "lift") -> List[Dict[str, Any]]:
+        if sort not in SORT_METRICS:
+            raise ValueError(f"Unknown sort metric '{sort}'. Choose one of: {', '.join(SORT_METRICS)}")
+        position = self._lookup(product)
+        if position is None:
+            return []
+        arrays = self._arrays
+        product = self._product(position)
+        start = arrays["offsets"][position]
+        end = arrays["offsets"][position + 1]
+        if k > 0:
+            end = min(end, start + k)
+        consequent_ids, consequent_offsets = arrays["consequent_ids"], arrays["consequent_offsets"]
+        return [
+            {
+                "antecedents": [product],
+                "consequents": [item_value(self.items[item]) for item in consequent_ids[consequent_offsets[i]:consequent_offsets[i + 1]]],
+                "support": float(arrays["support"][i]),
+                "confidence": float(arrays["confidence"][i]),
+                "lift": float(arrays["lift"][i]),
+            }
+            for i in arrays[f"order_{sort}"][start:end]
+        ]
+
+    def has_similar(self, product: Any) -> bool:
+        return self.similarity is not None and product in self.similarity
+
+    def similar(self, product: Any, k: int = 5, metric: str = "cosine") -> List[Dict[str, Any]]:
+        if self.similarity is None:
+            return []
+        return self.similarity.similar(product, k=k, metric=metric)
+
+    def search(self, prefix: str, limit: int = 20) -> List[Any]:
+        prefix = prefix.lower()
+        keys, positions = self._arrays["search_keys"], self._arrays["search_positions"]
+        matches = []
+        for i in range(int(np.searchsorted(keys, prefix)), len(keys)):
+            if not keys[i].startswith(prefix) or (limit > 0 and len(matches) >= limit):
+                break
+            matches.append(self._product(positions[i]))
+        return matches
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "products": len(self),
+            "rules": len(self._arrays["consequent_offsets"]) - 1,
+            "built_at": self.built_at,
+            "source": self.source,
+            "similarity": self.similarity.describe() if self.similarity is not None else None,
+        }
+
+
+class IndexRegistry:
+    # The most recently built index per dataset/sheet, served from memory
+    def __init__(self, max_indexes: int = MAX_INDEXES):
+        self.max_indexes = max_indexes
+        self._indexes: "OrderedDict[Hashable, RecommendationIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def publish(self, key: Hashable, index: RecommendationIndex) -> None:
+        with self._lock:
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+
+    def get(self, key: Hashable) -> Optional[RecommendationIndex]:
+        with self._lock:
+            return self._indexes.get(key)
+
+    def latest(self) -> Optional[RecommendationIndex]:
+        with self._lock:
+            return next(reversed(self._indexes.values()), None)
+
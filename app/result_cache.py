@@ -0,0 +1,197 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "64"))
+ITEMSET_CACHE_SIZE = int(os.environ.get("ITEMSET_CACHE_SIZE", "16"))
+SEGMENT_CACHE_SIZE = int(os.environ.get("SEGMENT_CACHE_SIZE", "256"))
+# Memory budget of each cache in bytes (0 = entry count only); one full-year
+# result with every rule is a few hundred MB, so the count alone does not bound it
+RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_BYTES", str(1 << 30)))
+ITEMSET_CACHE_BYTES = int(os.environ.get("ITEMSET_CACHE_BYTES", str(512 << 20)))
+SEGMENT_CACHE_BYTES = int(os.environ.get("SEGMENT_CACHE_BYTES", str(256 << 20)))
+
+# Elements of a long list that are measured to estimate the size of all of them
+SIZE_SAMPLE = 64
+
+
+def estimate_bytes(value: Any) -> int:
+    # Approximate memory held by a cached value: exact for numpy arrays and
+    # frames, extrapolated from a sample for long lists (rule lists hold rules
+    # of much the same shape), so sizing a large result stays cheap
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if hasattr(value, "memory_usage"):
+        # A pandas frame (usage per column) or series; pandas is only loaded by the mining code
+        usage = value.memory_usage(index=True, deep=True)
+        return int(np.sum(usage))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_bytes(key) + estimate_bytes(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return sys.getsizeof(value)
+        sample = value[::max(1, len(value) // SIZE_SAMPLE)][:SIZE_SAMPLE]
+        return sys.getsizeof(value) + sum(estimate_bytes(item) for item in sample) * len(value) // len(sample)
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, (int, np.integer)):
+        return int(nbytes)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    # Bounded mapping that evicts the least recently used entries, beyond
+    # max_entries or beyond max_bytes in total (0 = no byte limit), and counts
+    # hits/misses. A value larger than the whole byte budget is not kept.
+    def __init__(self, max_entries: int, max_bytes: int = 0, sizeof: Callable[[Any], int] = estimate_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def find(self, score: Callable[[Hashable, Any], Optional[float]]) -> Optional[Any]:
+        # The entry scoring highest (None = does not match), counted and refreshed
+        # like get(); for lookups that search the entries rather than name a key
+        with self._lock:
+            best, best_score = None, None
+            for key, value in self._entries.items():
+                value_score = score(key, value)
+                if value_score is not None and (best_score is None or value_score > best_score):
+                    best, best_score = key, value_score
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        # Sized outside the lock: measuring a large result takes a while
+        size = self._sizeof(value) if self.max_bytes > 0 else 0
+        with self._lock:
+            if self.max_bytes > 0 and size > self.max_bytes:
+                self.rejected += 1
+                return
+            self.bytes += size - self._sizes.get(key, 0)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries or (self.max_bytes > 0 and self.bytes > self.max_bytes):
+                evicted, _ = self._entries.popitem(last=False)
+                self.bytes -= self._sizes.pop(evicted)
+                self.evictions += 1
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._entries:
+                del self._entries[key]
+                self.bytes -= self._sizes.pop(key)
+
+    def values(self) -> List[Any]:
+        with self._lock:
+            return list(self._entries.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class ItemsetCache:
+    # Frequent itemsets per dataset, reusable for any request at the same or a
+    # higher support: every itemset frequent at s is in the result mined at
+    # s' <= s, so filtering the lower-threshold result is exact.
+    def __init__(self, max_entries: int, max_bytes: int = 0):
+        self._cache = LRUCache(max_entries, max_bytes)
+
+    def lookup(self, dataset_key: tuple, min_support: float, max_len: Optional[int]) -> Optional["pd.DataFrame"]:
+        def score(key: Hashable, entry: Dict[str, Any]) -> Optional[float]:
+            # The closest (highest) support at or below the requested one
+            if entry["dataset_key"] != dataset_key or entry["min_support"] > min_support:
+                return None
+            if entry["max_len"] is not None and (max_len is None or entry["max_len"] < max_len):
+                return None
+            return entry["min_support"]
+
+        best = self._cache.find(score)
+        if best is None:
+            return None
+        itemsets = best["itemsets"]
+        keep = itemsets["support"] >= min_support
+        if max_len is not None:
+            keep &= itemsets["itemsets"].map(len) <= max_len
+        return itemsets[keep].reset_index(drop=True)
+
+    def store(self, dataset_key: tuple, min_support: float, max_len: Optional[int], itemsets: "pd.DataFrame") -> None:
+        self._cache.put((dataset_key, min_support, max_len), {
+            "dataset_key": dataset_key,
+            "min_support": min_support,
+            "max_len": max_len,
+            "itemsets": itemsets,
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+class SegmentCache:
+    # Mined results of single segments (see segments.py), keyed by the mining
+    # parameters and the segment's content digest rather than the workbook's, so
+    # an edit to one month of a workbook leaves the other months' entries valid
+    def __init__(self, max_entries: int, max_bytes: int = 0):
+        self._cache = LRUCache(max_entries, max_bytes)
+
+    def known(self, params: tuple) -> Dict[str, Dict[str, Any]]:
+        # digest -> result of every cached segment mined with these parameters
+        return {entry["digest"]: entry["result"] for entry in self._cache.values() if entry["params"] == params}
+
+    def put(self, params: tuple, digest: str, result: Dict[str, Any]) -> None:
+        self._cache.put((params, digest), {"params": params, "digest": digest, "result": result})
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+RESULT_CACHE = LRUCache(RESULT_CACHE_SIZE, RESULT_CACHE_BYTES)
+ITEMSET_CACHE = ItemsetCache(ITEMSET_CACHE_SIZE, ITEMSET_CACHE_BYTES)
+SEGMENT_CACHE = SegmentCache(SEGMENT_CACHE_SIZE, SEGMENT_CACHE_BYTES)
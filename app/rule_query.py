@@ -0,0 +1,126 @@
+import base64
+import hashlib
+import json
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from result_cache import LRUCache
+from rule_table import DECODE_PAGE_ROWS, RuleRows
+
+try:
+    import orjson
+except ImportError:  # the standard library encoder is used instead
+    orjson = None
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
+
+# Positions of the rules matching a query, so later pages skip the filter pass
+_matches = LRUCache(32)
+
+
+def _encode_default(value: Any) -> Any:
+    # Types the JSON encoders do not know natively, encoded as jsonable_encoder would
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, RuleRows):
+        return value.to_list()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    # Compact UTF-8 JSON; orjson when it is installed (several times faster on
+    # large rule lists), otherwise the json module
+    if orjson is not None:
+        return orjson.dumps(content, default=_encode_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, default=_encode_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def query_fingerprint(result_key: Hashable, filters: Dict[str, Any]) -> str:
+    payload = json.dumps([repr(result_key), sorted(filters.items())], default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(offset: int, fingerprint: str) -> str:
+    raw = json.dumps({"o": offset, "q": fingerprint}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        offset, query = int(payload["o"]), payload["q"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Malformed cursor")
+    if query != fingerprint or offset < 0:
+        raise ValueError("Cursor does not belong to this query")
+    return offset
+
+
+def rule_matches(
+    rule: Dict[str, Any],
+    antecedent: Optional[str] = None,
+    consequent: Optional[str] = None,
+    min_lift: Optional[float] = None,
+    min_confidence: Optional[float] = None,
+) -> bool:
+    # Product filters compare as text so numeric item codes can be passed from a form
+    if antecedent is not None and antecedent not in [str(item) for item in rule["antecedents"]]:
+        return False
+    if consequent is not None and consequent not in [str(item) for item in rule["consequents"]]:
+        return False
+    if min_lift is not None and rule["lift"] < min_lift:
+        return False
+    if min_confidence is not None and rule["confidence"] < min_confidence:
+        return False
+    return True
+
+
+def matching_positions(rules: Sequence[Dict[str, Any]], fingerprint: str, filters: Dict[str, Any]) -> Sequence[int]:
+    positions = _matches.get(fingerprint)
+    if positions is None:
+        if isinstance(rules, RuleRows):
+            # Filtered on the rule columns, without decoding any rule
+            positions = rules.matching(**filters)
+        else:
+            positions = [i for i, rule in enumerate(rules) if rule_matches(rule, **filters)]
+        _matches.put(fingerprint, positions)
+    return positions
+
+
+def paginate(
+    rules: Sequence[Dict[str, Any]],
+    result_key: Hashable,
+    filters: Dict[str, Any],
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> Tuple[Sequence[int], int, Optional[str]]:
+    # Returns the positions of one page of filtered rules (limit 0 = all remaining),
+    # the filtered total and the cursor of the next page
+    fingerprint = query_fingerprint(result_key, filters)
+    offset = decode_cursor(cursor, fingerprint) if cursor else 0
+    positions = matching_positions(rules, fingerprint, filters)
+    end = len(positions) if limit <= 0 else min(len(positions), offset + limit)
+    next_cursor = encode_cursor(end, fingerprint) if end < len(positions) else None
+    return positions[offset:end], len(positions), next_cursor
+
+
+def select_rules(rules: Sequence[Dict[str, Any]], positions: Sequence[int]) -> List[Dict[str, Any]]:
+    if isinstance(rules, RuleRows):
+        return rules.select(positions)
+    return [rules[i] for i in positions]
+
+
+def ndjson_lines(rules: Sequence[Dict[str, Any]], positions: Sequence[int], page_rows: int = DECODE_PAGE_ROWS) -> Iterator[bytes]:
+    # One JSON document per line, sent page_rows rules at a time. A mined
+    # result (RuleRows) keeps the rule columns, and item names are attached to
+    # one page as it is encoded, so neither the decoded rules nor the encoded
+    # response are ever held in full.
+    for start in range(0, len(positions), max(1, page_rows)):
+        yield b"".join(dumps(rule) + b"\n" for rule in select_rules(rules, positions[start:start + page_rows]))
@@ -0,0 +1,418 @@
+import logging
+from collections import abc
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RULE_METRICS = ("support", "confidence", "lift")
+# Rules given names at a time when a RuleRows is read in order
+DECODE_PAGE_ROWS = 1000
+
+
+def top_per_group(groups: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+    # Positions (ascending) of the k highest scores of every group; ties keep
+    # the earliest positions. k <= 0 keeps everything.
+    if k <= 0 or len(groups) == 0:
+        return np.arange(len(groups))
+    order = np.lexsort((-scores, groups))
+    ranked_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, ranked_groups[1:] != ranked_groups[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return np.sort(order[rank < k])
+
+
+class RuleTable:
+    # Single-antecedent rules as columns: the antecedent item id of each rule, its
+    # consequent item ids (a sorted list per rule) and one float64 array per
+    # metric. Filtering, grouping and ranking work on the arrays; item names are
+    # only attached to the rules that are returned (to_dicts).
+    def __init__(
+        self,
+        antecedent: np.ndarray,
+        consequents: List[List[int]],
+        support: np.ndarray,
+        confidence: np.ndarray,
+        lift: np.ndarray,
+    ):
+        self.antecedent = np.asarray(antecedent, dtype=np.int64)
+        self.consequents = consequents
+        self.support = np.asarray(support, dtype=np.float64)
+        self.confidence = np.asarray(confidence, dtype=np.float64)
+        self.lift = np.asarray(lift, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.antecedent)
+
+    @classmethod
+    def empty(cls) -> "RuleTable":
+        return cls(np.empty(0, dtype=np.int64), [], np.empty(0), np.empty(0), np.empty(0))
+
+    def take(self, positions: Sequence[int]) -> "RuleTable":
+        positions = np.asarray(positions, dtype=np.int64)
+        return RuleTable(
+            self.antecedent[positions], [self.consequents[i] for i in positions],
+            self.support[positions], self.confidence[positions], self.lift[positions],
+        )
+
+    def concat(self, other: "RuleTable") -> "RuleTable":
+        return RuleTable(
+            np.concatenate([self.antecedent, other.antecedent]), self.consequents + other.consequents,
+            np.concatenate([self.support, other.support]),
+            np.concatenate([self.confidence, other.confidence]),
+            np.concatenate([self.lift, other.lift]),
+        )
+
+    def grouped(self) -> "RuleTable":
+        # Rules of a product together, products in order of their first rule,
+        # rules of one product in their current order
+        if len(self) == 0:
+            return self
+        products, first = np.unique(self.antecedent, return_index=True)
+        first_rule = first[np.searchsorted(products, self.antecedent)]
+        return self.take(np.argsort(first_rule, kind="stable"))
+
+    def limit_per_antecedent(self, k: int) -> "RuleTable":
+        # The k highest-lift rules of every product, in their current order (k <= 0 = all)
+        if k <= 0:
+            return self
+        return self.take(top_per_group(self.antecedent, self.lift, k))
+
+    def consequent_counts(self, n_items: int) -> np.ndarray:
+        # Total number of consequent items over the rules of each product
+        lengths = np.fromiter(map(len, self.consequents), dtype=np.int64, count=len(self))
+        return np.bincount(self.antecedent, weights=lengths, minlength=n_items).astype(np.int64)
+
+    def top(self, n: int) -> np.ndarray:
+        # Positions of the n highest-lift rules, best first; ties keep their
+        # current order (a stable sort by lift, truncated). n <= 0 means all.
+        keys = -self.lift
+        if 0 < n < len(self):
+            # Everything strictly above the n-th best lift, then the earliest ties
+            threshold = np.partition(keys, n - 1)[n - 1]
+            above = np.flatnonzero(keys < threshold)
+            tied = np.flatnonzero(keys == threshold)[:n - len(above)]
+            selected = np.concatenate([above, tied])
+            return selected[np.lexsort((selected, keys[selected]))]
+        return np.argsort(keys, kind="stable")
+
+    def to_dicts(self, items: Sequence[Any], positions: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+        # The API's rule objects, with item names, for the given positions (default: all)
+        selected = np.arange(len(self)) if positions is None else np.asarray(positions, dtype=np.int64)
+        antecedent = self.antecedent[selected].tolist()
+        support, confidence, lift = (self.support[selected].tolist(), self.confidence[selected].tolist(), self.lift[selected].tolist())
+        consequents = self.consequents
+        return [
+            {
+                "antecedents": [items[antecedent[row]]],
+                "consequents": [items[item] for item in consequents[i]],
+                "support": support[row],
+                "confidence": confidence[row],
+                "lift": lift[row],
+            }
+            for row, i in enumerate(selected.tolist())
+        ]
+
+
+class RuleRows(abc.Sequence):
+    # The rules of a table in output order (rows = table positions) as a
+    # read-only sequence of the API's rule dicts. Item names are only attached
+    # to the rows being read, so a cached result holds the columns, and a
+    # response that sends a page (or streams every rule) decodes as it goes.
+    def __init__(self, table: RuleTable, items: Sequence[Any], rows: np.ndarray):
+        self.table = table
+        self.items = items
+        self.rows = np.asarray(rows, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return self.select(np.arange(len(self))[index])
+        return self.select([index])[0]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for page in self.pages():
+            yield from page
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (RuleRows, list)):
+            return len(self) == len(other) and self.to_list() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def select(self, positions: Sequence[int]) -> List[Dict[str, Any]]:
+        # The rules at these positions of the sequence
+        return self.table.to_dicts(self.items, self.rows[np.asarray(positions, dtype=np.int64)])
+
+    def pages(self, positions: Optional[Sequence[int]] = None, size: int = DECODE_PAGE_ROWS) -> Iterator[List[Dict[str, Any]]]:
+        # The rules at the positions (default: all), decoded size rules at a time
+        positions = np.arange(len(self)) if positions is None else np.asarray(positions, dtype=np.int64)
+        for start in range(0, len(positions), max(1, size)):
+            yield self.select(positions[start:start + size])
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return self.table.to_dicts(self.items, self.rows)
+
+    def matching(
+        self,
+        antecedent: Optional[str] = None,
+        consequent: Optional[str] = None,
+        min_lift: Optional[float] = None,
+        min_confidence: Optional[float] = None,
+    ) -> np.ndarray:
+        # Positions of the rules passing the filters of rule_query.rule_matches,
+        # tested on the columns; products compare as text
+        table = self.table
+        keep = np.ones(len(self), dtype=bool)
+        if min_lift is not None:
+            keep &= table.lift[self.rows] >= min_lift
+        if min_confidence is not None:
+            keep &= table.confidence[self.rows] >= min_confidence
+        if antecedent is not None or consequent is not None:
+            names = np.array([str(item) for item in self.items], dtype=object)
+        if antecedent is not None:
+            keep &= names[table.antecedent[self.rows]] == antecedent
+        if consequent is not None:
+            wanted = set(np.flatnonzero(names == consequent).tolist())
+            candidates = np.flatnonzero(keep)
+            keep[candidates] = [not wanted.isdisjoint(table.consequents[row]) for row in self.rows[candidates].tolist()]
+        return np.flatnonzero(keep)
+
+    @property
+    def nbytes(self) -> int:
+        # Memory held for the cache's byte budget: the columns, about 36 bytes
+        # per consequent id plus a list per rule, and the item names
+        table = self.table
+        consequents = sum(map(len, table.consequents))
+        columns = sum(array.nbytes for array in (table.antecedent, table.support, table.confidence, table.lift, self.rows))
+        return int(columns + 36 * consequents + 64 * len(table) + sum(len(str(item)) + 56 for item in self.items))
+
+
+def _itemset_keys(members: np.ndarray, base: int) -> Optional[np.ndarray]:
+    # One int64 per row of sorted item ids (the ids as digits in base n_items),
+    # or None when itemsets this long do not fit
+    if members.shape[1] * np.log2(max(base, 2)) >= 63:
+        return None
+    keys = np.zeros(len(members), dtype=np.int64)
+    for column in range(members.shape[1]):
+        keys = keys * base + members[:, column]
+    return keys
+
+
+class _SupportLookup:
+    # Support of any itemset of the frame, looked up for many itemsets of one size at once
+    def __init__(self, by_length: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]], n_items: int):
+        self.n_items = n_items
+        self._sorted: Dict[int, Tuple[Any, np.ndarray]] = {}
+        for length, (members, support, _) in by_length.items():
+            keys = _itemset_keys(members, n_items)
+            if keys is None:
+                self._sorted[length] = ({tuple(row): value for row, value in zip(members.tolist(), support.tolist())}, support)
+            else:
+                order = np.argsort(keys, kind="stable")
+                self._sorted[length] = (keys[order], support[order])
+
+    def support(self, members: np.ndarray) -> np.ndarray:
+        length = members.shape[1]
+        if length not in self._sorted:
+            raise ValueError(f"No frequent itemsets of size {length}; the itemsets are not closed under subsets")
+        keys, support = self._sorted[length]
+        if isinstance(keys, dict):
+            try:
+                return np.array([keys[tuple(row)] for row in members.tolist()], dtype=np.float64)
+            except KeyError as e:
+                raise ValueError(f"Itemset {list(e.args[0])} is missing; the itemsets are not closed under subsets")
+        wanted = _itemset_keys(members, self.n_items)
+        found = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+        if not np.array_equal(keys[found], wanted):
+            raise ValueError("Some sub-itemsets are missing; the itemsets are not closed under subsets")
+        return support[found]
+
+
+def _itemsets_by_length(itemsets: "pd.DataFrame", n_items: int) -> Tuple[Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]], _SupportLookup, np.ndarray]:
+    # The frame's itemsets per size as (sorted members, support, frame position),
+    # the support lookup over them and the support of every single item
+    by_length: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+    sizes = np.fromiter(map(len, itemsets["itemsets"]), dtype=np.int64, count=len(itemsets))
+    all_support = itemsets["support"].to_numpy(np.float64)
+    sets = itemsets["itemsets"].to_numpy()
+    for length in np.unique(sizes).tolist():
+        positions = np.flatnonzero(sizes == length)
+        members = np.array([sorted(sets[i]) for i in positions.tolist()], dtype=np.int64).reshape(len(positions), length)
+        by_length[length] = (members, all_support[positions], positions)
+
+    item_support = np.full(n_items, np.nan)
+    if 1 in by_length:
+        members, support, _ = by_length[1]
+        item_support[members[:, 0]] = support
+    return by_length, _SupportLookup(by_length, n_items), item_support
+
+
+def _confident_rules(members: np.ndarray, support: np.ndarray, item_support: np.ndarray, min_confidence: float) -> Tuple[np.ndarray, ...]:
+    # (itemset row, dropped member, antecedent, sAC, confidence) of the rules of
+    # itemsets of one size that reach min_confidence, in frame order
+    length = members.shape[1]
+    rows = np.repeat(np.arange(len(members)), length)
+    drop = np.tile(np.arange(length), len(members))
+    antecedent = members.ravel()
+    sAC = support[rows]
+    confidence = sAC / item_support[antecedent]
+    keep = confidence >= min_confidence
+    return rows[keep], drop[keep], antecedent[keep], sAC[keep], confidence[keep]
+
+
+def _consequents(members: np.ndarray, rows: np.ndarray, drop: np.ndarray) -> np.ndarray:
+    # The consequent of each rule: its itemset without the dropped member
+    mask = np.ones((len(rows), members.shape[1]), dtype=bool)
+    mask[np.arange(len(rows)), drop] = False
+    return members[rows][mask].reshape(len(rows), members.shape[1] - 1)
+
+
+_RULE_COLUMNS = ("key", "drop", "antecedent", "size", "row", "sAC", "confidence", "lift")
+
+
+def _frame_keys(frame: np.ndarray, drop: np.ndarray, width: int) -> np.ndarray:
+    # Sort keys of rules in frame order: by itemset, then by dropped member
+    return frame * width + drop
+
+
+def _rule_table(
+    by_length: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]], flat: Dict[str, np.ndarray], selected: np.ndarray, product_rank: np.ndarray,
+) -> RuleTable:
+    # The selected flat rules grouped by product, products ordered by
+    # product_rank (the frame key of their first rule before any was dropped)
+    # and each product's rules in frame order, with consequent lists built only
+    # for these rules
+    order = selected[np.lexsort((flat["key"][selected], product_rank[flat["antecedent"][selected]]))]
+    consequents: List[Optional[List[int]]] = [None] * len(order)
+    sizes, rows, drops = flat["size"][order], flat["row"][order], flat["drop"][order]
+    for length, (members, _, _) in by_length.items():
+        picked = np.flatnonzero(sizes == length)
+        if length < 2 or len(picked) == 0:
+            continue
+        for position, items in zip(picked.tolist(), _consequents(members, rows[picked], drops[picked]).tolist()):
+            consequents[position] = items
+    return RuleTable(flat["antecedent"][order], consequents, flat["sAC"][order], flat["confidence"][order], flat["lift"][order])
+
+
+def single_antecedent_rules(
+    itemsets: "pd.DataFrame",
+    n_items: int,
+    min_confidence: float,
+    top_k: int = 0,
+) -> RuleTable:
+    # Rules {a} -> S - {a} for every frequent itemset S of two or more items,
+    # with the arithmetic of association_rules as the API called it (no
+    # num_itemsets): confidence = sAC / sA and lift = confidence / sC, on the
+    # float supports, so rules on the min_confidence boundary are kept or
+    # dropped exactly as before. Rules with several antecedent items are never
+    # built. Confidence only needs single-item supports, so rules below
+    # min_confidence are dropped before their consequents are looked up, and
+    # with top_k only the top_k highest-lift rules of each product are
+    # materialized. Rules follow the itemset frame, one per item of an itemset
+    # in id order, grouped by product.
+    if len(itemsets) == 0:
+        return RuleTable.empty()
+    by_length, lookup, item_support = _itemsets_by_length(itemsets, n_items)
+    width = max(by_length)
+
+    # Candidate rules of every itemset size, as flat columns
+    columns: Dict[str, List[np.ndarray]] = {key: [] for key in _RULE_COLUMNS}
+    for length, (members, support, positions) in by_length.items():
+        if length < 2:
+            continue
+        rows, drop, antecedent, sAC, confidence = _confident_rules(members, support, item_support, min_confidence)
+        lift = confidence / lookup.support(_consequents(members, rows, drop))
+        values = (_frame_keys(positions[rows], drop, width), drop, antecedent, np.full(len(rows), length), rows, sAC, confidence, lift)
+        for key, column in zip(_RULE_COLUMNS, values):
+            columns[key].append(column)
+    if not columns["key"]:
+        return RuleTable.empty()
+    flat = {key: np.concatenate(values) for key, values in columns.items()}
+
+    product_rank = np.full(n_items, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(product_rank, flat["antecedent"], flat["key"])
+    order = np.argsort(flat["key"])
+    selected = order[top_per_group(flat["antecedent"][order], flat["lift"][order], top_k)]
+    return _rule_table(by_length, flat, selected, product_rank)
+
+
+def top_single_antecedent_rules(
+    itemsets: "pd.DataFrame",
+    n_items: int,
+    min_confidence: float,
+    max_rules: int,
+    top_k: int = 0,
+    limit: int = 0,
+    min_consequents: int = 0,
+) -> Tuple[RuleTable, np.ndarray]:
+    # The rules of single_antecedent_rules(itemsets, n_items, min_confidence,
+    # limit) that can be among the max_rules highest-lift rules once every
+    # product is cut to its top_k (0 = all), in the same order, without building
+    # the others. Products whose rules have fewer than min_consequents consequent
+    # items in all ("short": the ones a back-fill tops up) keep every rule, and
+    # the second result marks them per item id.
+    # Itemset sizes are taken in increasing order and a bounded pool keeps the
+    # max_rules best lifts among the rules certain to stay (those of products
+    # that are not short, within their product's top_k); its smallest lift is a
+    # threshold under which no other rule can make the top. Since sC >= sAC, a
+    # rule's lift is at most 1 / sA, so rules whose antecedent support keeps
+    # them under the threshold are dropped before their consequents' supports
+    # are looked up; the rest are dropped once their lift is known.
+    if len(itemsets) == 0:
+        return RuleTable.empty(), np.ones(n_items, dtype=bool)
+    by_length, lookup, item_support = _itemsets_by_length(itemsets, n_items)
+    confident = {
+        length: _confident_rules(members, support, item_support, min_confidence)
+        for length, (members, support, _) in by_length.items() if length >= 2
+    }
+    # Short products and the order of the products are known from confidence alone
+    width = max(by_length)
+    consequent_items = np.zeros(n_items, dtype=np.int64)
+    product_rank = np.full(n_items, np.iinfo(np.int64).max, dtype=np.int64)
+    for length, (rows, drop, antecedent, _, _) in confident.items():
+        consequent_items += np.bincount(antecedent, minlength=n_items) * (length - 1)
+        np.minimum.at(product_rank, antecedent, _frame_keys(by_length[length][2][rows], drop, width))
+    short = consequent_items < min_consequents
+
+    threshold = -np.inf
+    pool_antecedent, pool_lift = np.empty(0, dtype=np.int64), np.empty(0)
+    columns: Dict[str, List[np.ndarray]] = {key: [] for key in _RULE_COLUMNS}
+    for length, (rows, drop, antecedent, sAC, confidence) in confident.items():
+        members, _, positions = by_length[length]
+        if np.isfinite(threshold):
+            # The bound, with a margin for the rounding of the computed lift
+            keep = short[antecedent] | (1.0 / item_support[antecedent] * (1 + 1e-9) >= threshold)
+            rows, drop, antecedent, sAC, confidence = rows[keep], drop[keep], antecedent[keep], sAC[keep], confidence[keep]
+        lift = confidence / lookup.support(_consequents(members, rows, drop))
+        keep = short[antecedent] | (lift >= threshold)
+        values = (_frame_keys(positions[rows], drop, width), drop, antecedent, np.full(len(rows), length), rows, sAC, confidence, lift)
+        for key, column in zip(_RULE_COLUMNS, values):
+            columns[key].append(column[keep])
+
+        certain = keep & ~short[antecedent]
+        pool_antecedent = np.concatenate([pool_antecedent, antecedent[certain]])
+        pool_lift = np.concatenate([pool_lift, lift[certain]])
+        kept = top_per_group(pool_antecedent, pool_lift, top_k)
+        pool_antecedent, pool_lift = pool_antecedent[kept], pool_lift[kept]
+        if len(pool_lift) >= max_rules:
+            threshold = np.partition(pool_lift, len(pool_lift) - max_rules)[len(pool_lift) - max_rules]
+            kept = pool_lift >= threshold
+            pool_antecedent, pool_lift = pool_antecedent[kept], pool_lift[kept]
+    if not columns["key"]:
+        return RuleTable.empty(), short
+    flat = {key: np.concatenate(values) for key, values in columns.items()}
+    # Without the rules kept before the threshold reached its final value
+    final = short[flat["antecedent"]] | (flat["lift"] >= threshold)
+    flat = {key: values[final] for key, values in flat.items()}
+
+    order = np.argsort(flat["key"])
+    selected = order[top_per_group(flat["antecedent"][order], flat["lift"][order], limit)]
+    return _rule_table(by_length, flat, selected, product_rank), short
@@ -0,0 +1,125 @@
+import logging
+import math
+import os
+from statistics import NormalDist
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from basket import Basket
+
+logger = logging.getLogger(__name__)
+
+# Approximate (preview) mining: share of bills sampled, the sampling seed (a
+# fixed seed keeps previews reproducible and cacheable) and the confidence
+# level of the reported intervals and of the lowered sample threshold
+SAMPLE_FRACTION = float(os.environ.get("APPROX_SAMPLE_FRACTION", "0.1"))
+SAMPLE_SEED = int(os.environ.get("APPROX_SAMPLE_SEED", "0"))
+CONFIDENCE_LEVEL = float(os.environ.get("APPROX_CONFIDENCE_LEVEL", "0.95"))
+
+Itemset = Tuple[int, ...]
+
+
+def sample_basket(basket: "Basket", fraction: float, seed: int = SAMPLE_SEED) -> "Basket":
+    # A uniform random sample of the bills (without replacement), same item ids
+    from basket import Basket
+
+    n_tx = basket.n_transactions
+    size = min(n_tx, max(1, int(math.ceil(fraction * n_tx))))
+    rows = np.sort(np.random.default_rng(seed).choice(n_tx, size=size, replace=False))
+    return Basket(basket.matrix[rows], basket.transactions[rows], basket.items, first_seen=basket.first_seen)
+
+
+def lowered_support(min_support: float, n_sample: int, level: float = CONFIDENCE_LEVEL) -> float:
+    # Toivonen's sample threshold: an itemset at min_support falls below this in
+    # the sample with probability about 1 - level (normal approximation of its
+    # binomial sample count; Hoeffding's distribution-free bound lowers low
+    # supports all the way to a single bill)
+    z = NormalDist().inv_cdf(level)
+    return max(min_support - z * math.sqrt(min_support * (1.0 - min_support) / n_sample), 1.0 / n_sample)
+
+
+def negative_border(itemsets: List[Itemset], n_items: int, max_len: Optional[int] = None) -> List[Itemset]:
+    # The itemsets not in the collection whose every proper subset is: the ones
+    # to count besides the collection to know that nothing frequent was missed
+    from engines import join_candidates
+
+    present = set(itemsets)
+    by_size: Dict[int, List[Itemset]] = {}
+    for itemset in itemsets:
+        by_size.setdefault(len(itemset), []).append(itemset)
+    border = [(item,) for item in range(n_items) if (item,) not in present]
+    size = 1
+    while by_size.get(size) and (max_len is None or size < max_len):
+        border.extend(candidate for candidate in join_candidates(sorted(by_size[size])) if candidate not in present)
+        size += 1
+    return border
+
+
+def count_in_chunks(basket: "Basket", itemsets: List[Itemset]) -> np.ndarray:
+    # Exact counts of the itemsets over the whole basket, a chunk of bills at a
+    # time. Pairs, usually most of the negative border, are read off a sparse
+    # X^T X of the items they mention instead of being AND-ed one by one.
+    from engines import count_itemsets
+
+    counts = np.zeros(len(itemsets), dtype=np.int64)
+    pairs = np.array([i for i, itemset in enumerate(itemsets) if len(itemset) == 2], dtype=np.int64)
+    others = [i for i, itemset in enumerate(itemsets) if len(itemset) != 2]
+    if len(pairs):
+        ends = np.array([itemsets[i] for i in pairs], dtype=np.int64)
+        needed = np.unique(ends)
+        first, second = np.searchsorted(needed, ends[:, 0]), np.searchsorted(needed, ends[:, 1])
+    for chunk in basket.row_chunks():
+        if len(pairs):
+            X = chunk[:, needed].astype(np.int32)
+            counts[pairs] += np.asarray((X.T @ X).tocsr()[first, second]).ravel()
+        if others:
+            counts[others] += count_itemsets(chunk, [itemsets[i] for i in others])
+    return counts
+
+
+def wilson_interval(count: np.ndarray, n: np.ndarray, z: float, fpc: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+    # Wilson score interval of count / n. fpc (1 - sampled share) is the finite
+    # population correction; the variance shrinks with it, so a full sample has
+    # a zero-width interval.
+    count = np.asarray(count, dtype=np.float64)
+    n = np.maximum(np.asarray(n, dtype=np.float64), 1.0)
+    p = count / n
+    if fpc <= 0.0:
+        return p, p
+    z2 = z * z * fpc
+    centre = (p + z2 / (2 * n)) / (1 + z2 / n)
+    half = math.sqrt(z2) / (1 + z2 / n) * np.sqrt(p * (1 - p) / n + z2 / (4 * n * n))
+    return np.clip(centre - half, 0.0, 1.0), np.clip(centre + half, 0.0, 1.0)
+
+
+def add_intervals(rules: List[Dict[str, Any]], n_sample: int, fraction: float, level: float = CONFIDENCE_LEVEL) -> None:
+    # Adds support_ci, confidence_ci and lift_ci ([low, high] at the given
+    # level) to rules estimated on a sample of n_sample bills. Support and
+    # confidence are Wilson intervals of their sample counts; the lift interval
+    # combines the confidence interval with the consequent support's interval,
+    # so it is conservative. Intervals hold rule by rule: rules that only just
+    # passed the thresholds in the sample tend to be overestimated.
+    if not rules:
+        return
+    z = NormalDist().inv_cdf(0.5 + level / 2)
+    fpc = 1.0 - fraction
+    support = np.array([rule["support"] for rule in rules])
+    confidence = np.array([rule["confidence"] for rule in rules])
+    lift = np.array([rule["lift"] for rule in rules])
+    # Back to the sample counts: A and C together, A, and C
+    both = np.rint(support * n_sample)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        antecedent = np.rint(np.where(confidence > 0, both / confidence, n_sample))
+        consequent = np.rint(np.where(lift > 0, confidence / lift * n_sample, 0))
+
+    support_low, support_high = wilson_interval(both, n_sample, z, fpc)
+    confidence_low, confidence_high = wilson_interval(both, antecedent, z, fpc)
+    consequent_low, consequent_high = wilson_interval(consequent, n_sample, z, fpc)
+    lift_low = confidence_low / np.maximum(consequent_high, 1e-12)
+    lift_high = np.where(consequent_low > 0, confidence_high / np.maximum(consequent_low, 1e-12), np.inf)
+    for i, rule in enumerate(rules):
+        rule["support_ci"] = [float(support_low[i]), float(support_high[i])]
+        rule["confidence_ci"] = [float(confidence_low[i]), float(confidence_high[i])]
+        rule["lift_ci"] = [float(lift_low[i]), float(lift_high[i])]
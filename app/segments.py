@@ -0,0 +1,74 @@
+import hashlib
+import logging
+from typing import Any, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from basket import Basket, factorize
+
+logger = logging.getLogger(__name__)
+
+
+# Date columns segment by calendar month unless a request picks another period
+DEFAULT_SEGMENT_PERIOD = "M"
+SEGMENT_PERIODS = ("D", "W", "M", "Q", "Y")
+
+
+def segment_labels(values: pd.Series, period: Optional[str] = None) -> pd.Series:
+    # Segment of every row: date columns (and, with a period, text dates such as
+    # CSV columns) by period ("2024-04" for months), any other column by its values
+    if period is None and not pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    dates = values if pd.api.types.is_datetime64_any_dtype(values) else pd.to_datetime(values.astype(object), errors="coerce")
+    return dates.dt.to_period(period or DEFAULT_SEGMENT_PERIOD).astype(str).where(dates.notna())
+
+
+def segment_digest(basket: Basket) -> str:
+    # Identifies a segment by what its rules depend on: the bill x item matrix,
+    # the item names and their order of first appearance. Bills of other
+    # segments can change without changing this.
+    digest = hashlib.sha256()
+    for array in (basket.matrix.indptr, basket.matrix.indices, basket.first_seen):
+        digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+    digest.update(repr([str(item) for item in basket.items]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def split_basket(
+    df: pd.DataFrame, basket: Basket, transaction_column: str, item_column: str, segment_column: str, period: Optional[str] = None
+) -> Iterator[Tuple[Any, Basket]]:
+    # One basket per segment value, sliced from the shared basket without
+    # encoding again. A bill belongs to the segment of its first row; bills
+    # without a segment value are left out. Each segment basket has only its own
+    # bills and items and is the same as encoding that segment's rows alone.
+    tx_codes, _ = factorize(df[transaction_column])
+    item_codes, _ = factorize(df[item_column])
+    segment_codes, segments = factorize(segment_labels(df[segment_column], period))
+    _, first_row = np.unique(tx_codes, return_index=True)
+    bill_segment = segment_codes[first_row]
+    row_segment = bill_segment[tx_codes]
+
+    split = int((segment_codes != row_segment).sum())
+    if split:
+        logger.info(f"{split} rows belong to bills whose first row is in another {segment_column} segment")
+    unassigned = int((bill_segment < 0).sum())
+    if unassigned:
+        logger.info(f"{unassigned} bills without a {segment_column} value are left out")
+
+    matrix = basket.matrix.tocsr()
+    n_items = matrix.shape[1]
+    for code, segment in enumerate(segments):
+        rows = np.flatnonzero(bill_segment == code)
+        if len(rows) == 0:
+            continue
+        sub = matrix[rows]
+        used = np.flatnonzero(np.bincount(sub.indices, minlength=n_items))
+        remap = np.full(n_items, -1, dtype=np.int32)
+        remap[used] = np.arange(len(used), dtype=np.int32)
+        # used is sorted, so remapped columns stay sorted within each row
+        sub = sparse.csr_matrix((sub.data, remap[sub.indices], sub.indptr), shape=(len(rows), len(used)))
+        first_seen = remap[pd.unique(item_codes[row_segment == code])]
+        yield segment, Basket(sub, basket.transactions[rows], basket.items[used], first_seen=first_seen)
+
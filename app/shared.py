@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+
+import ingest
+from basket import text_keys
+from datasets import SHARED_DATASETS
+from jobs import JOBS, JobStore
+from recommend import IndexRegistry, RecommendationIndex
+from similarity import SimilarityIndex
+
+logger = logging.getLogger(__name__)
+
+# Published versions kept per sheet besides the current one, for processes
+# still attaching to an older one
+SHARED_KEEP_VERSIONS = int(os.environ.get("SHARED_KEEP_VERSIONS", "2"))
+SNAPSHOT_VERSION = 1
+
+# Layout under <ingest cache>/shared:
+#   <key digest>/<version>/   one published index: meta.json, items.npy and
+#                             index/*.npy, similarity/*.npy arrays
+#   <key digest>/current      symlink to the version being served
+#   latest                    symlink to the key digest published last
+#   jobs/                     every process's jobs (see JobStore): any process
+#                             answers /jobs/{id} for them
+# A new version is written in full under a staging name, renamed into place
+# and only then made current by replacing the symlink, so readers see either
+# the old or the new version, never a partial one.
+#
+# What stays per process: the result, itemset and segment caches (a request
+# another process answered before is mined again, from the shared transaction
+# store), the incremental mining states (their deltas are shared through
+# DeltaLog), and MAX_PENDING_JOBS and the deduplication of identical jobs,
+# which count only the process's own jobs.
+
+
+def shared_root() -> Path:
+    return ingest.CACHE_DIR / "shared"
+
+
+def key_digest(key: Hashable) -> str:
+    return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:24]
+
+
+def item_array(items: Sequence[Any]) -> np.ndarray:
+    # Item names as a plain (memory-mappable) array: numbers stay numbers
+    values = list(items)
+    if values and all(isinstance(value, (int, np.integer)) and not isinstance(value, bool) for value in values):
+        return np.array(values, dtype=np.int64)
+    if values and all(isinstance(value, (float, np.floating)) for value in values):
+        return np.array(values, dtype=np.float64)
+    return text_keys(values)
+
+
+def _swap_link(link: Path, target: str) -> None:
+    # Points link at target in one rename
+    staging = link.with_name(f".{link.name}-{os.getpid()}-{time.time_ns()}")
+    os.symlink(target, staging)
+    os.replace(staging, link)
+
+
+def _read_link(link: Path) -> Optional[str]:
+    try:
+        return os.readlink(link)
+    except OSError:
+        return None
+
+
+def _save_arrays(directory: Path, arrays: Dict[str, np.ndarray]) -> None:
+    directory.mkdir()
+    for name, array in arrays.items():
+        np.save(directory / f"{name}.npy", np.asarray(array))
+
+
+def _load_arrays(directory: Path) -> Dict[str, np.ndarray]:
+    return {path.stem: np.load(path, mmap_mode="r") for path in directory.glob("*.npy")}
+
+
+def write_snapshot(key: Hashable, index: RecommendationIndex) -> str:
+    # Publishes the index for key and makes it current; returns its version
+    root = shared_root() / key_digest(key)
+    root.mkdir(parents=True, exist_ok=True)
+    version = f"{time.time_ns():020d}-{os.getpid()}"
+    staging = Path(tempfile.mkdtemp(prefix=".building-", dir=root))
+    try:
+        np.save(staging / "items.npy", item_array(index.items))
+        _save_arrays(staging / "index", index.arrays())
+        similarity = index.similarity
+        if similarity is not None:
+            _save_arrays(staging / "similarity", similarity.arrays())
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "key": list(key),
+            "index": index.meta(),
+            "similarity": similarity.meta() if similarity is not None else None,
+        }
+        with open(staging / "meta.json", "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, default=str)
+        os.rename(staging, root / version)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # A slower publisher never replaces a newer version
+    current = _read_link(root / "current")
+    if current is None or current < version:
+        _swap_link(root / "current", version)
+    _swap_link(shared_root() / "latest", root.name)
+    _prune(root)
+    return version
+
+
+def _prune(root: Path) -> None:
+    # Old versions are deleted; processes that still map their files keep
+    # reading them until they let go (the files only go away after that)
+    current = _read_link(root / "current")
+    versions = sorted(path.name for path in root.iterdir() if path.is_dir() and not path.is_symlink() and not path.name.startswith("."))
+    for name in versions[:-(SHARED_KEEP_VERSIONS + 1)]:
+        if name != current:
+            shutil.rmtree(root / name, ignore_errors=True)
+
+
+def read_snapshot(digest: str) -> Optional[Tuple[str, Tuple, RecommendationIndex]]:
+    # (version, key, index) of the current version for a key digest, its
+    # arrays memory-mapped (zero-copy, shared with every process mapping them)
+    root = shared_root() / digest
+    for _ in range(3):
+        version = _read_link(root / "current")
+        if version is None:
+            return None
+        directory = root / version
+        try:
+            with open(directory / "meta.json", encoding="utf-8") as fh:
+                meta = json.load(fh)
+            if meta.get("version") != SNAPSHOT_VERSION:
+                return None
+            items = np.load(directory / "items.npy", mmap_mode="r")
+            similarity = None
+            if meta["similarity"] is not None:
+                similarity = SimilarityIndex.from_arrays(items, _load_arrays(directory / "similarity"), meta["similarity"])
+            index = RecommendationIndex.from_arrays(items, _load_arrays(directory / "index"), meta["index"], similarity)
+            return version, tuple(meta["key"]), index
+        except FileNotFoundError:
+            # Pruned while attaching: a newer version is current by now
+            continue
+    return None
+
+
+class SharedIndexRegistry(IndexRegistry):
+    # An IndexRegistry whose indexes are published to shared_root() and served
+    # from there by every server process: a process attaches to a newer
+    # version (one readlink per lookup to notice it) instead of keeping its
+    # own copy, and the publishing process serves the mapped copy too.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._versions: Dict[Hashable, str] = {}
+
+    def publish(self, key: Hashable, index: RecommendationIndex) -> None:
+        try:
+            write_snapshot(key, index)
+        except OSError as e:
+            logger.warning(f"Could not publish the recommendation index to {shared_root()}: {str(e)}")
+            super().publish(key, index)
+            return
+        if self._attach(key_digest(key), key) is None:
+            super().publish(key, index)
+
+    def _attach(self, digest: str, key: Optional[Hashable] = None) -> Optional[RecommendationIndex]:
+        snapshot = read_snapshot(digest)
+        if snapshot is None:
+            return None
+        version, stored_key, index = snapshot
+        key = stored_key if key is None else key
+        super().publish(key, index)
+        with self._lock:
+            self._versions[key] = version
+        logger.info(f"Attached recommendation index version {version} for {key}")
+        return index
+
+    def get(self, key: Hashable) -> Optional[RecommendationIndex]:
+        digest = key_digest(key)
+        current = _read_link(shared_root() / digest / "current")
+        cached = super().get(key)
+        with self._lock:
+            known = self._versions.get(key)
+        if cached is not None and (current is None or current == known):
+            return cached
+        return self._attach(digest, key) or cached
+
+    def latest(self) -> Optional[RecommendationIndex]:
+        digest = _read_link(shared_root() / "latest")
+        if digest is None:
+            return super().latest()
+        snapshot_key = None
+        with self._lock:
+            for key in self._indexes:
+                if key_digest(key) == digest:
+                    snapshot_key = key
+        if snapshot_key is not None:
+            return self.get(snapshot_key)
+        return self._attach(digest) or super().latest()
+
+
+def share_jobs() -> None:
+    # Points the job manager at the shared job store
+    JOBS.share(JobStore(shared_root() / "jobs"))
+
+
+RECOMMENDATIONS = SharedIndexRegistry() if SHARED_DATASETS else IndexRegistry()
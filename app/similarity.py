@@ -0,0 +1,164 @@
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from basket import Basket, item_value, text_keys
+from cooccurrence import CoOccurrence
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_METRICS = ("cosine", "jaccard")
+# Neighbours kept per item, and items whose similarities are computed at once
+SIMILARITY_NEIGHBORS = int(os.environ.get("SIMILARITY_NEIGHBORS", "20"))
+SIMILARITY_BLOCK_ITEMS = int(os.environ.get("SIMILARITY_BLOCK_ITEMS", "2048"))
+
+
+def pair_blocks(basket: Basket, block_items: int = SIMILARITY_BLOCK_ITEMS) -> Iterator[Tuple[int, sparse.csr_matrix]]:
+    # Co-occurrence counts of block_items items at a time with every item, as
+    # (first item, block rows of X^T X): the block's columns of X, transposed,
+    # times X, summed over chunks of bills like count_pairs. Only one block of
+    # pair counts and one chunk of bills exist at once, so a basket memory-mapped
+    # from a transaction store is never transposed (or loaded) as a whole.
+    n_items = basket.shape[1]
+    for start in range(0, n_items, block_items):
+        stop = min(start + block_items, n_items)
+        block = sparse.csr_matrix((stop - start, n_items), dtype=np.int32)
+        for chunk in basket.row_chunks():
+            X = chunk.astype(np.int32)
+            block = block + (X[:, start:stop].T @ X).tocsr()
+        yield start, block
+
+
+def _counted_blocks(counts: sparse.csr_matrix, block_items: int = SIMILARITY_BLOCK_ITEMS) -> Iterator[Tuple[int, sparse.csr_matrix]]:
+    # The same blocks sliced from pair counts that are already known
+    for start in range(0, counts.shape[0], block_items):
+        yield start, counts[start:start + block_items]
+
+
+class SimilarityIndex:
+    # Item-item similarity of the bill vectors of the items: cosine
+    # (c_ij / sqrt(c_i c_j)) and Jaccard (c_ij / (c_i + c_j - c_ij)), where c
+    # counts bills. Every item that was sold is covered, whatever its support,
+    # so long-tail items get recommendations too. Only each item's top
+    # `neighbors` are kept, per metric as fixed-width arrays: row i holds item
+    # i's neighbour ids (best first, padded with -1), their scores and their
+    # co-occurrence counts. Like RecommendationIndex, it is all numpy arrays.
+    def __init__(
+        self,
+        basket: Basket,
+        cooccurrence: Optional[CoOccurrence] = None,
+        neighbors: int = SIMILARITY_NEIGHBORS,
+        block_items: int = SIMILARITY_BLOCK_ITEMS,
+    ):
+        n_items = basket.shape[1]
+        self.n_neighbors = neighbors
+        if cooccurrence is not None:
+            item_counts = cooccurrence.item_counts
+            blocks = _counted_blocks(cooccurrence.counts, block_items)
+        else:
+            item_counts = np.asarray(basket.matrix.sum(axis=0)).ravel()
+            blocks = pair_blocks(basket, block_items)
+        item_counts = np.asarray(item_counts, dtype=np.float64)
+
+        self._arrays: Dict[str, np.ndarray] = {}
+        for metric in SIMILARITY_METRICS:
+            self._arrays[f"neighbors_{metric}"] = np.full((n_items, neighbors), -1, dtype=np.int32)
+            self._arrays[f"scores_{metric}"] = np.zeros((n_items, neighbors), dtype=np.float32)
+            self._arrays[f"co_occurrences_{metric}"] = np.zeros((n_items, neighbors), dtype=np.int32)
+        pairs = 0
+        for start, block in blocks:
+            rows = np.repeat(np.arange(start, start + block.shape[0]), np.diff(block.indptr))
+            columns = block.indices
+            counts = block.data.astype(np.float64)
+            other = rows != columns
+            rows, columns, counts = rows[other], columns[other], counts[other]
+            pairs += len(rows)
+            first, second = item_counts[rows], item_counts[columns]
+            self._keep_top("cosine", rows, columns, counts, counts / np.sqrt(first * second))
+            self._keep_top("jaccard", rows, columns, counts, counts / (first + second - counts))
+        logger.info(f"Item similarity: {n_items} items, {pairs} co-occurring pairs, top {neighbors} kept per item")
+
+        # Item names arrive as URL path strings, so items are looked up by text
+        keys = text_keys(basket.items)
+        order = np.argsort(keys, kind="stable")
+        self._arrays["item_keys"] = keys[order]
+        self._arrays["item_positions"] = order.astype(np.int32)
+        self._attach(basket.items, self._arrays, {"built_at": time.time()})
+
+    @classmethod
+    def from_arrays(cls, items: Sequence[Any], arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> "SimilarityIndex":
+        index = cls.__new__(cls)
+        index._attach(items, arrays, meta)
+        return index
+
+    def _attach(self, items: Sequence[Any], arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> None:
+        self.items = items
+        self._arrays = arrays
+        self.built_at = meta["built_at"]
+        self.n_neighbors = arrays[f"neighbors_{SIMILARITY_METRICS[0]}"].shape[1]
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return self._arrays
+
+    def meta(self) -> Dict[str, Any]:
+        return {"built_at": self.built_at}
+
+    def _keep_top(self, metric: str, rows: np.ndarray, columns: np.ndarray, counts: np.ndarray, scores: np.ndarray) -> None:
+        # Best first; ties go to the pair seen in more bills, then the lower item id
+        order = np.lexsort((columns, -counts, -scores, rows))
+        ranked_rows = rows[order]
+        starts = np.flatnonzero(np.r_[True, ranked_rows[1:] != ranked_rows[:-1]])
+        rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        kept = order[rank < self.n_neighbors]
+        rank = rank[rank < self.n_neighbors]
+        self._arrays[f"neighbors_{metric}"][rows[kept], rank] = columns[kept]
+        self._arrays[f"scores_{metric}"][rows[kept], rank] = scores[kept]
+        self._arrays[f"co_occurrences_{metric}"][rows[kept], rank] = counts[kept]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _lookup(self, item: Any) -> Optional[int]:
+        keys = self._arrays["item_keys"]
+        key = str(item)
+        found = int(np.searchsorted(keys, key))
+        if found < len(keys) and keys[found] == key:
+            return int(self._arrays["item_positions"][found])
+        return None
+
+    def __contains__(self, item: Any) -> bool:
+        return self._lookup(item) is not None
+
+    def similar(self, item: Any, k: int = 5, metric: str = "cosine") -> List[Dict[str, Any]]:
+        # Up to k (0 = all kept) most similar items, best first
+        if metric not in SIMILARITY_METRICS:
+            raise ValueError(f"Unknown similarity metric '{metric}'. Choose one of: {', '.join(SIMILARITY_METRICS)}")
+        position = self._lookup(item)
+        if position is None:
+            return []
+        neighbors = self._arrays[f"neighbors_{metric}"][position]
+        scores = self._arrays[f"scores_{metric}"][position]
+        co_occurrences = self._arrays[f"co_occurrences_{metric}"][position]
+        count = int((neighbors >= 0).sum())
+        if k > 0:
+            count = min(count, k)
+        return [
+            {
+                "item": item_value(self.items[neighbors[i]]),
+                "score": float(scores[i]),
+                "co_occurrences": int(co_occurrences[i]),
+            }
+            for i in range(count)
+        ]
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "items": len(self.items),
+            "neighbors": self.n_neighbors,
+            "metrics": list(SIMILARITY_METRICS),
+            "built_at": self.built_at,
+        }
@@ -0,0 +1,125 @@
+import argparse
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Synthetic ItemWise-style sales lines (one row per bill line) for benchmarks:
+#   - item popularity follows a Zipf law over the catalog;
+#   - basket sizes are drawn from a shifted Poisson or geometric distribution;
+#   - a share of bills contains one of a few product bundles, which is what
+#     gives the data association rules worth finding.
+BASKET_DISTRIBUTIONS = ("poisson", "geometric")
+
+
+def zipf_weights(n: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+    return weights / weights.sum()
+
+
+def basket_sizes(rng: np.random.Generator, n_transactions: int, mean_size: float, distribution: str) -> np.ndarray:
+    # Every bill has at least one line; the mean includes that line
+    if distribution == "poisson":
+        return 1 + rng.poisson(max(mean_size - 1.0, 0.0), n_transactions)
+    if distribution == "geometric":
+        return rng.geometric(1.0 / max(mean_size, 1.0), n_transactions)
+    raise ValueError(f"Unknown basket distribution '{distribution}'. Choose one of: {', '.join(BASKET_DISTRIBUTIONS)}")
+
+
+def generate_sales(
+    n_transactions: int,
+    n_items: int = 2000,
+    mean_basket_size: float = 4.0,
+    basket_distribution: str = "poisson",
+    zipf_exponent: float = 1.1,
+    n_bundles: int = 50,
+    bundle_size: int = 3,
+    bundle_rate: float = 0.3,
+    seed: int = 0,
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    sizes = basket_sizes(rng, n_transactions, mean_basket_size, basket_distribution)
+    popularity = zipf_weights(n_items, zipf_exponent)
+
+    # Bundles are drawn from the popular half of the catalog, bundle choice is Zipfian too
+    bundles = np.array([
+        rng.choice(max(n_items // 2, bundle_size), size=bundle_size, replace=False) for _ in range(n_bundles)
+    ]).reshape(n_bundles, bundle_size)
+    with_bundle = rng.random(n_transactions) < bundle_rate if n_bundles else np.zeros(n_transactions, dtype=bool)
+    chosen = rng.choice(n_bundles, size=int(with_bundle.sum()), p=zipf_weights(n_bundles, 1.0)) if n_bundles else []
+
+    bills = np.repeat(np.arange(n_transactions, dtype=np.int64), sizes)
+    items = rng.choice(n_items, size=len(bills), p=popularity)
+    bundle_bills = np.repeat(np.flatnonzero(with_bundle), bundle_size)
+    bundle_items = bundles[chosen].ravel() if len(chosen) else np.empty(0, dtype=np.int64)
+    bills = np.concatenate([bills, bundle_bills])
+    items = np.concatenate([items, bundle_items])
+    order = np.argsort(bills, kind="stable")
+    bills, items = bills[order], items[order]
+
+    quantities = rng.integers(1, 6, size=len(bills))
+    prices = np.round(5.0 + 495.0 * rng.random(n_items), 2)
+    days = rng.integers(0, 365, size=n_transactions)
+    return pd.DataFrame({
+        "BILLNO": np.char.add("B", np.char.zfill((bills + 1).astype(str), 8)),
+        "BILLDATE": pd.Timestamp("2024-04-01") + pd.to_timedelta(days[bills], unit="D"),
+        "ITEMNAME": np.char.add("ITEM ", np.char.zfill((items + 1).astype(str), 5)),
+        "QTY": quantities,
+        "AMOUNT": np.round(quantities * prices[items], 2),
+    })
+
+
+def generate_rows(n_rows: int, mean_basket_size: float = 4.0, bundle_size: int = 3, bundle_rate: float = 0.3, **kwargs) -> pd.DataFrame:
+    # Sizes the number of bills so the result has roughly n_rows lines
+    per_bill = mean_basket_size + bundle_rate * bundle_size
+    n_transactions = max(1, int(round(n_rows / per_bill)))
+    return generate_sales(
+        n_transactions, mean_basket_size=mean_basket_size, bundle_size=bundle_size, bundle_rate=bundle_rate, **kwargs
+    )
+
+
+def write_dataset(df: pd.DataFrame, path: str, sheet_name: str = "Sheet1") -> None:
+    # Write-only openpyxl streams rows out, so large workbooks do not need
+    # the whole sheet as cell objects in memory
+    if Path(path).suffix.lower() == ".csv":
+        df.to_csv(path, index=False)
+        return
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append(list(df.columns))
+    columns = [df[column].to_numpy(dtype=object) for column in df.columns]
+    for row in zip(*columns):
+        sheet.append([value.to_pydatetime() if isinstance(value, pd.Timestamp) else value for value in row])
+    workbook.save(path)
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate synthetic ItemWise-style sales data")
+    parser.add_argument("output", help="Output .xlsx or .csv path")
+    parser.add_argument("--rows", type=int, default=100000, help="Approximate number of bill lines")
+    parser.add_argument("--items", type=int, default=2000, help="Catalog size")
+    parser.add_argument("--mean-basket-size", type=float, default=4.0)
+    parser.add_argument("--basket-distribution", choices=BASKET_DISTRIBUTIONS, default="poisson")
+    parser.add_argument("--zipf-exponent", type=float, default=1.1)
+    parser.add_argument("--bundles", type=int, default=50)
+    parser.add_argument("--bundle-rate", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    df = generate_rows(
+        args.rows, n_items=args.items, mean_basket_size=args.mean_basket_size,
+        basket_distribution=args.basket_distribution, zipf_exponent=args.zipf_exponent,
+        n_bundles=args.bundles, bundle_rate=args.bundle_rate, seed=args.seed,
+    )
+    write_dataset(df, args.output)
+    print(f"Wrote {len(df)} rows ({df['BILLNO'].nunique()} bills, {df['ITEMNAME'].nunique()} items) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from basket import encode_basket, factorize
+
+
+def sales_rows(seed=0, rows=200):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "BILLNO": rng.integers(0, 60, rows),
+        "ITEMNAME": rng.choice([f"ITEM {i:02d}" for i in range(15)], rows),
+    })
+    # A bill listing the same item twice
+    return pd.concat([df, df.head(3)], ignore_index=True)
+
+
+def pivot_basket(df):
+    # The basket as the API used to build it, with pivot_table
+    counts = df.groupby(["BILLNO", "ITEMNAME"]).size().reset_index(name="count")
+    wide = counts.pivot_table(index="BILLNO", columns="ITEMNAME", values="count", fill_value=0)
+    return (wide > 0).astype(int)
+
+
+@pytest.mark.parametrize("categorical", [False, True])
+def test_matches_pivot_table(categorical):
+    df = sales_rows()
+    if categorical:
+        # As load_sheet(categorical=True) returns them, with an unused category
+        df = df.assign(ITEMNAME=pd.Categorical(df["ITEMNAME"], categories=["UNSOLD"] + sorted(df["ITEMNAME"].unique())[::-1]))
+    basket = encode_basket(df, "BILLNO", "ITEMNAME")
+    expected = pivot_basket(sales_rows())
+
+    assert basket.matrix.dtype == bool
+    np.testing.assert_array_equal(basket.matrix.toarray().astype(int), expected.to_numpy())
+    assert list(basket.transactions) == list(expected.index)
+    assert list(basket.items) == list(expected.columns)
+
+
+def test_first_seen_is_order_of_appearance():
+    df = pd.DataFrame({"BILLNO": [2, 2, 1, 3, 3], "ITEMNAME": ["c", "a", "c", "b", "a"]})
+    basket = encode_basket(df, "BILLNO", "ITEMNAME")
+    assert basket.decode(basket.first_seen) == ["c", "a", "b"]
+
+
+def test_row_chunks_cover_the_basket():
+    basket = encode_basket(sales_rows(), "BILLNO", "ITEMNAME")
+    chunks = list(basket.row_chunks(7))
+    assert [chunk.shape[0] for chunk in chunks[:-1]] == [7] * (len(chunks) - 1)
+    np.testing.assert_array_equal(np.vstack([chunk.toarray() for chunk in chunks]), basket.matrix.toarray())
+
+
+def test_factorize_categorical_matches_plain():
+    values = pd.Series(["b", None, "a", "b", "c"])
+    categorical = pd.Series(pd.Categorical(values, categories=["z", "c", "b", "a"]))
+    codes, labels = factorize(values)
+    assert codes.dtype == np.int32
+    np.testing.assert_array_equal(factorize(categorical)[0], codes)
+    assert list(factorize(categorical)[1]) == list(labels) == ["a", "b", "c"]
+    assert codes[1] == -1
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from basket import encode_basket
+from cooccurrence import CoOccurrence, backfill_consequents, count_pairs
+from rule_table import RuleTable
+
+
+def sales_basket(seed=3):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for bill in range(80):
+        for item in rng.choice(10, size=int(rng.integers(1, 5)), replace=False):
+            rows.append({"BILLNO": bill, "ITEMNAME": f"ITEM {item}"})
+    return encode_basket(pd.DataFrame(rows), "BILLNO", "ITEMNAME")
+
+
+def test_chunked_pair_counts_match_one_product():
+    basket = sales_basket()
+    X = basket.matrix.astype(np.int32)
+    expected = (X.T @ X).toarray()
+    chunks = basket.row_chunks
+    basket.row_chunks = lambda: chunks(7)
+    np.testing.assert_array_equal(count_pairs(basket).toarray(), expected)
+
+
+def test_pair_statistics():
+    basket = sales_basket()
+    dense = basket.matrix.toarray()
+    n = basket.n_transactions
+    cooccurrence = CoOccurrence(basket)
+    rules = cooccurrence.rules(list(range(cooccurrence.counts.nnz)))
+    assert len(rules) == cooccurrence.counts.nnz
+    for a, (c,), support, confidence, lift in zip(rules.antecedent, rules.consequents, rules.support, rules.confidence, rules.lift):
+        both = (dense[:, a] & dense[:, c]).sum()
+        assert a != c and both > 0
+        assert support == pytest.approx(both / n)
+        assert confidence == pytest.approx(both / dense[:, a].sum())
+        assert lift == pytest.approx(both * n / (dense[:, a].sum() * dense[:, c].sum()))
+
+
+def test_top_consequents_rank_by_lift():
+    cooccurrence = CoOccurrence(sales_basket())
+    for item in range(cooccurrence.n_items):
+        picked = cooccurrence.top_consequents(item, 3, exclude=[0])
+        lifts = cooccurrence.lift[picked]
+        assert list(lifts) == sorted(lifts, reverse=True)
+        assert 0 not in cooccurrence.counts.indices[picked]
+        row = range(cooccurrence.counts.indptr[item], cooccurrence.counts.indptr[item + 1])
+        skipped = [p for p in row if p not in picked and cooccurrence.counts.indices[p] != 0]
+        if picked and skipped:
+            assert cooccurrence.lift[skipped].max() <= lifts.min()
+
+
+def test_backfill_tops_up_to_min_consequents():
+    basket = sales_basket()
+    cooccurrence = CoOccurrence(basket)
+    # Item 0 already recommends items 1 and 2; item 1 recommends nothing yet
+    mined = RuleTable(np.array([0, 0]), [[1], [2]], np.array([0.1, 0.1]), np.array([0.5, 0.5]), np.array([2.0, 2.0]))
+    added = backfill_consequents(mined, [0, 1], cooccurrence, min_consequents=5)
+
+    for product, mined_count in ((0, 2), (1, 0)):
+        consequents = [c for a, (c,) in zip(added.antecedent, added.consequents) if a == product]
+        available = cooccurrence.counts.indptr[product + 1] - cooccurrence.counts.indptr[product]
+        assert len(consequents) == min(5 - mined_count, available - (2 if product == 0 else 0))
+        if product == 0:
+            assert not {1, 2} & set(consequents)
+    assert set(added.antecedent) <= {0, 1}
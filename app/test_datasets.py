@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+import datasets
+from datasets import DatasetRegistry, UploadError, UploadTooLarge, save_upload
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(datasets, "DATASET_DIR", tmp_path)
+    monkeypatch.setattr(datasets, "DATASETS", DatasetRegistry(tmp_path))
+    monkeypatch.setattr(datasets, "UPLOAD_CHUNK_SIZE", 10)
+    return tmp_path
+
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def upload(name, filename, chunks, content_length=None):
+    return asyncio.run(save_upload(name, filename, body(*chunks), content_length=content_length))
+
+
+def leftovers(directory):
+    return [path for path in os.listdir(directory) if path.startswith(".upload-")]
+
+
+def test_body_is_stored_and_registered(registry):
+    chunks = [b"BILLNO,ITEMNAME\n", b"1,TEA\n", b"1,SUGAR\n" * 5, b"2,TEA\n"]
+    entry = upload("sales", "April.CSV", chunks)
+    data = b"".join(chunks)
+    assert entry["path"] == str(registry / "sales.csv")
+    assert entry["size"] == len(data) and entry["sha256"] == hashlib.sha256(data).hexdigest()
+    assert (registry / "sales.csv").read_bytes() == data
+    assert datasets.DATASETS.get("sales") == entry and not leftovers(registry)
+
+
+def test_announced_size_is_refused_before_reading(registry, monkeypatch):
+    monkeypatch.setattr(datasets, "MAX_UPLOAD_BYTES", 100)
+
+    async def unread():
+        raise AssertionError("the body was read")
+        yield b""
+
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(save_upload("sales", "sales.csv", unread(), content_length=101))
+    assert not leftovers(registry)
+
+
+def test_oversized_body_is_cut_off(registry, monkeypatch):
+    monkeypatch.setattr(datasets, "MAX_UPLOAD_BYTES", 100)
+    with pytest.raises(UploadTooLarge):
+        upload("sales", "sales.csv", [b"x" * 60, b"x" * 60])
+    assert datasets.DATASETS.get("sales") is None and not leftovers(registry)
+
+
+@pytest.mark.parametrize("name,filename,chunks", [
+    ("default", "sales.csv", [b"a"]),
+    ("../etc", "sales.csv", [b"a"]),
+    ("sales", "sales.txt", [b"a"]),
+    ("sales", "sales.csv", []),
+])
+def test_rejected_uploads(registry, name, filename, chunks):
+    with pytest.raises(UploadError):
+        upload(name, filename, chunks)
+    assert datasets.DATASETS.list() == [] and not leftovers(registry)
+
+
+def test_reupload_replaces_the_file(registry):
+    upload("sales", "sales.csv", [b"BILLNO,ITEMNAME\n1,TEA\n"])
+    entry = upload("sales", "sales.xlsx", [b"PK not really a workbook"])
+    assert set(os.listdir(registry)) == {"datasets.json", "sales.xlsx"}
+    assert [e["path"] for e in datasets.DATASETS.list()] == [entry["path"]]
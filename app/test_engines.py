@@ -0,0 +1,117 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import engines
+from basket import encode_basket
+from engines import ENGINES, frequent_itemsets, partition_bounds
+
+
+def fixed_basket():
+    # 40 bills over 7 items; a few bills repeat an item line
+    rng = np.random.default_rng(11)
+    rows = []
+    for bill in range(40):
+        size = int(rng.integers(1, 6))
+        for item in rng.choice(7, size=size, replace=False, p=[0.3, 0.2, 0.15, 0.12, 0.1, 0.08, 0.05]):
+            rows.append({"BILLNO": f"B{bill:03d}", "ITEMNAME": f"ITEM {item}"})
+    rows += [{"BILLNO": "B000", "ITEMNAME": rows[0]["ITEMNAME"]}, {"BILLNO": "B007", "ITEMNAME": "ITEM 0"}]
+    return encode_basket(pd.DataFrame(rows), "BILLNO", "ITEMNAME")
+
+
+def brute_force(basket, min_support, max_len):
+    dense = basket.matrix.toarray()
+    n_tx, n_items = dense.shape
+    found = []
+    for length in range(1, (max_len or n_items) + 1):
+        for itemset in combinations(range(n_items), length):
+            support = dense[:, list(itemset)].all(axis=1).sum() / n_tx
+            if support >= min_support:
+                found.append((support, frozenset(itemset)))
+    return pd.DataFrame({"support": [s for s, _ in found], "itemsets": [i for _, i in found]})
+
+
+@pytest.mark.parametrize("algorithm", list(ENGINES))
+@pytest.mark.parametrize("min_support", [0.05, 0.1, 0.25])
+@pytest.mark.parametrize("max_len", [None, 1, 2, 3])
+def test_engines_match_brute_force(algorithm, min_support, max_len):
+    basket = fixed_basket()
+    expected = brute_force(basket, min_support, max_len)
+    result = frequent_itemsets(basket, min_support, algorithm=algorithm, max_len=max_len)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("max_len", [None, 2])
+def test_engines_agree(max_len):
+    basket = fixed_basket()
+    frames = {algorithm: frequent_itemsets(basket, 0.05, algorithm=algorithm, max_len=max_len) for algorithm in ENGINES}
+    for algorithm, frame in frames.items():
+        pd.testing.assert_frame_equal(frame, frames["apriori"], obj=algorithm)
+
+
+@pytest.fixture
+def small_partitions(monkeypatch):
+    # Partition even tiny baskets, whatever the machine's core count
+    monkeypatch.setattr(engines, "MIN_PARTITION_TRANSACTIONS", 1)
+    monkeypatch.setattr(engines, "MAX_PARALLEL_WORKERS", 8)
+
+
+def skewed_basket():
+    # Bills sorted so that item pairs are frequent in some partitions only
+    rows = []
+    for bill in range(41):
+        items = ["a", "b", "c"] if bill < 12 else ["d", "e"] if bill < 30 else ["a", "e", "f"]
+        rows += [{"BILLNO": bill, "ITEMNAME": item} for item in items[:1 + bill % len(items)]]
+    return encode_basket(pd.DataFrame(rows), "BILLNO", "ITEMNAME")
+
+
+@pytest.mark.parametrize("algorithm", list(ENGINES))
+@pytest.mark.parametrize("workers", [2, 3])
+@pytest.mark.parametrize("max_len", [None, 2])
+@pytest.mark.parametrize("make_basket", [fixed_basket, skewed_basket])
+def test_partitioned_matches_serial(small_partitions, algorithm, workers, max_len, make_basket):
+    # 40 bills split evenly in two; 41 bills (skewed_basket) never split evenly
+    basket = make_basket()
+    assert len(partition_bounds(basket.n_transactions, workers)) == workers
+    for min_support in (0.05, 0.1, 0.3):
+        serial = frequent_itemsets(basket, min_support, algorithm=algorithm, max_len=max_len)
+        parallel = frequent_itemsets(basket, min_support, algorithm=algorithm, max_len=max_len, workers=workers)
+        pd.testing.assert_frame_equal(parallel, serial)
+
+
+@pytest.mark.parametrize("bounds", [[(0, 3), (3, 41)], [(0, 30), (30, 31), (31, 41)]])
+def test_partitioned_with_lopsided_partitions(small_partitions, monkeypatch, bounds):
+    basket = skewed_basket()
+    monkeypatch.setattr(engines, "partition_bounds", lambda n_transactions, workers: bounds)
+    for min_support in (0.05, 0.2):
+        serial = frequent_itemsets(basket, min_support, algorithm="eclat")
+        parallel = frequent_itemsets(basket, min_support, algorithm="eclat", workers=len(bounds))
+        pd.testing.assert_frame_equal(parallel, serial)
+
+
+def test_support_threshold_is_inclusive():
+    # 2 of 8 bills is exactly 0.25
+    df = pd.DataFrame({"BILLNO": [1, 1, 2, 2, 3, 4, 5, 6, 7, 8], "ITEMNAME": ["a", "b", "a", "b", "a", "c", "c", "c", "d", "d"]})
+    basket = encode_basket(df, "BILLNO", "ITEMNAME")
+    for algorithm in ENGINES:
+        itemsets = frequent_itemsets(basket, 0.25, algorithm=algorithm)
+        assert frozenset([0, 1]) in set(itemsets["itemsets"]), algorithm
+
+
+def test_eclat_without_bitwise_count(monkeypatch):
+    basket = fixed_basket()
+    expected = frequent_itemsets(basket, 0.05, algorithm="eclat")
+    monkeypatch.delattr(np, "bitwise_count")
+    pd.testing.assert_frame_equal(frequent_itemsets(basket, 0.05, algorithm="eclat"), expected)
+
+
+def test_rejects_bad_arguments():
+    basket = fixed_basket()
+    with pytest.raises(ValueError):
+        frequent_itemsets(basket, 0.1, algorithm="nope")
+    with pytest.raises(ValueError):
+        frequent_itemsets(basket, 0.1, max_len=0)
+    with pytest.raises(ValueError):
+        frequent_itemsets(basket, 0.0)
@@ -0,0 +1,174 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+import mining
+from basket import encode_basket
+from engines import frequent_itemsets
+from incremental import INCREMENTAL, DeltaLog, IncrementalMiner
+from jobs import JobManager, report_progress
+from mining import build_rules, decode_rules, mine_delta, mine_incremental
+
+MIN_SUPPORT = 0.06
+MIN_CONFIDENCE = 0.2
+
+
+def bills(start, count, items, seed, size=(1, 5)):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for bill in range(start, start + count):
+        for item in rng.choice(items, size=int(rng.integers(*size)), replace=False):
+            rows.append({"BILLNO": f"B{bill:04d}", "ITEMNAME": item})
+    return pd.DataFrame(rows)
+
+
+def deltas():
+    # New bills, including items the history has never seen
+    new_items = bills(60, 25, ["A", "B", "X", "Y", "Z"], seed=2, size=(2, 5))
+    # Bills already in the history sent again: some lines repeated, some items added
+    resent = pd.DataFrame({
+        "BILLNO": ["B0001", "B0001", "B0002", "B0003", "B0003", "B0004", "B0005", "B0070"],
+        "ITEMNAME": ["A", "X", "X", "Y", "C", "X", "Y", "A"],
+    })
+    # Many single-item bills, which raise the minimum count so itemsets drop out
+    filler = pd.DataFrame({"BILLNO": [f"F{bill:04d}" for bill in range(60)], "ITEMNAME": "W"})
+    return [new_items, resent, filler]
+
+
+def fresh(df, max_len):
+    basket = encode_basket(df, "BILLNO", "ITEMNAME")
+    itemsets = frequent_itemsets(basket, MIN_SUPPORT, algorithm="eclat", max_len=max_len)
+    table = build_rules(basket, itemsets, MIN_CONFIDENCE, basket.first_seen)
+    return basket, itemsets, decode_rules(table, basket)
+
+
+@pytest.mark.parametrize("max_len", [None, 2, 3])
+def test_deltas_match_full_recompute(max_len):
+    history = bills(0, 60, list("ABCDEFGH"), seed=1)
+    basket = encode_basket(history, "BILLNO", "ITEMNAME")
+    state = IncrementalMiner(basket, basket.decode(basket.first_seen), "BILLNO", "ITEMNAME", MIN_SUPPORT, max_len)
+
+    combined = history
+    added = dropped = 0
+    for delta in deltas():
+        result = mine_delta(state, delta, "Sheet1", MIN_CONFIDENCE, 0)
+        combined = pd.concat([combined, delta], ignore_index=True)
+        expected_basket, expected_itemsets, expected_rules = fresh(combined, max_len)
+
+        assert state.n_transactions == expected_basket.n_transactions
+        assert list(state.items) == list(expected_basket.items)
+        pd.testing.assert_frame_equal(state.itemsets_frame(), expected_itemsets)
+        assert result["rules"] == expected_rules
+        assert state.verify()
+        added += result["stats"]["added_itemsets"]
+        dropped += result["stats"]["dropped_itemsets"]
+
+    # The deltas move itemsets across the threshold in both directions
+    assert added > 0 and dropped > 0
+
+
+def test_delta_stats():
+    history = bills(0, 60, list("ABCDEFGH"), seed=1)
+    basket = encode_basket(history, "BILLNO", "ITEMNAME")
+    state = IncrementalMiner(basket, basket.decode(basket.first_seen), "BILLNO", "ITEMNAME", MIN_SUPPORT)
+    new_items, resent, _ = deltas()
+
+    stats = state.apply(new_items)
+    assert stats["new_transactions"] == 25 and stats["updated_transactions"] == 0
+    assert stats["new_items"] == 3
+
+    stats = state.apply(resent)
+    # B0070 came with the first delta; every re-sent bill gains at least one item
+    assert stats["new_transactions"] == 0
+    assert stats["updated_transactions"] == 6
+    assert stats["new_items"] == 0
+
+    # Sending the same rows again changes nothing
+    before = dict(state.itemsets)
+    stats = state.apply(resent)
+    assert stats["updated_transactions"] == 0 and state.itemsets == before
+
+
+def test_empty_delta():
+    history = bills(0, 30, list("ABCD"), seed=3)
+    basket = encode_basket(history, "BILLNO", "ITEMNAME")
+    state = IncrementalMiner(basket, basket.decode(basket.first_seen), "BILLNO", "ITEMNAME", MIN_SUPPORT)
+    before = dict(state.itemsets)
+    stats = state.apply(pd.DataFrame({"BILLNO": [None], "ITEMNAME": ["A"]}))
+    assert stats["rows"] == 0 and state.itemsets == before and state.batches == 0
+
+
+@pytest.fixture
+def sheets(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "CACHE_DIR", tmp_path / "cache")
+    INCREMENTAL.clear()
+    paths = []
+    for seed in (1, 4):
+        path = tmp_path / f"sales{seed}.csv"
+        bills(0, 60, list("ABCDEFGH"), seed=seed).to_csv(path, index=False)
+        paths.append(str(path))
+    yield paths
+    INCREMENTAL.clear()
+
+
+def incremental_kwargs(path):
+    return {
+        "path": path, "sheet_name": ingest.CSV_SHEET_NAME, "transaction_column": "BILLNO", "item_column": "ITEMNAME",
+        "min_support": MIN_SUPPORT, "min_confidence": MIN_CONFIDENCE, "max_rules": 0,
+    }
+
+
+def test_incremental_job_matches_full_recompute(sheets):
+    jobs = JobManager(workers=1)
+    try:
+        delta = deltas()[0]
+        job, _ = jobs.submit(
+            "delta", mine_incremental, ("first",), delta, progress=report_progress, in_process=True, **incremental_kwargs(sheets[0])
+        )
+        result = job.future.result(30)
+    finally:
+        jobs.shutdown()
+    combined = pd.concat([pd.read_csv(sheets[0]), delta], ignore_index=True)
+    assert result["rules"] == fresh(combined, None)[2]
+    assert job.status == "done" and result["state"]["batches"] == 1
+
+
+def test_building_one_state_does_not_block_others(sheets):
+    # A state being built for one dataset holds only that dataset's lock
+    with mining._incremental_locks_guard:
+        busy = mining._incremental_locks.setdefault(("busy",), threading.Lock())
+    with busy:
+        finished = threading.Event()
+        worker = threading.Thread(target=lambda: (mine_incremental(("other",), deltas()[1], **incremental_kwargs(sheets[1])), finished.set()))
+        worker.start()
+        assert finished.wait(30)
+        worker.join()
+    assert INCREMENTAL.get(("other",)) is not None
+
+
+def test_logged_deltas_outlive_the_state(sheets):
+    # An evicted (or restarted, or other process's) state is rebuilt with every delta applied so far
+    dataset_key = (sheets[0],)
+    state_key = (dataset_key, MIN_SUPPORT, None)
+    first, second, third = deltas()
+    mine_incremental(state_key, first, **incremental_kwargs(sheets[0]))
+    INCREMENTAL.clear()
+    result = mine_incremental(state_key, second, **incremental_kwargs(sheets[0]))
+    combined = pd.concat([pd.read_csv(sheets[0]), first, second], ignore_index=True)
+    assert result["rules"] == fresh(combined, None)[2]
+    assert result["state"]["logged_batches"] == 2 and result["stats"]["replayed_batches"] == 0
+
+    # A batch logged by another process is applied before this one
+    assert DeltaLog(dataset_key).append(third, 2)
+    result = mine_incremental(state_key, first, **incremental_kwargs(sheets[0]))
+    combined = pd.concat([combined, third, first], ignore_index=True)
+    assert result["rules"] == fresh(combined, None)[2]
+    assert result["stats"]["replayed_batches"] == 1 and DeltaLog(dataset_key).count() == 4
+
+    # A full run over the sheet and the logged deltas finds the same rules
+    full = mining.mine_sheet(algorithm="eclat", deltas=(dataset_key, 4), **incremental_kwargs(sheets[0]))
+    assert full["rules"] == result["rules"]
+    assert not DeltaLog(dataset_key).append(third, 3)
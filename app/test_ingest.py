@@ -0,0 +1,118 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+from ingest import load_sheet, sheet_header, sheet_meta, sheet_names
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(ingest, "_manifests", {})
+    monkeypatch.setattr(ingest, "_fingerprints", {})
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    # Sheets parsed from the source file rather than served from the cache
+    built = []
+    build = ingest._build_sheet
+
+    def counting(path, sheet_name, destination, progress=None):
+        built.append((path, sheet_name))
+        return build(path, sheet_name, destination, progress=progress)
+
+    monkeypatch.setattr(ingest, "_build_sheet", counting)
+    return built
+
+
+def sales(rows=30, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "BILLNO": rng.integers(1000, 1010, rows),
+        "ITEMNAME": rng.choice(["TEA", "SUGAR", "MILK", "RICE"], rows),
+        "QTY": rng.random(rows).round(2),
+        "BILLDATE": pd.date_range("2024-04-01", periods=rows, freq="D"),
+    })
+
+
+def test_workbook_matches_read_excel(cache, tmp_path, monkeypatch):
+    # Small chunks so that column types are widened across chunks: the bill
+    # numbers turn from numbers into text part way down the sheet
+    monkeypatch.setattr(ingest, "INGEST_CHUNK_ROWS", 7)
+    df = sales()
+    df["BILLNO"] = df["BILLNO"].astype(object)
+    df.loc[20:, "BILLNO"] = [f"X{i}" for i in range(10)]
+    df.loc[3, "QTY"] = np.nan
+    path = tmp_path / "sales.xlsx"
+    with pd.ExcelWriter(path) as writer:
+        df.to_excel(writer, sheet_name="April", index=False)
+        df.head(5).to_excel(writer, sheet_name="May", index=False)
+
+    assert sheet_names(str(path)) == ["April", "May"]
+    for sheet in ("April", "May"):
+        expected = pd.read_excel(path, sheet_name=sheet)
+        pd.testing.assert_frame_equal(load_sheet(str(path), sheet), expected)
+
+
+def test_cached_sheet_is_not_parsed_again(cache, builds, tmp_path):
+    path = tmp_path / "sales.csv"
+    sales().to_csv(path, index=False)
+
+    first = load_sheet(str(path), ingest.CSV_SHEET_NAME)
+    again = load_sheet(str(path), ingest.CSV_SHEET_NAME, columns=["ITEMNAME", "BILLNO"])
+    assert len(builds) == 1
+    pd.testing.assert_frame_equal(again, first[["ITEMNAME", "BILLNO"]])
+
+    # A new process finds the sheet on disk rather than in memory
+    ingest._manifests.clear()
+    ingest._fingerprints.clear()
+    pd.testing.assert_frame_equal(load_sheet(str(path), ingest.CSV_SHEET_NAME), first)
+    assert len(builds) == 1
+    assert sheet_header(str(path), ingest.CSV_SHEET_NAME) == {"columns": list(first.columns), "rows": len(first), "exact": True}
+
+
+def test_changed_file_is_ingested_again(cache, builds, tmp_path):
+    path = tmp_path / "sales.csv"
+    sales(seed=1).to_csv(path, index=False)
+    before = sheet_meta(str(path), ingest.CSV_SHEET_NAME)
+
+    changed = sales(rows=40, seed=2)
+    changed.to_csv(path, index=False)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    after = sheet_meta(str(path), ingest.CSV_SHEET_NAME)
+    assert len(builds) == 2
+    assert after["fingerprint"]["sha256"] != before["fingerprint"]["sha256"]
+    assert after["rows"] == 40
+    pd.testing.assert_frame_equal(load_sheet(str(path), ingest.CSV_SHEET_NAME), pd.read_csv(path))
+    # The cache of the earlier version is removed
+    assert not os.path.exists(before["directory"])
+
+
+def test_unknown_sheet(cache, tmp_path):
+    path = tmp_path / "sales.csv"
+    sales().to_csv(path, index=False)
+    with pytest.raises(ValueError):
+        sheet_meta(str(path), "Sheet2")
+    with pytest.raises(KeyError):
+        load_sheet(str(path), ingest.CSV_SHEET_NAME, columns=["BILLNO", "NOPE"])
+
+
+def test_concurrent_manifest_writes(cache, tmp_path):
+    # Several threads (or processes) writing the same manifest at once
+    path = tmp_path / "sales.csv"
+    sales().to_csv(path, index=False)
+    fingerprint = ingest.workbook_fingerprint(str(path))
+    manifest = ingest._workbook_dir(fingerprint) / "workbook.json"
+    manifest.parent.mkdir(parents=True)
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: ingest._write_json(manifest, {"writer": i}), range(200)))
+    assert ingest._read_json(manifest)["writer"] in range(200)
+    assert [p.name for p in manifest.parent.iterdir()] == ["workbook.json"]
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobManager, JobQueueFull, report_progress
+
+
+@pytest.fixture
+def manager():
+    jobs = JobManager(workers=1, max_pending=2)
+    yield jobs
+    jobs.shutdown()
+
+
+def test_identical_jobs_share_one_run(manager):
+    first, duplicate = manager.submit("key", time.sleep, 0.5)
+    assert not duplicate
+    second, duplicate = manager.submit("key", time.sleep, 0.5)
+    assert duplicate and second is first
+    assert manager.stats()["deduplicated"] == 1
+
+
+def test_in_flight_until_on_done_has_run(manager):
+    # A request arriving while on_done fills the caches must join the finished
+    # job rather than start another run
+    seen = {}
+    done = threading.Event()
+
+    def on_done(result):
+        seen["job"], seen["duplicate"] = manager.submit("key", sum, [1, 2])
+        done.set()
+
+    job, _ = manager.submit("key", sum, [1, 2], on_done=on_done)
+    assert done.wait(10)
+    assert seen["duplicate"] and seen["job"] is job
+    assert job.status == "done" and job.result == 3
+
+
+def test_queue_limit(manager):
+    manager.submit("a", time.sleep, 0.5)
+    manager.submit("b", time.sleep, 0.5)
+    with pytest.raises(JobQueueFull):
+        manager.submit("c", time.sleep, 0.5)
+
+
+def test_in_process_job_shares_limit_and_reports_progress(manager):
+    state = {"rows": []}
+    started, release = threading.Event(), threading.Event()
+
+    def apply(rows):
+        report_progress("delta", 0.5)
+        started.set()
+        release.wait(10)
+        state["rows"].extend(rows)
+        return state
+
+    job, _ = manager.submit("incremental", apply, [1, 2], in_process=True)
+    assert started.wait(10)
+    assert job.status == "running" and job.stage == "delta"
+    manager.submit("other", time.sleep, 0.5)
+    with pytest.raises(JobQueueFull):
+        manager.submit("third", time.sleep, 0.5)
+    release.set()
+    # The result is the object itself, not a copy from another process
+    assert job.future.result(10) is state and state["rows"] == [1, 2]
+
+
+def test_ingest_job_fills_the_cache_for_this_process(tmp_path, monkeypatch):
+    # The sheet is parsed in a worker process; this one then reads the cached
+    # columns without parsing the file itself
+    import pandas as pd
+
+    import ingest
+
+    cache = tmp_path / "cache"
+    monkeypatch.setenv("INGEST_CACHE_DIR", str(cache))
+    monkeypatch.setattr(ingest, "CACHE_DIR", cache)
+    path = tmp_path / "sales.csv"
+    pd.DataFrame({"BILLNO": [1, 1, 2], "ITEMNAME": ["a", "b", "a"]}).to_csv(path, index=False)
+    assert not ingest.sheet_header(str(path), ingest.CSV_SHEET_NAME)["exact"]
+
+    jobs = JobManager(workers=1)
+    try:
+        job, _ = jobs.submit("ingest", ingest.ingest_sheet, str(path), ingest.CSV_SHEET_NAME, progress=report_progress)
+        assert job.future.result(60)["rows"] == 3
+    finally:
+        jobs.shutdown()
+    built = []
+    monkeypatch.setattr(ingest, "_build_sheet", lambda *args, **kwargs: built.append(args))
+    assert ingest.sheet_header(str(path), ingest.CSV_SHEET_NAME)["exact"]
+    assert ingest.sheet_meta(str(path), ingest.CSV_SHEET_NAME)["rows"] == 3 and not built
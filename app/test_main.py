@@ -0,0 +1,12 @@
+import subprocess
+import sys
+from pathlib import Path
+
+
+def test_import_does_not_load_pandas_or_scipy():
+    # The mining stack is imported by the handlers that use it, not at startup
+    check = "import sys, main; print(sorted(m for m in ('pandas', 'scipy', 'mining', 'ingest') if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", check], cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,54 @@
+import pytest
+
+import metrics
+from metrics import Histogram, Metrics, StageRecorder, profile_call, profile_report, server_timing
+
+
+def test_stage_recorder_keeps_counts_and_failed_stages():
+    timings = StageRecorder()
+    with timings.stage("read") as stage:
+        stage["rows"] = 12
+    with pytest.raises(RuntimeError):
+        with timings.stage("encode"):
+            raise RuntimeError("bad sheet")
+    assert [entry["stage"] for entry in timings.stages] == ["read", "encode"]
+    assert timings.stages[0]["rows"] == 12
+    assert all(entry["seconds"] >= 0 and "peak_rss_bytes" in entry for entry in timings.stages)
+
+
+def test_server_timing_header():
+    stages = [{"stage": "read", "seconds": 0.0123}, {"stage": "cache", "seconds": 0.0004, "desc": "hit"}]
+    assert server_timing(stages) == 'read;dur=12.3, cache;dur=0.4;desc="hit"'
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, '/a"b')
+    lines = histogram.expose()
+    assert lines[2:] == [
+        'latency_seconds_bucket{route="/a\\"b",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a\\"b",le="1.0"} 3',
+        'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a\\"b"} 3.65',
+        'latency_seconds_count{route="/a\\"b"} 4',
+    ]
+
+
+def test_stage_metrics_and_collectors():
+    registry = Metrics()
+    registry.observe_stages([{"stage": "rules", "seconds": 0.2, "peak_rss_bytes": 2048, "rules": 40, "desc": "reused"}])
+    registry.register_collector("cache_hits", "Cache hits", "cache", lambda: {"results": 3, "itemsets": 1})
+    text = registry.expose()
+    assert 'mining_stage_duration_seconds_count{stage="rules"} 1' in text
+    assert 'mining_stage_peak_rss_bytes{stage="rules"} 2048' in text
+    assert 'mining_stage_count{stage="rules",kind="rules"} 40' in text
+    assert 'kind="desc"' not in text
+    assert 'cache_hits{cache="itemsets"} 1\ncache_hits{cache="results"} 3\n' in text
+
+
+def test_profile_report(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "PROFILE_DIR", tmp_path)
+    assert profile_call("run", sorted, [3, 1, 2]) == [1, 2, 3]
+    assert "function calls" in profile_report("run")
+    assert profile_report("missing") is None
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from recommend import IndexRegistry, RecommendationIndex
+from rule_table import RuleTable
+
+ITEMS = np.array(["Tea", "sugar", "Milk", "rice", "Teapot"], dtype=object)
+
+
+def rule_table():
+    # Tea has three rules whose order differs by every metric; Milk has one
+    return RuleTable(
+        np.array([0, 2, 0, 0]),
+        [[1], [0], [2], [3, 4]],
+        np.array([0.10, 0.05, 0.30, 0.20]),
+        np.array([0.50, 0.40, 0.20, 0.90]),
+        np.array([3.0, 1.5, 1.0, 2.0]),
+    )
+
+
+@pytest.mark.parametrize("sort,expected", [
+    ("lift", [["sugar"], ["rice", "Teapot"], ["Milk"]]),
+    ("confidence", [["rice", "Teapot"], ["sugar"], ["Milk"]]),
+    ("support", [["Milk"], ["rice", "Teapot"], ["sugar"]]),
+])
+def test_recommendations_sorted_by_metric(sort, expected):
+    index = RecommendationIndex(rule_table(), ITEMS)
+    recommendations = index.recommend("Tea", k=0, sort=sort)
+    assert [rule["consequents"] for rule in recommendations] == expected
+    assert all(rule["antecedents"] == ["Tea"] for rule in recommendations)
+    assert index.recommend("Tea", k=2, sort=sort) == recommendations[:2]
+
+
+def test_rules_match_the_table():
+    table = rule_table()
+    index = RecommendationIndex(table, ITEMS)
+    (rule,) = index.recommend("Milk")
+    assert rule == {"antecedents": ["Milk"], "consequents": ["Tea"], "support": 0.05, "confidence": 0.4, "lift": 1.5}
+    assert index.describe()["rules"] == len(table) and len(index) == 2
+
+
+def test_unknown_products_and_metrics():
+    index = RecommendationIndex(rule_table(), ITEMS)
+    assert index.recommend("sugar") == [] and "sugar" not in index
+    assert "Tea" in index and "tea" not in index
+    with pytest.raises(ValueError):
+        index.recommend("Tea", sort="price")
+
+
+def test_prefix_search_is_case_insensitive():
+    index = RecommendationIndex(rule_table(), ITEMS)
+    assert index.search("te") == ["Tea"]
+    assert index.search("") == ["Milk", "Tea"]
+    assert index.search("", limit=1) == ["Milk"]
+    assert index.products == ["Milk", "Tea"]
+
+
+def test_index_attached_from_arrays():
+    index = RecommendationIndex(rule_table(), ITEMS, source={"sheet": "Sheet1"})
+    attached = RecommendationIndex.from_arrays(ITEMS, index.arrays(), index.meta())
+    for sort in ("lift", "confidence", "support"):
+        assert attached.recommend("Tea", k=0, sort=sort) == index.recommend("Tea", k=0, sort=sort)
+    assert attached.source == {"sheet": "Sheet1"}
+
+
+def test_registry_keeps_most_recent_indexes():
+    registry = IndexRegistry(max_indexes=2)
+    indexes = [RecommendationIndex(rule_table(), ITEMS) for _ in range(3)]
+    for key, index in zip("abc", indexes):
+        registry.publish(key, index)
+    assert registry.get("a") is None
+    assert registry.get("b") is indexes[1] and registry.latest() is indexes[2]
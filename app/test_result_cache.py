@@ -0,0 +1,88 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from basket import encode_basket
+from engines import frequent_itemsets
+from result_cache import ItemsetCache, LRUCache, estimate_bytes
+
+
+def sales_basket():
+    rng = np.random.default_rng(7)
+    rows = [{"BILLNO": bill, "ITEMNAME": f"ITEM {item}"} for bill in range(100) for item in rng.choice(8, size=int(rng.integers(1, 5)), replace=False)]
+    return encode_basket(pd.DataFrame(rows), "BILLNO", "ITEMNAME")
+
+
+@pytest.mark.parametrize("min_support,max_len", [(0.05, None), (0.1, None), (0.2, 2), (0.1, 1)])
+def test_itemsets_reused_at_higher_support(min_support, max_len):
+    basket = sales_basket()
+    cache = ItemsetCache(4)
+    cache.store(("sales",), 0.05, None, frequent_itemsets(basket, 0.05))
+    cached = cache.lookup(("sales",), min_support, max_len)
+    pd.testing.assert_frame_equal(cached, frequent_itemsets(basket, min_support, max_len=max_len))
+    assert cache.stats()["hits"] == 1
+
+
+def test_itemsets_not_reused_when_they_cannot_answer():
+    cache = ItemsetCache(4)
+    cache.store(("sales",), 0.1, 2, frequent_itemsets(sales_basket(), 0.1, max_len=2))
+    assert cache.lookup(("sales",), 0.05, 2) is None  # lower support
+    assert cache.lookup(("sales",), 0.1, None) is None  # longer itemsets
+    assert cache.lookup(("other",), 0.1, 2) is None  # another dataset
+    assert cache.stats()["misses"] == 3 and cache.stats()["hits"] == 0
+
+
+def test_closest_support_serves_the_lookup():
+    cache = ItemsetCache(4)
+    basket = sales_basket()
+    for support in (0.05, 0.15, 0.3):
+        cache.store(("sales",), support, None, frequent_itemsets(basket, support))
+    cache.store(("sales",), 0.25, None, None)
+    # 0.15 is the highest support at or below 0.2; 0.25 would be wrong
+    pd.testing.assert_frame_equal(cache.lookup(("sales",), 0.2, None), frequent_itemsets(basket, 0.2))
+
+
+def test_concurrent_lookups_are_all_counted():
+    cache = ItemsetCache(4)
+    cache.store(("sales",), 0.1, None, frequent_itemsets(sales_basket(), 0.1))
+
+    def look():
+        for i in range(500):
+            cache.lookup(("sales",), 0.05 if i % 2 else 0.2, None)
+
+    threads = [threading.Thread(target=look) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats["hits"] == stats["misses"] == 2000
+
+
+def test_byte_budget_evicts_least_recently_used():
+    cache = LRUCache(10, max_bytes=2500)
+    for key in "abc":
+        cache.put(key, np.zeros(100))  # 800 bytes each
+    assert cache.get("a") is not None
+    cache.put("d", np.zeros(100))
+    # b was the least recently used once a was read
+    assert cache.get("b") is None
+    assert cache.bytes == 2400 and cache.stats()["evictions"] == 1
+    # Replacing an entry counts only its new size
+    cache.put("a", np.zeros(50))
+    assert cache.bytes == 2000
+    # Larger than the whole budget: not kept, nothing evicted for it
+    cache.put("big", np.zeros(1000))
+    assert cache.get("big") is None and cache.stats()["rejected"] == 1 and cache.bytes == 2000
+    cache.clear()
+    assert cache.bytes == 0
+
+
+def test_estimate_bytes_scales_with_long_lists():
+    rule = {"antecedents": ["TEA"], "consequents": ["SUGAR", "MILK"], "support": 0.1, "confidence": 0.5, "lift": 2.0}
+    small, large = estimate_bytes([dict(rule) for _ in range(10)]), estimate_bytes([dict(rule) for _ in range(10000)])
+    assert 900 < large / small < 1100
+    frame = pd.DataFrame({"support": np.zeros(1000)})
+    assert estimate_bytes(frame) >= 8000
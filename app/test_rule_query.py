@@ -0,0 +1,96 @@
+import json
+
+import numpy as np
+import pytest
+
+import rule_query
+from rule_query import decode_cursor, dumps, encode_cursor, ndjson_lines, paginate, rule_matches, select_rules
+from rule_table import RuleRows, RuleTable
+
+ITEMS = np.array(["TEA", "SUGAR", "MILK", 101, "RICE"], dtype=object)
+
+
+@pytest.fixture(autouse=True)
+def fresh_matches(monkeypatch):
+    monkeypatch.setattr(rule_query, "_matches", rule_query.LRUCache(32))
+
+
+def rule_rows(n=50, seed=0):
+    rng = np.random.default_rng(seed)
+    antecedent = rng.integers(0, len(ITEMS), n)
+    consequents = [sorted(rng.choice([i for i in range(len(ITEMS)) if i != a], size=int(rng.integers(1, 3)), replace=False).tolist()) for a in antecedent]
+    table = RuleTable(antecedent, consequents, rng.random(n) / 10, rng.random(n), rng.random(n) * 4)
+    return RuleRows(table, ITEMS, table.top(0))
+
+
+FILTERS = [
+    {},
+    {"antecedent": "TEA"},
+    {"consequent": "101"},
+    {"antecedent": "SUGAR", "consequent": "MILK"},
+    {"min_lift": 2.0, "min_confidence": 0.5},
+    {"antecedent": "COFFEE"},
+]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_column_filters_match_rule_filters(filters):
+    rules = rule_rows()
+    filters = {"antecedent": None, "consequent": None, "min_lift": None, "min_confidence": None, **filters}
+    expected = [i for i, rule in enumerate(rules.to_list()) if rule_matches(rule, **filters)]
+    assert rules.matching(**filters).tolist() == expected
+
+
+@pytest.mark.parametrize("as_list", [False, True])
+def test_cursor_pages_cover_the_filtered_rules(as_list):
+    rules = rule_rows()
+    source = rules.to_list() if as_list else rules
+    filters = {"min_lift": 1.0}
+    expected = [rule for rule in rules.to_list() if rule["lift"] >= 1.0]
+
+    pages, cursor = [], None
+    while True:
+        positions, total, cursor = paginate(source, ("result",), filters, cursor=cursor, limit=7)
+        pages.extend(select_rules(source, positions))
+        assert total == len(expected)
+        if cursor is None:
+            break
+    assert pages == expected
+
+
+def test_cursor_belongs_to_its_query():
+    cursor = encode_cursor(14, "abc")
+    assert decode_cursor(cursor, "abc") == 14
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "other")
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor", "abc")
+    _, _, cursor = paginate(rule_rows(), ("result",), {}, limit=5)
+    with pytest.raises(ValueError):
+        paginate(rule_rows(), ("another result",), {}, cursor=cursor)
+
+
+def test_ndjson_is_one_rule_per_line_in_pages():
+    rules = rule_rows()
+    positions = rules.matching(min_lift=0.5)
+    chunks = list(ndjson_lines(rules, positions, page_rows=8))
+    assert len(chunks) == -(-len(positions) // 8)
+    lines = b"".join(chunks).split(b"\n")
+    assert lines[-1] == b""
+    assert [json.loads(line) for line in lines[:-1]] == json.loads(dumps(rules.select(positions)))
+
+
+def test_rule_rows_decode_only_what_is_read():
+    rules = rule_rows()
+    best = int(rules.rows[0])
+    rules.table.consequents[int(rules.rows[-1])] = None  # decoding this rule would fail
+    assert rules[0]["antecedents"] == [ITEMS[rules.table.antecedent[best]]]
+    assert rules[0]["lift"] == rules.table.lift.max()
+    assert len(rules[:10]) == 10
+    assert [len(page) for page in rules.pages(np.arange(20), size=6)] == [6, 6, 6, 2]
+
+
+def test_rule_rows_serialise_as_a_list():
+    rules = rule_rows(5)
+    assert json.loads(dumps({"rules": rules})) == {"rules": json.loads(dumps(rules.to_list()))}
+    assert rules == rules.to_list() and rules == rule_rows(5)
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+from basket import encode_basket
+from engines import frequent_itemsets
+from mining import build_rules, decode_rules, generate_rules, mine_index, mine_sheet
+from rule_table import single_antecedent_rules, top_single_antecedent_rules
+
+
+def reference_rules(basket, itemsets, min_confidence):
+    # Single-antecedent rules as the API used to compute them with mlxtend
+    from mlxtend.frequent_patterns import association_rules
+
+    rules = association_rules(itemsets, metric="confidence", min_threshold=min_confidence)
+    rules = rules[rules["antecedents"].map(len) == 1]
+    return {
+        (next(iter(a)), tuple(sorted(c))): (s, conf, lift)
+        for a, c, s, conf, lift in zip(rules["antecedents"], rules["consequents"], rules["support"], rules["confidence"], rules["lift"])
+    }
+
+
+def generated_rules(basket, itemsets, min_confidence):
+    table = generate_rules(basket, itemsets, min_confidence)
+    return {
+        (int(table.antecedent[i]), tuple(table.consequents[i])): (table.support[i], table.confidence[i], table.lift[i])
+        for i in range(len(table))
+    }
+
+
+def boundary_basket():
+    # Item a is in 10 of 12 bills and {a, b} in one: confidence 1/10 lands just
+    # below 0.1 as sAC / sA but exactly on it as sAC * n / (sA * n)
+    bills = [["a", "b"]] + [["a"]] * 9 + [["b", "c"], ["b", "c"]]
+    rows = [{"BILLNO": bill, "ITEMNAME": item} for bill, items in enumerate(bills) for item in items]
+    return encode_basket(pd.DataFrame(rows), "BILLNO", "ITEMNAME")
+
+
+def random_basket():
+    rng = np.random.default_rng(5)
+    rows = []
+    for bill in range(120):
+        for item in rng.choice(9, size=int(rng.integers(1, 5)), replace=False, p=np.linspace(2, 0.5, 9) / np.linspace(2, 0.5, 9).sum()):
+            rows.append({"BILLNO": bill, "ITEMNAME": f"ITEM {item:02d}"})
+    return encode_basket(pd.DataFrame(rows), "BILLNO", "ITEMNAME")
+
+
+@pytest.mark.parametrize("make_basket,min_support", [(boundary_basket, 0.05), (random_basket, 0.02), (random_basket, 0.05)])
+@pytest.mark.parametrize("min_confidence", [0.05, 0.1, 0.2, 0.5])
+def test_matches_mlxtend_association_rules(make_basket, min_support, min_confidence):
+    basket = make_basket()
+    itemsets = frequent_itemsets(basket, min_support)
+    assert generated_rules(basket, itemsets, min_confidence) == reference_rules(basket, itemsets, min_confidence)
+
+
+def test_boundary_rule_is_dropped_like_mlxtend():
+    basket = boundary_basket()
+    itemsets = frequent_itemsets(basket, 0.05)
+    rules = generated_rules(basket, itemsets, 0.1)
+    assert (0, (1,)) not in rules
+    assert (1, (0,)) in rules
+
+
+def test_top_k_keeps_highest_lift_rules():
+    basket = random_basket()
+    itemsets = frequent_itemsets(basket, 0.02)
+    full = generate_rules(basket, itemsets, 0.1)
+    limited = generate_rules(basket, itemsets, 0.1, top_k=2)
+    assert np.bincount(limited.antecedent).max() <= 2
+    for product in np.unique(full.antecedent):
+        best = np.sort(full.lift[full.antecedent == product])[::-1][:2]
+        np.testing.assert_array_equal(np.sort(limited.lift[limited.antecedent == product])[::-1], best)
+
+
+def tied_basket():
+    # Small bills over few items, so that many rules of different products share a lift
+    rng = np.random.default_rng(8)
+    rows = []
+    for bill in range(60):
+        for item in rng.choice(12, size=int(rng.integers(1, 4)), replace=False):
+            rows.append({"BILLNO": bill, "ITEMNAME": f"ITEM {item:02d}"})
+    return encode_basket(pd.DataFrame(rows), "BILLNO", "ITEMNAME")
+
+
+@pytest.mark.parametrize("make_basket", [random_basket, tied_basket])
+@pytest.mark.parametrize("top_k", [0, 1, 3])
+@pytest.mark.parametrize("max_rules", [1, 5, 20, 1000])
+def test_rules_for_max_rules_match_every_rule(make_basket, top_k, max_rules):
+    basket = make_basket()
+    itemsets = frequent_itemsets(basket, 0.02)
+    for min_confidence in (0.05, 0.3):
+        full = build_rules(basket, itemsets, min_confidence, basket.first_seen, top_k=top_k)
+        bounded = build_rules(basket, itemsets, min_confidence, basket.first_seen, top_k=top_k, max_rules=max_rules)
+        assert decode_rules(bounded, basket, max_rules) == decode_rules(full, basket, max_rules)
+        assert len(bounded) <= len(full)
+        if min_confidence < 0.1 and max_rules == 1:
+            assert len(bounded) < len(full)
+
+
+def test_unbounded_top_rules_are_every_rule():
+    basket = random_basket()
+    itemsets = frequent_itemsets(basket, 0.02)
+    # Products are short of consequents by every confident rule, before top_k
+    every = single_antecedent_rules(itemsets, basket.shape[1], 0.1)
+    for top_k in (0, 2):
+        expected = single_antecedent_rules(itemsets, basket.shape[1], 0.1, top_k=top_k)
+        table, short = top_single_antecedent_rules(itemsets, basket.shape[1], 0.1, len(expected) + 1, top_k=top_k, limit=top_k, min_consequents=5)
+        assert table.to_dicts(basket.items) == expected.to_dicts(basket.items)
+        np.testing.assert_array_equal(short, every.consequent_counts(basket.shape[1]) < 5)
+
+
+def test_mine_sheet_without_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "CACHE_DIR", tmp_path / "cache")
+    path = tmp_path / "sales.csv"
+    basket = random_basket()
+    rows = [(bill, item) for bill, row in zip(basket.transactions, basket.matrix.tolil().rows) for item in basket.decode(row)]
+    pd.DataFrame(rows, columns=["BILLNO", "ITEMNAME"]).to_csv(path, index=False)
+    kwargs = {
+        "path": str(path), "sheet_name": ingest.CSV_SHEET_NAME, "transaction_column": "BILLNO", "item_column": "ITEMNAME",
+        "min_support": 0.02, "min_confidence": 0.1, "max_rules": 5, "algorithm": "eclat",
+    }
+    full = mine_sheet(**kwargs)
+    bounded = mine_sheet(index=False, **kwargs)
+    assert bounded["rules"] == full["rules"] and bounded["index"] is None
+    built = mine_index(**kwargs)
+    assert built["rules"] is None
+    assert built["index"].recommend("ITEM 00", k=0) == full["index"].recommend("ITEM 00", k=0)
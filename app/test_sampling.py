@@ -0,0 +1,115 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+from basket import encode_basket
+from mining import mine_sample, mine_sheet
+from sampling import add_intervals, count_in_chunks, lowered_support, negative_border, sample_basket, wilson_interval
+
+
+def sales_basket(seed=4, count=150):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for bill in range(count):
+        for item in rng.choice(8, size=int(rng.integers(1, 5)), replace=False):
+            rows.append({"BILLNO": bill, "ITEMNAME": f"ITEM {item}"})
+    return encode_basket(pd.DataFrame(rows), "BILLNO", "ITEMNAME")
+
+
+def test_wilson_interval():
+    low, high = wilson_interval(np.array([5, 0, 10]), np.array([10, 10, 10]), 1.96)
+    # The textbook Wilson interval of 5 in 10
+    assert low[0] == pytest.approx(0.2366, abs=1e-4) and high[0] == pytest.approx(0.7634, abs=1e-4)
+    assert low[1] == 0.0 and 0.0 < high[1] < 0.5
+    assert 0.5 < low[2] < 1.0 and high[2] == pytest.approx(1.0)
+
+    # The finite population correction narrows the interval, to nothing for a full sample
+    corrected_low, corrected_high = wilson_interval(5, 10, 1.96, fpc=0.5)
+    assert low[0] < corrected_low < 0.5 < corrected_high < high[0]
+    assert wilson_interval(5, 10, 1.96, fpc=0.0) == (0.5, 0.5)
+
+
+def test_lowered_support():
+    lowered = lowered_support(0.1, 400, level=0.95)
+    assert lowered == pytest.approx(0.1 - 1.6449 * np.sqrt(0.1 * 0.9 / 400), abs=1e-5)
+    # Larger samples need less slack; tiny ones go down to a single bill
+    assert lowered < lowered_support(0.1, 4000, level=0.95) < 0.1
+    assert lowered_support(0.01, 10) == pytest.approx(0.1)
+
+
+def test_negative_border():
+    itemsets = [(0,), (1,), (2,), (0, 1), (0, 2), (1, 2)]
+    assert sorted(negative_border(itemsets, 4)) == [(0, 1, 2), (3,)]
+    assert sorted(negative_border(itemsets, 4, max_len=2)) == [(3,)]
+    assert sorted(negative_border([(0,), (1,), (2,), (0, 1)], 4)) == [(0, 2), (1, 2), (3,)]
+
+
+def test_negative_border_by_definition():
+    # Every itemset outside the collection whose proper subsets are all in it
+    basket = sales_basket()
+    dense = basket.matrix.toarray()
+    frequent = [
+        itemset for size in (1, 2, 3) for itemset in combinations(range(basket.shape[1]), size)
+        if dense[:, list(itemset)].all(axis=1).mean() >= 0.06
+    ]
+    present = set(frequent)
+    expected = [
+        itemset for size in (1, 2, 3, 4) for itemset in combinations(range(basket.shape[1]), size)
+        if itemset not in present and all(subset in present for subset in combinations(itemset, size - 1) if subset)
+    ]
+    assert sorted(negative_border(frequent, basket.shape[1])) == sorted(expected)
+
+
+def test_counts_in_chunks():
+    basket = sales_basket()
+    dense = basket.matrix.toarray()
+    itemsets = [(0,), (1, 4), (2, 3, 5), (0, 7), (6,), (1, 2, 3, 4)]
+    chunks = basket.row_chunks
+    basket.row_chunks = lambda: chunks(11)
+    expected = [int(dense[:, list(itemset)].all(axis=1).sum()) for itemset in itemsets]
+    assert list(count_in_chunks(basket, itemsets)) == expected
+
+
+def test_sample_is_reproducible():
+    basket = sales_basket()
+    sample = sample_basket(basket, 0.2, seed=3)
+    assert sample.n_transactions == 30
+    assert list(sample_basket(basket, 0.2, seed=3).transactions) == list(sample.transactions)
+    rows = np.searchsorted(basket.transactions, sample.transactions)
+    assert (sample.matrix != basket.matrix[rows]).nnz == 0
+    assert sample_basket(basket, 1.0).n_transactions == basket.n_transactions
+
+
+def test_intervals_hold_the_estimate():
+    rules = [{"support": 0.1, "confidence": 0.5, "lift": 2.0}, {"support": 0.02, "confidence": 1.0, "lift": 4.0}]
+    add_intervals(rules, 100, 0.1)
+    for rule in rules:
+        for metric in ("support", "confidence", "lift"):
+            low, high = rule[f"{metric}_ci"]
+            assert low <= rule[metric] <= high
+    # Rules from every bill are exact
+    exact = [{"support": 0.1, "confidence": 0.5, "lift": 2.0}]
+    add_intervals(exact, 100, 1.0)
+    assert exact[0]["support_ci"] == [0.1, 0.1] and exact[0]["lift_ci"] == pytest.approx([2.0, 2.0])
+
+
+@pytest.mark.parametrize("fraction", [0.2, 0.5])
+def test_verified_sample_finds_the_exact_rules(tmp_path, monkeypatch, fraction):
+    monkeypatch.setattr(ingest, "CACHE_DIR", tmp_path / "cache")
+    basket = sales_basket()
+    dense = basket.matrix.toarray()
+    rows = [(bill, item) for bill, row in zip(basket.transactions, dense) for item in basket.decode(np.flatnonzero(row))]
+    path = tmp_path / "sales.csv"
+    pd.DataFrame(rows, columns=["BILLNO", "ITEMNAME"]).to_csv(path, index=False)
+    kwargs = {
+        "path": str(path), "sheet_name": ingest.CSV_SHEET_NAME, "transaction_column": "BILLNO", "item_column": "ITEMNAME",
+        "min_support": 0.06, "min_confidence": 0.2, "max_rules": 20, "algorithm": "eclat",
+    }
+    result = mine_sample(sample_fraction=fraction, verify=True, **kwargs)
+    assert result["sample"]["verified"]
+    exact = mine_sheet(**kwargs)["rules"].to_list()
+    assert [{key: rule[key] for key in exact[0]} for rule in result["rules"]] == exact
+    assert all(rule["support_ci"] == [rule["support"]] * 2 for rule in result["rules"])
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+from basket import encode_basket
+from mining import mine_segment, mine_segments
+from segments import segment_digest, segment_labels, split_basket
+
+
+def sales(seed=6, count=90):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for bill in range(count):
+        region = rng.choice(["NORTH", "SOUTH", "WEST"])
+        for item in rng.choice([f"ITEM {i}" for i in range(10)], size=int(rng.integers(1, 5)), replace=False):
+            rows.append({"BILLNO": f"B{bill:04d}", "ITEMNAME": item, "REGION": region})
+    return pd.DataFrame(rows)
+
+
+def assert_same_basket(actual, expected):
+    np.testing.assert_array_equal(actual.matrix.toarray(), expected.matrix.toarray())
+    assert list(actual.transactions) == list(expected.transactions)
+    assert list(actual.items) == list(expected.items)
+    assert actual.decode(actual.first_seen) == expected.decode(expected.first_seen)
+
+
+def test_segments_match_encoding_each_segment():
+    df = sales()
+    basket = encode_basket(df, "BILLNO", "ITEMNAME")
+    segments = dict(split_basket(df, basket, "BILLNO", "ITEMNAME", "REGION"))
+    assert sorted(segments) == ["NORTH", "SOUTH", "WEST"]
+    for region, sub in segments.items():
+        assert_same_basket(sub, encode_basket(df[df["REGION"] == region], "BILLNO", "ITEMNAME"))
+
+
+def test_bills_belong_to_the_segment_of_their_first_row():
+    df = pd.DataFrame({
+        "BILLNO": [1, 1, 2, 3, 3, 4],
+        "ITEMNAME": ["a", "b", "c", "a", "c", "b"],
+        "REGION": ["N", "S", "S", None, "N", "N"],
+    })
+    basket = encode_basket(df, "BILLNO", "ITEMNAME")
+    segments = dict(split_basket(df, basket, "BILLNO", "ITEMNAME", "REGION"))
+    # Bill 1 is split over two regions and bill 3 starts without one
+    assert list(segments["N"].transactions) == [1, 4]
+    assert list(segments["S"].transactions) == [2]
+    assert segments["N"].decode(segments["N"].first_seen) == ["a", "b"]
+
+
+def test_segment_labels():
+    dates = pd.Series(pd.to_datetime(["2024-04-03", "2024-05-30", None]))
+    assert list(segment_labels(dates)[:2]) == ["2024-04", "2024-05"]
+    assert pd.isna(segment_labels(dates)[2])
+    assert list(segment_labels(dates, "Q")[:2]) == ["2024Q2", "2024Q2"]
+    # Text dates (as read from a CSV) only with a period; other columns by value
+    text = pd.Series(["2024-04-03", "2024-05-30"])
+    assert list(segment_labels(text)) == ["2024-04-03", "2024-05-30"]
+    assert list(segment_labels(text, "M")) == ["2024-04", "2024-05"]
+
+
+def test_digest_changes_only_with_the_segment():
+    df = sales()
+    before = {segment: segment_digest(sub) for segment, sub in split_basket(df, encode_basket(df, "BILLNO", "ITEMNAME"), "BILLNO", "ITEMNAME", "REGION")}
+    # A new bill in the south, with an item no other bill has
+    edited = pd.concat([df, pd.DataFrame({"BILLNO": ["Z0001"], "ITEMNAME": ["NEW ITEM"], "REGION": ["SOUTH"]})], ignore_index=True)
+    after = {segment: segment_digest(sub) for segment, sub in split_basket(edited, encode_basket(edited, "BILLNO", "ITEMNAME"), "BILLNO", "ITEMNAME", "REGION")}
+    assert after["NORTH"] == before["NORTH"] and after["WEST"] == before["WEST"]
+    assert after["SOUTH"] != before["SOUTH"]
+
+
+@pytest.fixture
+def sheet(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "CACHE_DIR", tmp_path / "cache")
+    path = tmp_path / "sales.csv"
+    sales().to_csv(path, index=False)
+    return str(path)
+
+
+def segments_kwargs(path):
+    return {
+        "path": path, "sheet_name": ingest.CSV_SHEET_NAME, "transaction_column": "BILLNO", "item_column": "ITEMNAME",
+        "segment_by": "REGION", "min_support": 0.05, "min_confidence": 0.2, "max_rules": 0, "algorithm": "eclat",
+    }
+
+
+def test_mined_segments_and_known_digests(sheet):
+    df = sales()
+    result = mine_segments(**segments_kwargs(sheet))
+    assert [entry["segment"] for entry in result["segments"]] == ["NORTH", "SOUTH", "WEST"]
+    for entry in result["segments"]:
+        basket = encode_basket(df[df["REGION"] == entry["segment"]], "BILLNO", "ITEMNAME")
+        assert entry["digest"] == segment_digest(basket)
+        assert entry["result"] == mine_segment(basket, 0.05, 0.2, 0, algorithm="eclat")
+
+    # Segments already mined with these parameters are not mined again
+    known = [result["segments"][1]["digest"]]
+    again = mine_segments(known=known, **segments_kwargs(sheet))
+    assert [entry["result"] is None for entry in again["segments"]] == [False, True, False]
+    assert again["segments"][0] == result["segments"][0]
+    (stage,) = [entry for entry in again["timings"] if entry["stage"] == "mine"]
+    assert stage["segments"] == 2
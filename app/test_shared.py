@@ -0,0 +1,103 @@
+import time
+
+import numpy as np
+import pytest
+
+import ingest
+import shared
+from jobs import JobManager, JobStore, report_progress
+from recommend import RecommendationIndex
+from rule_table import RuleTable
+from shared import SharedIndexRegistry, key_digest, read_snapshot, shared_root, write_snapshot
+
+ITEMS = np.array(["Tea", "sugar", "Milk"], dtype=object)
+
+
+def index(lift=3.0):
+    table = RuleTable(np.array([0, 2]), [[1], [0]], np.array([0.1, 0.05]), np.array([0.5, 0.4]), np.array([lift, 1.5]))
+    return RecommendationIndex(table, ITEMS, source={"sheet_name": "Sheet1"})
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "CACHE_DIR", tmp_path / "cache")
+    return tmp_path / "cache"
+
+
+def test_snapshot_round_trip(cache):
+    key = ("sha", "Sheet1")
+    version = write_snapshot(key, index())
+    found_version, found_key, attached = read_snapshot(key_digest(key))
+    assert found_version == version and found_key == key
+    assert attached.recommend("Tea", k=0) == index().recommend("Tea", k=0)
+    assert attached.source == {"sheet_name": "Sheet1"}
+    assert read_snapshot(key_digest(("other", "Sheet1"))) is None
+
+
+def test_old_versions_are_pruned(cache, monkeypatch):
+    monkeypatch.setattr(shared, "SHARED_KEEP_VERSIONS", 1)
+    key = ("sha", "Sheet1")
+    versions = [write_snapshot(key, index(lift)) for lift in (2.0, 3.0, 4.0)]
+    root = shared_root() / key_digest(key)
+    assert sorted(path.name for path in root.iterdir() if path.is_dir() and not path.is_symlink()) == versions[1:]
+    assert read_snapshot(key_digest(key))[0] == versions[-1]
+
+
+def test_registries_of_two_processes(cache):
+    # Each registry stands for a server process; they share only the directory
+    publisher, reader = SharedIndexRegistry(), SharedIndexRegistry()
+    key = ("sha", "Sheet1")
+    assert reader.get(key) is None and reader.latest() is None
+
+    publisher.publish(key, index(2.0))
+    assert reader.get(key).recommend("Tea", k=1)[0]["lift"] == 2.0
+    # A newer version published elsewhere is picked up on the next lookup
+    publisher.publish(key, index(5.0))
+    assert reader.get(key).recommend("Tea", k=1)[0]["lift"] == 5.0
+    assert reader.latest().recommend("Tea", k=1)[0]["lift"] == 5.0
+    assert publisher.get(key).recommend("Tea", k=1)[0]["lift"] == 5.0
+
+
+def mine(rows, progress=None):
+    if progress:
+        progress("counting", 0.5)
+    return {"rules": [{"antecedents": ["Tea"], "consequents": ["sugar"]}] * rows, "index": index(), "itemsets": "local only"}
+
+
+def finished(manager, job_id):
+    # The state is saved by the done callback, which may run after result() returns
+    deadline = time.monotonic() + 30
+    while not (manager.get(job_id) and manager.get(job_id).finished) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return manager.get(job_id)
+
+
+def test_jobs_are_answered_by_every_process(tmp_path):
+    store = tmp_path / "jobs"
+    runner, other = JobManager(workers=1), JobManager(workers=1)
+    runner.share(JobStore(store))
+    other.share(JobStore(store))
+    try:
+        job, _ = runner.submit("key", mine, 3, progress=report_progress, in_process=True)
+        seen = finished(other, job.id)
+        failed, _ = runner.submit("bad", mine, "three", in_process=True)
+        seen_failed = finished(other, failed.id)
+    finally:
+        runner.shutdown()
+
+    assert seen.status == "done" and seen.future is None
+    assert seen.to_dict()["progress"] == 1.0
+    # The index and itemsets stay with the process that ran the job
+    assert seen.result == {"rules": mine(3)["rules"]}
+    assert other.get("0" * 32) is None and other.get("../jobs") is None
+    assert seen_failed.status == "failed" and "TypeError" in seen_failed.error
+
+
+def test_forgotten_jobs_are_removed_from_the_store(tmp_path):
+    manager = JobManager(workers=1, history=1)
+    manager.share(JobStore(tmp_path / "jobs"))
+    first = manager.completed("first", {"rules": []})
+    second = manager.completed("second", {"rules": []})
+    manager.completed("third", {"rules": []})
+    assert manager.get(first.id) is None and manager.get(second.id) is None
+    assert sorted(path.suffix for path in (tmp_path / "jobs").iterdir()) == [".json", ".pkl"]
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from basket import encode_basket
+from cooccurrence import CoOccurrence
+from similarity import SimilarityIndex, pair_blocks
+
+
+def sales_basket(seed=2, count=100):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for bill in range(count):
+        for item in rng.choice(12, size=int(rng.integers(1, 5)), replace=False):
+            rows.append({"BILLNO": bill, "ITEMNAME": f"ITEM {item:02d}"})
+    # An item sold once, alone: it has no neighbours
+    rows.append({"BILLNO": count, "ITEMNAME": "LONE ITEM"})
+    return encode_basket(pd.DataFrame(rows), "BILLNO", "ITEMNAME")
+
+
+def expected_neighbors(basket, item, metric):
+    # Neighbours by brute force, with the index's order: best score, then more
+    # bills together, then the lower item id
+    dense = basket.matrix.toarray().astype(np.int64)
+    counts = dense.T @ dense
+    found = []
+    for other in range(basket.shape[1]):
+        both = counts[item, other]
+        if other == item or both == 0:
+            continue
+        if metric == "cosine":
+            score = both / np.sqrt(counts[item, item] * counts[other, other])
+        else:
+            score = both / (counts[item, item] + counts[other, other] - both)
+        found.append((-score, -both, other))
+    return [(other, float(-score), int(-both)) for score, both, other in sorted(found)]
+
+
+def test_pair_blocks_are_the_pair_counts():
+    basket = sales_basket()
+    X = basket.matrix.astype(np.int32)
+    blocks = list(pair_blocks(basket, block_items=5))
+    assert [start for start, _ in blocks] == [0, 5, 10]
+    np.testing.assert_array_equal(np.vstack([block.toarray() for _, block in blocks]), (X.T @ X).toarray())
+
+
+@pytest.mark.parametrize("metric", ["cosine", "jaccard"])
+def test_neighbors_match_brute_force(metric):
+    basket = sales_basket()
+    index = SimilarityIndex(basket, neighbors=4, block_items=5)
+    for item, name in enumerate(basket.items):
+        expected = expected_neighbors(basket, item, metric)
+        similar = index.similar(name, k=0, metric=metric)
+        assert [entry["item"] for entry in similar] == [basket.items[other] for other, _, _ in expected[:4]]
+        assert [entry["co_occurrences"] for entry in similar] == [both for _, _, both in expected[:4]]
+        assert [entry["score"] for entry in similar] == pytest.approx([score for _, score, _ in expected[:4]], rel=1e-6)
+        assert index.similar(name, k=2, metric=metric) == similar[:2]
+
+
+def test_pair_counts_from_the_backfill_give_the_same_index():
+    basket = sales_basket()
+    counted = SimilarityIndex(basket, neighbors=5)
+    reused = SimilarityIndex(basket, cooccurrence=CoOccurrence(basket), neighbors=5)
+    for name in basket.items:
+        for metric in ("cosine", "jaccard"):
+            assert reused.similar(name, k=0, metric=metric) == counted.similar(name, k=0, metric=metric)
+
+
+def test_lookup_and_arrays():
+    basket = sales_basket()
+    index = SimilarityIndex(basket, neighbors=3)
+    assert "LONE ITEM" in index and index.similar("LONE ITEM") == []
+    assert "NOT SOLD" not in index and index.similar("NOT SOLD") == []
+    with pytest.raises(ValueError):
+        index.similar("ITEM 01", metric="pearson")
+    attached = SimilarityIndex.from_arrays(basket.items, index.arrays(), index.meta())
+    assert attached.similar("ITEM 01", k=0, metric="jaccard") == index.similar("ITEM 01", k=0, metric="jaccard")
+    assert attached.describe() == index.describe() and len(attached) == basket.shape[1]
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+from basket import encode_basket
+from engines import frequent_itemsets
+from mining import build_rules, mine_sheet, mine_sweep
+
+SUPPORTS = [0.1, 0.04, 0.06]
+CONFIDENCES = [0.5, 0.2]
+
+
+def bills(count=80, seed=5):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for bill in range(count):
+        for item in rng.choice(list("ABCDEFGHIJ"), size=int(rng.integers(1, 5)), replace=False):
+            rows.append({"BILLNO": f"B{bill:04d}", "ITEMNAME": item})
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def sheet(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "CACHE_DIR", tmp_path / "cache")
+    path = tmp_path / "sales.csv"
+    bills().to_csv(path, index=False)
+    return str(path)
+
+
+def sweep_kwargs(path, max_rules=0, top_k=0):
+    return {
+        "path": path, "sheet_name": ingest.CSV_SHEET_NAME, "transaction_column": "BILLNO", "item_column": "ITEMNAME",
+        "max_rules": max_rules, "algorithm": "eclat", "top_k": top_k,
+    }
+
+
+@pytest.mark.parametrize("max_rules,top_k", [(0, 0), (5, 0), (0, 2)])
+def test_cells_match_mine_sheet(sheet, max_rules, top_k):
+    result = mine_sweep(supports=SUPPORTS, confidences=CONFIDENCES, **sweep_kwargs(sheet, max_rules, top_k))
+    assert result["mined_support"] == min(SUPPORTS)
+    assert [(cell["min_support"], cell["min_confidence"]) for cell in result["cells"]] == [
+        (support, confidence) for support in sorted(SUPPORTS) for confidence in sorted(CONFIDENCES)
+    ]
+
+    basket = encode_basket(bills(), "BILLNO", "ITEMNAME")
+    for cell in result["cells"]:
+        expected = mine_sheet(min_support=cell["min_support"], min_confidence=cell["min_confidence"], **sweep_kwargs(sheet, max_rules, top_k))
+        assert cell["rules"] == expected["rules"]
+        itemsets = frequent_itemsets(basket, cell["min_support"], algorithm="eclat")
+        table = build_rules(basket, itemsets, cell["min_confidence"], basket.first_seen, top_k=top_k)
+        assert cell["itemsets"] == len(itemsets)
+        assert cell["rule_count"] == len(table)
+        assert cell["products"] == len(np.unique(table.antecedent))
+
+
+def test_itemsets_mined_once_and_reused(sheet):
+    first = mine_sweep(supports=SUPPORTS, confidences=CONFIDENCES, **sweep_kwargs(sheet))
+    itemsets = first["itemsets"]
+    assert itemsets is not None and itemsets["support"].min() >= min(SUPPORTS)
+
+    # Itemsets mined earlier at a lower support answer the whole grid again
+    again = mine_sweep(supports=SUPPORTS, confidences=CONFIDENCES, itemsets=itemsets, **sweep_kwargs(sheet))
+    assert again["itemsets"] is None
+    assert again["cells"] == first["cells"]
+    (stage,) = [entry for entry in again["timings"] if entry["stage"] == "frequent_itemsets"]
+    assert stage["desc"] == "reused"
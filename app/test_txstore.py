@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+import mining
+import txstore
+from basket import encode_basket
+from cooccurrence import count_pairs
+from mining import incremental_state, load_transactions, mine_delta, mine_sheet, mine_sweep
+from similarity import pair_blocks
+from txstore import open_pair_counts, open_store
+
+
+def bills(count=120, seed=9):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for bill in rng.permutation(count):
+        for item in rng.choice([f"ITEM {i:02d}" for i in range(14)], size=int(rng.integers(1, 6)), replace=False):
+            rows.append({"BILLNO": int(bill) + 1000, "ITEMNAME": item})
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def sheet(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "CACHE_DIR", tmp_path / "cache")
+    # Small steps, so the store is built from several chunks and sorting passes
+    monkeypatch.setattr(txstore, "STORE_CHUNK_ROWS", 64)
+    monkeypatch.setattr(txstore, "STORE_BUCKET_LINES", 100)
+    path = tmp_path / "sales.csv"
+    bills().to_csv(path, index=False)
+    return str(path)
+
+
+def sheet_kwargs(path):
+    return {"path": path, "sheet_name": ingest.CSV_SHEET_NAME, "transaction_column": "BILLNO", "item_column": "ITEMNAME"}
+
+
+def test_store_basket_equals_memory_basket(sheet):
+    stored = open_store(sheet, ingest.CSV_SHEET_NAME, "BILLNO", "ITEMNAME")
+    memory = encode_basket(load_transactions(**sheet_kwargs(sheet)), "BILLNO", "ITEMNAME")
+    assert stored.shape == memory.shape
+    assert (stored.matrix != memory.matrix).nnz == 0
+    assert list(stored.transactions) == list(memory.transactions)
+    assert list(stored.items) == list(memory.items)
+    np.testing.assert_array_equal(stored.first_seen, memory.first_seen)
+
+    expected = count_pairs(memory).toarray()
+    np.testing.assert_array_equal(open_pair_counts(basket=stored, **sheet_kwargs(sheet)).toarray(), expected)
+    # Item similarity counts pairs a chunk of bills at a time, without transposing the store
+    chunks = stored.row_chunks
+    stored.row_chunks = lambda: chunks(17)
+    blocks = [block.toarray() for _, block in pair_blocks(stored, block_items=5)]
+    np.testing.assert_array_equal(np.vstack(blocks), expected)
+
+
+def test_mining_from_the_store_matches_memory(sheet, monkeypatch):
+    thresholds = {"min_support": 0.05, "min_confidence": 0.2, "max_rules": 0, "algorithm": "eclat"}
+    sweep = {"supports": [0.05, 0.1], "confidences": [0.2], "max_rules": 0, "algorithm": "eclat"}
+    memory = mine_sheet(**thresholds, **sheet_kwargs(sheet))
+    memory_sweep = mine_sweep(**sweep, **sheet_kwargs(sheet))
+
+    monkeypatch.setattr(mining, "SHARED_DATASETS", True)
+    stored = mine_sheet(**thresholds, **sheet_kwargs(sheet))
+    assert [entry.get("desc") for entry in stored["timings"] if entry["stage"] == "read"] == ["shared transaction store"]
+    assert stored["rules"] == memory["rules"]
+    assert stored["index"].recommend("ITEM 03", k=0) == memory["index"].recommend("ITEM 03", k=0)
+    assert stored["index"].similar("ITEM 03", k=0) == memory["index"].similar("ITEM 03", k=0)
+    assert mine_sweep(**sweep, **sheet_kwargs(sheet))["cells"] == memory_sweep["cells"]
+
+
+def test_incremental_state_from_the_store(sheet, monkeypatch):
+    delta = pd.DataFrame({"BILLNO": [1000, 5000, 5000], "ITEMNAME": ["NEW ITEM", "ITEM 01", "NEW ITEM"]})
+    memory = incremental_state(min_support=0.05, **sheet_kwargs(sheet))
+    monkeypatch.setattr(mining, "SHARED_DATASETS", True)
+    stored = incremental_state(min_support=0.05, **sheet_kwargs(sheet))
+    assert stored.itemsets == memory.itemsets
+    # The state updates its own copy of the read-only store
+    expected = mine_delta(memory, delta, ingest.CSV_SHEET_NAME, 0.2, 0)
+    assert mine_delta(stored, delta, ingest.CSV_SHEET_NAME, 0.2, 0)["rules"] == expected["rules"]
+    assert (stored.pair_counts != memory.pair_counts).nnz == 0
@@ -0,0 +1,248 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from basket import Basket
+from cooccurrence import count_pairs
+from datasets import SHARED_DATASETS
+from ingest import open_column, sheet_meta
+
+logger = logging.getLogger(__name__)
+
+# Sheets with at least this many rows are mined from the on-disk transaction
+# store instead of an in-memory basket (0 = never)
+OUT_OF_CORE_MIN_ROWS = int(os.environ.get("OUT_OF_CORE_MIN_ROWS", "5000000"))
+# Rows of the column cache read per step while the store is built
+STORE_CHUNK_ROWS = int(os.environ.get("STORE_CHUNK_ROWS", str(1 << 20)))
+# Bill lines sorted in memory at once; larger sheets are built in several passes
+STORE_BUCKET_LINES = int(os.environ.get("STORE_BUCKET_LINES", "20000000"))
+STORE_VERSION = 1
+STORE_KINDS = ("category", "numeric")
+
+_build_lock = threading.Lock()
+
+
+class _Labels:
+    # Turns the stored values of one cached column into the ids encode_basket
+    # gives: positions of the labels in sorted order, over the labels in use
+    def __init__(self, values: np.ndarray, column: Dict[str, Any], categories: Optional[List[Any]]):
+        self.values = values
+        self.kind = column["kind"]
+        self.categories = categories
+        if self.kind == "category":
+            self._seen = np.zeros(len(categories), dtype=bool)
+        else:
+            self._uniques: List[np.ndarray] = []
+
+    def valid(self, block: np.ndarray) -> np.ndarray:
+        if self.kind == "category":
+            return block >= 0
+        if block.dtype.kind == "f":
+            return ~np.isnan(block)
+        return np.ones(len(block), dtype=bool)
+
+    def observe(self, block: np.ndarray) -> None:
+        if self.kind == "category":
+            self._seen[block] = True
+        elif len(block):
+            self._uniques.append(np.unique(block))
+
+    def finish(self) -> None:
+        if self.kind == "category":
+            # As basket.factorize does for a categorical column
+            used = np.flatnonzero(self._seen)
+            positions, labels = pd.factorize(pd.Index(self.categories, dtype=object)[used], sort=True)
+            self._remap = np.full(len(self.categories), -1, dtype=np.int64)
+            self._remap[used] = positions
+            self.labels = list(labels)
+        else:
+            self._sorted = np.unique(np.concatenate(self._uniques)) if self._uniques else np.empty(0, dtype=self.values.dtype)
+            self.labels = self._sorted.tolist()
+
+    def ids(self, block: np.ndarray) -> np.ndarray:
+        if self.kind == "category":
+            return self._remap[block]
+        return np.searchsorted(self._sorted, block).astype(np.int64)
+
+
+def _write_json(path: Path, payload: Any) -> None:
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh, default=lambda value: value.item() if isinstance(value, np.generic) else str(value))
+
+
+def _read_json(path: Path) -> Optional[Any]:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def store_directory(meta: Dict[str, Any], transaction_column: Any, item_column: Any) -> Path:
+    names = [column["name"] for column in meta["columns"]]
+    return Path(meta["directory"]) / f"store-{names.index(transaction_column)}-{names.index(item_column)}"
+
+
+def store_supported(path: str, sheet_name: str, transaction_column: Any, item_column: Any) -> bool:
+    # Whether the store can encode the bill and item columns
+    kinds = {column["name"]: column["kind"] for column in sheet_meta(path, sheet_name)["columns"]}
+    return kinds.get(transaction_column) in STORE_KINDS and kinds.get(item_column) in STORE_KINDS
+
+
+def use_transaction_store(path: str, sheet_name: str, transaction_column: Any, item_column: Any) -> bool:
+    # Large sheets whose bill and item columns the store can encode
+    if OUT_OF_CORE_MIN_ROWS <= 0:
+        return False
+    if sheet_meta(path, sheet_name)["rows"] < OUT_OF_CORE_MIN_ROWS:
+        return False
+    return store_supported(path, sheet_name, transaction_column, item_column)
+
+
+def _build_store(meta: Dict[str, Any], transaction_column: Any, item_column: Any, destination: Path) -> Dict[str, Any]:
+    # The bill x item matrix of a sheet as CSR arrays on disk, streamed from the
+    # column cache STORE_CHUNK_ROWS rows at a time. Bills are laid out in
+    # buckets of at most STORE_BUCKET_LINES lines, each sorted in memory on its
+    # own, so building never holds the whole sheet.
+    bills = _Labels(*open_column(meta, transaction_column))
+    items = _Labels(*open_column(meta, item_column))
+    rows = meta["rows"]
+
+    def blocks() -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        # Rows with both a bill and an item, as (bill values, item values, row numbers)
+        for start in range(0, rows, STORE_CHUNK_ROWS):
+            t = np.asarray(bills.values[start:start + STORE_CHUNK_ROWS])
+            i = np.asarray(items.values[start:start + STORE_CHUNK_ROWS])
+            valid = bills.valid(t) & items.valid(i)
+            yield t[valid], i[valid], np.flatnonzero(valid) + start
+
+    # Pass 1: the bills and items in use
+    for t, i, _ in blocks():
+        bills.observe(t)
+        items.observe(i)
+    bills.finish()
+    items.finish()
+    n_tx, n_items = len(bills.labels), len(items.labels)
+
+    # Pass 2: lines per bill, and the first row of every item (for first_seen)
+    lines = np.zeros(n_tx, dtype=np.int64)
+    first_row = np.full(n_items, np.iinfo(np.int64).max, dtype=np.int64)
+    for t, i, positions in blocks():
+        lines += np.bincount(bills.ids(t), minlength=n_tx)
+        ids, first = np.unique(items.ids(i), return_index=True)
+        first_row[ids] = np.minimum(first_row[ids], positions[first])
+    first_seen = np.argsort(first_row, kind="stable").astype(np.int32)
+
+    cumulative = np.cumsum(lines)
+    edges = [0]
+    while edges[-1] < n_tx:
+        done = int(cumulative[edges[-1] - 1]) if edges[-1] else 0
+        end = int(np.searchsorted(cumulative, done + STORE_BUCKET_LINES, side="right"))
+        edges.append(max(end, edges[-1] + 1))
+    # Lines bound the number of (bill, item) cells
+    total_lines = int(cumulative[-1]) if n_tx else 0
+    index_dtype = np.dtype(np.int32) if max(total_lines, n_items) < np.iinfo(np.int32).max else np.dtype(np.int64)
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".building-", dir=destination.parent))
+    try:
+        # Pass 3, once per bucket: the bucket's distinct (bill, item) cells in order
+        indptr = np.zeros(n_tx + 1, dtype=np.int64)
+        nnz = 0
+        with open(staging / "indices.bin", "wb") as fh:
+            for low, high in zip(edges[:-1], edges[1:]):
+                keys = []
+                for t, i, _ in blocks():
+                    t = bills.ids(t)
+                    selected = (t >= low) & (t < high)
+                    keys.append((t[selected] - low) * n_items + items.ids(i[selected]))
+                cells = np.unique(np.concatenate(keys)) if keys else np.empty(0, dtype=np.int64)
+                indptr[low + 1:high + 1] = np.bincount(cells // n_items, minlength=high - low)
+                fh.write((cells % n_items).astype(index_dtype).tobytes())
+                nnz += len(cells)
+        np.cumsum(indptr, out=indptr)
+        np.save(staging / "indptr.npy", indptr.astype(index_dtype))
+        np.save(staging / "first_seen.npy", first_seen)
+        with open(staging / "data.bin", "wb") as fh:
+            for start in range(0, nnz, STORE_CHUNK_ROWS):
+                fh.write(np.ones(min(STORE_CHUNK_ROWS, nnz - start), dtype=bool).tobytes())
+        _write_json(staging / "items.json", items.labels)
+        _write_json(staging / "transactions.json", bills.labels)
+        info = {"version": STORE_VERSION, "transactions": n_tx, "items": n_items, "nnz": nnz, "index_dtype": index_dtype.name}
+        _write_json(staging / "store.json", info)
+        # Published atomically, as the column cache is
+        try:
+            os.replace(staging, destination)
+        except OSError:
+            if not (destination / "store.json").exists():
+                raise
+            shutil.rmtree(staging, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    logger.info(f"Built transaction store ({n_tx} bills, {n_items} items, {nnz} cells in {len(edges) - 1} passes) at {destination}")
+    return info
+
+
+def _mapped(path: Path, dtype: np.dtype, length: int) -> np.ndarray:
+    # np.memmap cannot map an empty file
+    if length == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(length,))
+
+
+def open_store(path: str, sheet_name: str, transaction_column: Any, item_column: Any) -> Basket:
+    # The sheet's basket backed by the memory-mapped store (built on first use).
+    # Only the labels are loaded; the matrix pages in from disk as it is read.
+    meta = sheet_meta(path, sheet_name)
+    directory = store_directory(meta, transaction_column, item_column)
+    info = _read_json(directory / "store.json")
+    if info is None or info.get("version") != STORE_VERSION:
+        with _build_lock:
+            info = _read_json(directory / "store.json")
+            if info is None or info.get("version") != STORE_VERSION:
+                shutil.rmtree(directory, ignore_errors=True)
+                info = _build_store(meta, transaction_column, item_column, directory)
+
+    index_dtype = np.dtype(info["index_dtype"])
+    indptr = np.load(directory / "indptr.npy", mmap_mode="r")
+    indices = _mapped(directory / "indices.bin", index_dtype, info["nnz"])
+    data = _mapped(directory / "data.bin", np.dtype(bool), info["nnz"])
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=(info["transactions"], info["items"]), copy=False)
+    items = np.asarray(_read_json(directory / "items.json"), dtype=object)
+    transactions = np.asarray(_read_json(directory / "transactions.json"), dtype=object)
+    first_seen = np.load(directory / "first_seen.npy")
+    return Basket(matrix, transactions, items, first_seen=first_seen)
+
+
+def open_pair_counts(path: str, sheet_name: str, transaction_column: Any, item_column: Any, basket: Basket) -> sparse.csr_matrix:
+    # X^T X of the store's basket (diagonal included), counted on first use and
+    # kept next to the store, memory-mapped like it
+    directory = store_directory(sheet_meta(path, sheet_name), transaction_column, item_column) / "pairs"
+    if not (directory / "data.npy").exists():
+        counts = count_pairs(basket)
+        staging = Path(tempfile.mkdtemp(prefix=".building-", dir=directory.parent))
+        try:
+            for name in ("indptr", "indices", "data"):
+                np.save(staging / f"{name}.npy", getattr(counts, name))
+            try:
+                os.replace(staging, directory)
+            except OSError:
+                # Another process published the same counts first
+                if not (directory / "data.npy").exists():
+                    raise
+                shutil.rmtree(staging, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        logger.info(f"Stored {counts.nnz} item pair counts at {directory}")
+    arrays = [np.load(directory / f"{name}.npy", mmap_mode="r") for name in ("data", "indices", "indptr")]
+    return sparse.csr_matrix(tuple(arrays), shape=(basket.shape[1], basket.shape[1]), copy=False)